@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+## @package creator_throughput
+#  Container creator throughput benchmark.
+#
+#  Enqueue robots and measure containers per second made by creator with
+#  batches of CREATOR_BATCH tasks and config writer pool against one task
+#  per transaction and one writer (path before batching). Database schema
+#  of given database is DROPPED and made by migrations.
+#
+#  Usage: python bench/creator_throughput.py --db postgresql+psycopg2://... [--count N]
+import os, sys, time, shutil, tempfile, logging, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tigro'))
+
+from sqlalchemy import create_engine
+from multiprocessing.pool import ThreadPool
+import db, creator
+from db import Session, Node, Robot, Container, NewContainer
+from creator import Creator
+from schema import upgrade
+
+## Enqueue creation tasks of new robots
+def enqueue(count, prefix):
+
+    with db.session_scope() as session:
+        robots = [Robot(name = 'robot', anchor = '{0}{1}'.format(prefix, i))
+                    for i in range(count)]
+        session.add_all(robots)
+        session.flush()
+
+        containers = [Container(robot = robot.id) for robot in robots]
+        session.add_all(containers)
+        session.flush()
+
+        session.add_all([NewContainer(link = c.id) for c in containers])
+
+## Measure creation of queued tasks
+#  @return Containers per second.
+def measure(count, prefix, batch, threads):
+
+    creator.CREATOR_BATCH = batch
+    worker = Creator('bench')
+    worker.pool = ThreadPool(threads)
+
+    enqueue(count, prefix)
+
+    started = time.time()
+    worker.drain()
+    elapsed = time.time() - started
+
+    assert worker.stats['created'] == count
+    return count / elapsed
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Container creator benchmark')
+    parser.add_argument('--db', default = os.environ.get('TIGRO_TEST_DB'),
+                        help = 'database connection string, schema is dropped')
+    parser.add_argument('--count', type = int, default = 500,
+                        help = 'count of containers')
+    args = parser.parse_args()
+
+    if not args.db:
+        parser.error('database connection string is required')
+
+    logging.basicConfig(level = logging.WARNING)
+
+    # Make empty database
+    engine = create_engine(args.db)
+    engine.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+    upgrade(engine)
+    db._engine = engine
+    Session.configure(bind = engine)
+
+    with db.session_scope() as session:
+        session.add(Node(name = 'bench', address = '127.0.0.1'))
+
+    # Write configs to temporary directory
+    creator.LXC_DIR = tempfile.mkdtemp(prefix = 'tigro-bench-')
+    Creator._template = 'lxc.utsname = {anchor}\nlxc.network.ipv4 = {address}/16\n'
+
+    batch = creator.CREATOR_BATCH
+    try:
+        single = measure(args.count, 'single', 1, 1)
+        batched = measure(args.count, 'batch', batch, creator.CREATOR_IO_THREADS)
+
+    finally:
+        shutil.rmtree(creator.LXC_DIR)
+
+    print('{0:<28} {1:>10.1f} containers/s'.format('one task per transaction', single))
+    print('{0:<28} {1:>10.1f} containers/s'.format(
+            'batch of {0}, {1} writers'.format(batch, creator.CREATOR_IO_THREADS),
+            batched))
+    print('{0:<28} {1:>10.1f}x'.format('speedup', batched / single))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+## @package dictdiffer
+#  Client list difference benchmark.
+#
+#  Measure DictDiffer of 1k, 10k and 50k clients with 1% of changed clients:
+#  full parse (all values are new equal objects), incremental parse (not
+#  changed values are the same objects) and incremental parse with change
+#  hint of parser and leases.
+#
+#  Usage: python bench/dictdiffer.py [--repeat N]
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tigro'))
+
+from parser import ClientEntry
+from dictdiffer import DictDiffer
+
+## Diff fields of connector
+IDENTITY = ('virtual_address', 'real_address', 'since')
+METRICS = ('bytes_sent', 'bytes_received')
+
+## Make client entry
+def client(i, sent = 0):
+    return ClientEntry('robot{0}'.format(i), '172.16.{0}.{1}:1194'.format(*divmod(i, 256)),
+                       '10.8.{0}.{1}'.format(*divmod(i, 256)), 0, sent,
+                       'Thu Jan  1 00:00:00 2026', '1767225600')
+
+## Make past and current client lists
+#  @return Tuple of past list, current list of new objects, current list
+#          with shared objects and hint keys.
+def snapshots(count):
+
+    past = dict(('robot{0}'.format(i), client(i)) for i in range(count))
+    changed = set('robot{0}'.format(i) for i in range(0, count, 100))
+
+    # Full parse makes new objects of all rows
+    fresh = dict(('robot{0}'.format(i), client(i, 1 if 'robot{0}'.format(i) in changed else 0))
+                    for i in range(count))
+
+    # Incremental parse replaces changed rows only
+    shared = dict(past)
+    for key in changed:
+        shared[key] = fresh[key]
+
+    return past, fresh, shared, changed
+
+## Measure diff
+#  @return Milliseconds per diff.
+def measure(current, past, hint, repeat):
+
+    started = time.time()
+    for i in range(repeat):
+        diff = DictDiffer(current, past, identity = IDENTITY, metrics = METRICS, hint = hint)
+    elapsed = (time.time() - started) * 1000 / repeat
+
+    assert len(diff.changed_metrics[1]) == len(current) / 100
+    return elapsed
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Client list difference benchmark')
+    parser.add_argument('--repeat', type = int, default = 20,
+                        help = 'count of diffs of every kind')
+    args = parser.parse_args()
+
+    print('{0:>8} {1:>14} {2:>14} {3:>14}'.format('clients', 'full ms',
+                                                  'shared ms', 'hint ms'))
+    for count in (1000, 10000, 50000):
+        past, fresh, shared, changed = snapshots(count)
+        print('{0:>8} {1:>14.3f} {2:>14.3f} {3:>14.3f}'.format(count,
+                measure(fresh, past, None, args.repeat),
+                measure(shared, past, None, args.repeat),
+                measure(shared, past, changed, args.repeat)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+## @package firewall_backends
+#  Firewall backends benchmark.
+#
+#  Measure time of rendering (and applying with --apply, root only) NAT
+#  changes of iptables and nftables backends for 1k, 5k and 10k robots:
+#  cold start with all robots and one robot connect on top of them. Rules
+#  walked by new connection packets are measured by walking client,
+#  container and WebSocket packets of every robot through chain model of
+#  backend layout, flat layout (all robot rules in PREROUTING) is measured
+#  for comparison. Packets of random sample of robots are walked.
+#
+#  Usage: python bench/firewall_backends.py [--apply] [--count N ...] [--sample N]
+import os, sys, time, random, logging, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tigro'))
+
+from firewall import make_backend
+
+## Make robot description
+def robot(i):
+    return {'robot': i + 1,
+            'anchor': 'robot{0}'.format(i),
+            'vaddress': '10.9.{0}.{1}'.format(i >> 8 & 0xff, i & 0xff),
+            'address': '10.10.{0}.{1}'.format(i >> 8 & 0xff, i & 0xff),
+            'wsport': 7000 + i}
+
+## Measure call time in seconds
+def measure(call, *args):
+
+    started = time.time()
+    call(*args)
+    return time.time() - started
+
+## Packets of robot: client, container and WebSocket connections
+def packets(r):
+    return [{'iif': 'tun0', 'src': r['vaddress'], 'dst': r['address'], 'dport': 22},
+            {'iif': 'veth.' + r['anchor'], 'src': r['address'], 'dst': r['vaddress'],
+             'dport': 22},
+            {'iif': 'eth0', 'src': '192.0.2.1', 'dst': '198.51.100.1', 'dport': r['wsport']}]
+
+## Robot rules as (predicate, target) tuples in backend order
+def robot_rules(r):
+    veth = 'veth.' + r['anchor']
+    return [
+        ('client', (lambda p: p['iif'] == 'tun0' and p['src'] == r['vaddress']
+                                and p['dst'] == r['address'], None)),
+        ('container', (lambda p: p['iif'] == veth and p['src'] == r['address']
+                                and p['dst'] == r['vaddress'], None)),
+        ('container', (lambda p: p['iif'] == veth and p['src'] == r['address']
+                                and p['dport'] == 11311, None)),
+        ('websock', (lambda p: p['dport'] == r['wsport'], None)) ]
+
+## Chain model of iptables backend
+#  @return Dictionary of rule lists by chain name.
+def iptables_chains(backend, robots):
+
+    buckets = backend.buckets
+    chains = {
+        'PREROUTING': [(lambda p: True, 'tigro')],
+        'tigro': [(lambda p: p['iif'] == 'tun0', 'tigro-client'),
+                  (lambda p: p['iif'].startswith('veth.'), 'tigro-veth'),
+                  (lambda p: True, 'tigro-ws')],
+        'tigro-client': [], 'tigro-veth': [], 'tigro-ws': [] }
+
+    for i in range(buckets):
+        chains['tigro-client'].append(
+            (lambda p, i = i: backend._address_bucket(p['src']) == i, 'tigro-c{0}'.format(i)))
+        chains['tigro-veth'].append(
+            (lambda p, i = i: backend._address_bucket(p['src']) == i, 'tigro-v{0}'.format(i)))
+        chains['tigro-ws'].append(
+            (lambda p, i = i: backend._port_bucket(p['dport']) == i, 'tigro-w{0}'.format(i)))
+        for prefix in ('c', 'v', 'w'):
+            chains['tigro-{0}{1}'.format(prefix, i)] = []
+
+    # Robot rules are placed to buckets like IptablesBackend._rules
+    for key in sorted(robots):
+        r = robots[key]
+        chain = {'client': 'tigro-c{0}'.format(backend._address_bucket(r['vaddress'])),
+                 'container': 'tigro-v{0}'.format(backend._address_bucket(r['address'])),
+                 'websock': 'tigro-w{0}'.format(backend._port_bucket(r['wsport']))}
+        for kind, rule in robot_rules(r):
+            chains[chain[kind]].append(rule)
+
+    return chains
+
+## Chain model of flat layout
+def flat_chains(robots):
+
+    rules = []
+    for key in sorted(robots):
+        rules += [rule for kind, rule in robot_rules(robots[key])]
+
+    return {'PREROUTING': rules}
+
+## Chain model of nftables backend, sets are hash lookups
+def nftables_chains(robots):
+
+    clients = set((r['vaddress'], r['address']) for r in robots.values())
+    containers = set(('veth.' + r['anchor'], r['address'], r['vaddress'])
+                        for r in robots.values())
+    masters = set(('veth.' + r['anchor'], r['address']) for r in robots.values())
+    websock = set(r['wsport'] for r in robots.values())
+
+    return {'PREROUTING': [
+        (lambda p: p['iif'] == 'tun0' and (p['src'], p['dst']) in clients, None),
+        (lambda p: (p['iif'], p['src'], p['dst']) in containers, None),
+        (lambda p: p['dport'] == 11311 and (p['iif'], p['src']) in masters, None),
+        (lambda p: p['dport'] in websock, None) ]}
+
+## Walk packet through chains
+#  @return Count of evaluated rules till DNAT.
+def walk(chains, packet, chain = 'PREROUTING'):
+
+    walked = 0
+    for predicate, target in chains[chain]:
+        walked += 1
+        if predicate(packet):
+            if target is None:
+                # DNAT
+                return walked
+            return walked + walk(chains, packet, target)
+
+    return walked
+
+## Walked rules of packets of robots sample
+#  @return Tuple of average and max count of walked rules.
+def walked(chains, sample):
+
+    counts = [walk(chains, packet) for r in sample for packet in packets(r)]
+    return float(sum(counts)) / len(counts), max(counts)
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Firewall backends benchmark')
+    parser.add_argument('--apply', action = 'store_true',
+                        help = 'apply rules to kernel tables (root only)')
+    parser.add_argument('--count', type = int, nargs = '+',
+                        default = [1000, 5000, 10000], help = 'counts of robots')
+    parser.add_argument('--sample', type = int, default = 200,
+                        help = 'count of robots which packets are walked')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.WARNING)
+    log = logging.getLogger('bench')
+
+    print('{0:<10} {1:>7} {2:>12} {3:>12} {4:>12} {5:>17} {6:>17}'.format(
+            'backend', 'robots', 'cold (s)', 'connect (s)', 'delete (s)',
+            'walked avg/max', 'flat avg/max'))
+
+    for name in ('iptables', 'nftables'):
+        for count in args.count:
+            robots = dict((r['anchor'], r) for r in map(robot, range(count)))
+            extra = robot(count)
+            extra = {extra['anchor']: extra}
+
+            backend = make_backend(name, log, dry_run = not args.apply)
+
+            # Measure rules walked by packets
+            sample = random.Random(count).sample(list(robots.values()),
+                                                 min(args.sample, count))
+            if name == 'iptables':
+                chains = iptables_chains(backend, robots)
+            else:
+                chains = nftables_chains(robots)
+            walk_avg, walk_max = walked(chains, sample)
+            flat_avg, flat_max = walked(flat_chains(robots), sample)
+
+            try:
+                backend.setup()
+
+                call = backend.apply if args.apply else backend.render
+                cold = measure(call, robots, {})
+                connect = measure(call, extra, {})
+                delete = measure(call, {}, extra)
+
+            except ImportError as e:
+                # netfilter package is required to render iptables rules
+                cold = connect = delete = float('nan')
+
+            print('{0:<10} {1:>7} {2:>12.4f} {3:>12.6f} {4:>12.6f} {5:>10.1f}/{6:<6} {7:>10.1f}/{8:<6}'
+                    .format(name, count, cold, connect, delete,
+                            walk_avg, walk_max, flat_avg, flat_max))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+## @package lookup_indexes
+#  Lookup indexes benchmark.
+#
+#  Fill tables with 100k robots, containers and connections and measure
+#  per-event time of connector lookups without and with indexes of revision
+#  0002: connection table reset of node, robots resolve by registry with
+#  every record missed, and connection table sync of connect, address change
+#  and disconnect events. Every event is one session transaction as in
+#  connector. Database schema of given database is DROPPED and made by
+#  migrations.
+#
+#  Usage: python bench/lookup_indexes.py --db postgresql+psycopg2://... [--count N]
+import os, sys, time, random, datetime, logging, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tigro'))
+
+from sqlalchemy import create_engine, text
+from collections import namedtuple
+import db
+from db import Session, session_scope
+from connection import ConnectionStatus
+from registry import RobotRegistry
+from schema import upgrade
+
+## Count of nodes of containers and connections
+NODES = 100
+
+## Count of clients of event
+BATCH = 10
+
+## Indexes of revision 0002
+INDEXES = [
+    ('ix_robot_anchor', 'CREATE UNIQUE INDEX ix_robot_anchor ON robot (anchor)'),
+    ('ix_node_name', 'CREATE UNIQUE INDEX ix_node_name ON node (name)'),
+    ('ix_connection_node', 'CREATE INDEX ix_connection_node ON connection (node)'),
+    ('ix_container_node', 'CREATE INDEX ix_container_node ON container (node)'),
+    ('ix_connection_raddress', 'CREATE INDEX ix_connection_raddress ON connection (raddress)'),
+]
+
+## Measured events
+EVENTS = ['connection table reset', 'resolve {0} robots'.format(BATCH),
+          'sync connect', 'sync address change', 'sync disconnect']
+
+## Client of status file
+Peer = namedtuple('Peer', ['connected_since', 'virtual_address', 'real_address',
+                           'bytes_sent', 'bytes_received'])
+
+## Fill tables by server side series
+def fill(connection, count):
+
+    connection.execute(text(
+        "INSERT INTO node (name, address) "
+        "SELECT 'node' || i, '127.0.0.1' FROM generate_series(1, :n) i"), n = NODES)
+    connection.execute(text(
+        "INSERT INTO robot (name, anchor) "
+        "SELECT 'robot', 'robot' || i FROM generate_series(1, :n) i"), n = count)
+    connection.execute(text(
+        "INSERT INTO container (robot, node, address) "
+        "SELECT id, id % :nodes + 1, '10.10.' || id / 256 || '.' || id % 256 FROM robot"),
+        nodes = NODES)
+    connection.execute(text(
+        "INSERT INTO connection (container, node, vaddress, raddress, sent, received) "
+        "SELECT id, node, '10.8.' || id / 256 || '.' || id % 256, "
+        "'172.16.' || id / 256 || '.' || id % 256, 0, 0 FROM container"))
+    connection.execute('ANALYZE')
+
+## Measure connector events
+#  @return List of milliseconds per event.
+def measure(count, repeat):
+
+    log = logging.getLogger('bench')
+    random.seed(0)
+    since = datetime.datetime.now()
+    nothing = (({}, {}), ({}, {}))
+
+    # Registry keeps no record, so every anchor is resolved by database
+    registry = RobotRegistry(size = 0)
+
+    times = [0.0] * len(EVENTS)
+    for i in range(repeat):
+        anchors = ['robot{0}'.format(n) for n in random.sample(range(1, count + 1), BATCH)]
+        clients = dict((anchor, Peer(since, '10.9.0.{0}'.format(j + 2),
+                                     '198.51.100.{0}:1194'.format(j + 2), 0, 0))
+                       for j, anchor in enumerate(anchors))
+        moved = dict((anchor, c._replace(real_address = c.real_address + '0'))
+                     for anchor, c in clients.items())
+
+        started = time.time()
+        with session_scope():
+            status = ConnectionStatus(log, 'node1')
+        times[0] += time.time() - started
+
+        started = time.time()
+        with session_scope() as session:
+            robots = registry.resolve(session, anchors)
+        times[1] += time.time() - started
+
+        events = [(clients, {}, nothing),
+                  ({}, {}, ((clients, moved), ({}, {}))),
+                  ({}, moved, nothing)]
+        for n, (added, removed, changed) in enumerate(events, 2):
+            started = time.time()
+            with session_scope():
+                status.sync(added, removed, changed, robots)
+            times[n] += time.time() - started
+
+    return [elapsed * 1000 / repeat for elapsed in times]
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Lookup indexes benchmark')
+    parser.add_argument('--db', default = os.environ.get('TIGRO_TEST_DB'),
+                        help = 'database connection string, schema is dropped')
+    parser.add_argument('--count', type = int, default = 100000,
+                        help = 'count of robots, containers and connections')
+    parser.add_argument('--repeat', type = int, default = 200,
+                        help = 'count of events of every kind')
+    args = parser.parse_args()
+
+    if not args.db:
+        parser.error('database connection string is required')
+
+    logging.basicConfig(level = logging.WARNING)
+
+    # Make filled database
+    engine = create_engine(args.db)
+    engine.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+    upgrade(engine)
+    db._engine = engine
+    Session.configure(bind = engine)
+
+    with engine.connect() as connection:
+        fill(connection, args.count)
+    indexed = measure(args.count, args.repeat)
+
+    for name, create in INDEXES:
+        engine.execute('DROP INDEX {0}'.format(name))
+    engine.execute('ANALYZE')
+    plain = measure(args.count, args.repeat)
+
+    # Restore indexes of schema
+    for name, create in INDEXES:
+        engine.execute(create)
+
+    print('{0:<30} {1:>12} {2:>12} {3:>10}'.format('event', 'no index ms',
+                                                  'index ms', 'speedup'))
+    for name, before, after in zip(EVENTS, plain, indexed):
+        print('{0:<30} {1:>12.3f} {2:>12.3f} {3:>9.1f}x'.format(
+                name, before, after, before / after))
+
+if __name__ == '__main__':
+    main()
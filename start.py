@@ -5,14 +5,27 @@
 #
 #  This script is a part of TIGRO project.
 #  Module contain classes and function for create and control LXC-containers.
-from tigro.hostnode import HostNode
-import logging
+import argparse, logging, time
 
 logging.basicConfig(
         format = u'%(levelname)-8s [%(asctime)s] %(name)-15s > %(message)s',
         level = logging.INFO)#, filename='tigro-lxc.log')
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'TIGRO LXC-container controller')
+    parser.add_argument('--profile-startup', action = 'store_true',
+                        help = 'report time spent per init phase')
+    args = parser.parse_args()
+
+    # Import package after logging is configured
+    started = time.time()
+    from tigro.hostnode import HostNode
+    from tigro.startup import profiler
+    profiler.add('import', time.time() - started)
+
     hn = HostNode()
     hn.start()
     hn.join()
+
+    if args.profile_startup:
+        profiler.report(logging.getLogger('Startup'))
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+## @package conftest
+#  TIGRO tests configuration.
+#
+#  TIGRO modules import each other by module name, so package directory is
+#  placed on import path.
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tigro'))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+## @package test_addresses
+#  Container address allocator tests.
+#
+#  Tables are made in in-memory SQLite database, map row lock is no-op there.
+#  Network 10.20.0.1/28 has 13 free addresses: network, broadcast and
+#  gateway addresses are reserved.
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+import db
+from db import Session, Base, Container, AddressRelease, session_scope
+from addresses import AddressAllocator
+import pytest
+
+## Test network
+NETWORK = '10.20.0.1/28'
+
+## Host addresses of test network
+HOSTS = ['10.20.0.{0}'.format(i) for i in range(2, 15)]
+
+@pytest.fixture
+def allocator(monkeypatch):
+
+    engine = create_engine('sqlite://', poolclass = StaticPool,
+                           connect_args = {'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    Session.configure(bind = engine)
+    monkeypatch.setattr(db, '_engine', engine)
+
+    return AddressAllocator(NETWORK)
+
+def allocate(allocator, count):
+
+    with session_scope() as session:
+        return allocator.allocate(session, count)
+
+def release(allocator, addresses):
+
+    with session_scope() as session:
+        allocator.release(session, addresses)
+
+## Make containers holding addresses
+def hold(addresses):
+
+    with session_scope() as session:
+        for address in addresses:
+            session.add(Container(address = address))
+
+def test_reserved_addresses_skipped(allocator):
+
+    assert sorted(allocate(allocator, 13), key = HOSTS.index) == HOSTS
+
+def test_exhausted(allocator):
+
+    hold(allocate(allocator, 13))
+
+    with pytest.raises(RuntimeError):
+        allocate(allocator, 1)
+
+    # Failed allocation does not change map
+    release(allocator, ['10.20.0.5'])
+    assert allocate(allocator, 1) == ['10.20.0.5']
+
+def test_free_list_fifo(allocator):
+
+    assert allocate(allocator, 5) == HOSTS[:5]
+
+    # Reserved, out of network and repeated addresses are skipped
+    release(allocator, ['10.20.0.4', '10.20.0.2', '10.20.0.4',
+                        '10.20.0.1', '10.20.0.15', '10.30.0.2'])
+
+    assert allocate(allocator, 3) == ['10.20.0.4', '10.20.0.2', HOSTS[5]]
+
+def test_released_by_queue(allocator):
+
+    hold(allocate(allocator, 3))
+
+    with session_scope() as session:
+        session.add(AddressRelease(address = '10.20.0.3'))
+
+    assert allocate(allocator, 2) == ['10.20.0.3', HOSTS[3]]
+
+    with session_scope() as session:
+        assert session.query(AddressRelease).count() == 0
+
+def test_map_built_from_containers(allocator):
+
+    hold(HOSTS[:4])
+
+    assert allocate(allocator, 2) == HOSTS[4:6]
+
+def test_reclaim_skips_live_containers(allocator):
+
+    addresses = allocate(allocator, 13)
+
+    # Containers of three addresses are deleted without release
+    live = addresses[:5] + addresses[8:]
+    hold(live)
+
+    reclaimed = allocate(allocator, 3)
+    assert sorted(reclaimed) == sorted(addresses[5:8])
+    assert not set(reclaimed) & set(live)
+
+    # Live and reclaimed addresses are used
+    hold(reclaimed)
+    with pytest.raises(RuntimeError):
+        allocate(allocator, 1)
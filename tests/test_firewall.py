@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+## @package test_firewall
+#  Firewall changes isolation.
+#
+#  Tables are made in in-memory SQLite database, firewall backend records
+#  transactions and rejects changes of given robots.
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+import db, firewall
+from db import Session, Base, Node, Robot, session_scope
+from firewall import Firewall, FirewallBackend
+from conf import FIREWALL_RETRIES
+import logging
+import pytest
+
+## Backend rejecting changes of robots
+class RejectingBackend(FirewallBackend):
+
+    ## Rejected robot anchors
+    reject = set()
+
+    ## Robot anchors with rules missing in kernel tables
+    gone = set()
+
+    def setup(s):
+        s.transactions = []
+
+    def renderSetup(s):
+        return ''
+
+    def render(s, append, delete):
+        return ''
+
+    def apply(s, append, delete):
+        s.transactions.append((sorted(append), sorted(delete)))
+        return not (s.reject & (set(append) | set(delete)))
+
+    def missing(s, robot):
+        return robot['anchor'] in s.gone
+
+## Robot record of registry
+class Record(object):
+
+    def __init__(s, robot):
+        s.id = robot.id
+        s.anchor = robot.anchor
+        s.address = '10.10.0.{0}'.format(robot.id)
+
+## Client of status file
+class Client(object):
+
+    def __init__(s, vaddress):
+        s.virtual_address = vaddress
+
+@pytest.fixture
+def controller(monkeypatch):
+
+    engine = create_engine('sqlite://', poolclass = StaticPool,
+                           connect_args = {'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    Session.configure(bind = engine)
+    monkeypatch.setattr(db, '_engine', engine)
+    monkeypatch.setitem(firewall.backends, 'rejecting', RejectingBackend)
+    monkeypatch.setattr(RejectingBackend, 'reject', set())
+    monkeypatch.setattr(RejectingBackend, 'gone', set())
+
+    with session_scope() as session:
+        session.add(Node(id = 1, name = 'test'))
+        for i in range(1, 5):
+            session.add(Robot(id = i, anchor = 'robot{0}'.format(i)))
+
+    with session_scope() as session:
+        f = Firewall(logging.getLogger('test'), 1, backend = 'rejecting')
+        robots = dict((r.anchor, Record(r)) for r in session.query(Robot))
+
+    yield f, robots
+
+    Session.remove()
+    engine.dispose()
+
+## Collect and apply changes like firewall stage
+def apply(f, added, removed, robots):
+
+    with session_scope():
+        f.createRules(dict((key, Client('10.8.0.6')) for key in added), robots)
+        f.deleteRules(dict.fromkeys(removed))
+
+    with session_scope():
+        return f.applyRules()
+
+def test_broken_change_isolated(controller):
+    f, robots = controller
+    f.backend.reject.add('robot2')
+
+    # Other robots of failed batch are applied
+    assert not apply(f, ['robot1', 'robot2', 'robot3'], [], robots)
+    assert sorted(f.rules) == ['robot1', 'robot3']
+    assert list(f._append) == ['robot2']
+
+    # Broken change is dropped after retries, its port is released
+    for attempt in range(1, FIREWALL_RETRIES):
+        assert apply(f, [], [], robots) == (attempt == FIREWALL_RETRIES - 1)
+    assert not f.pending()
+    assert 2 not in f.ws_port.ports
+
+    # Next transactions are not blocked
+    del f.backend.transactions[:]
+    assert apply(f, ['robot4'], ['robot1'], robots)
+    assert f.backend.transactions == [(['robot4'], ['robot1'])]
+    assert sorted(f.rules) == ['robot3', 'robot4']
+
+def test_missing_rules_deleted(controller):
+    f, robots = controller
+
+    assert apply(f, ['robot1', 'robot2'], [], robots)
+
+    # Rules of robot1 are flushed outside, its delete fails
+    f.backend.reject.add('robot1')
+    f.backend.gone.add('robot1')
+
+    assert apply(f, [], ['robot1', 'robot2'], robots)
+    assert f.rules == {}
+    assert f.ws_port.ports == {}
+
+def test_retried_batch_not_duplicated(controller):
+    f, robots = controller
+
+    assert apply(f, ['robot1'], [], robots)
+
+    # Stage retries batch with applied robot
+    del f.backend.transactions[:]
+    assert apply(f, ['robot1'], [], robots)
+    assert f.backend.transactions == []
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+## @package test_lifecycle
+#  LXC-container lifecycle executor tests.
+#
+#  Fake lxc-start and lxc-stop scripts are placed on PATH, they write their
+#  arguments to log file and sleep or fail by container name.
+from lifecycle import ContainerExecutor
+import logging, os, stat, time
+import pytest
+
+## Fake lxc command script
+FAKE_LXC = '''#!/bin/sh
+name="$2"
+echo "begin $(basename "$0") $name" >> "$TIGRO_LXC_LOG"
+case "$name" in
+    slow*) sleep 0.5 ;;
+    hang*) sleep 30 ;;
+    bad*) exit 3 ;;
+esac
+echo "end $(basename "$0") $name" >> "$TIGRO_LXC_LOG"
+'''
+
+@pytest.fixture
+def lxc_log(tmpdir, monkeypatch):
+
+    for command in ('lxc-start', 'lxc-stop'):
+        script = tmpdir.join(command)
+        script.write(FAKE_LXC)
+        os.chmod(str(script), stat.S_IRWXU)
+
+    log = tmpdir.join('lxc.log')
+    monkeypatch.setenv('PATH', '{0}{1}{2}'.format(tmpdir, os.pathsep, os.environ['PATH']))
+    monkeypatch.setenv('TIGRO_LXC_LOG', str(log))
+
+    return log
+
+def executor(**kwargs):
+    return ContainerExecutor(logging.getLogger('test'), **kwargs)
+
+def test_commands_run_in_parallel(lxc_log):
+
+    lxc = executor(workers = 8)
+
+    started = time.time()
+    for i in range(8):
+        lxc.start('slow{0}'.format(i))
+    results = lxc.wait()
+    elapsed = time.time() - started
+
+    assert sorted(results) == [('slow{0}'.format(i), 'lxc-start', 0) for i in range(8)]
+    assert elapsed < 4 * 0.5
+
+def test_commands_of_container_run_in_order(lxc_log):
+
+    lxc = executor(workers = 4)
+
+    lxc.start('slow')
+    lxc.stop('slow')
+    lxc.start('slow')
+    lxc.wait()
+
+    lines = [line for line in lxc_log.read().splitlines()]
+    assert lines == ['begin lxc-start slow', 'end lxc-start slow',
+                     'begin lxc-stop slow', 'end lxc-stop slow',
+                     'begin lxc-start slow', 'end lxc-start slow']
+
+def test_failed_command_status(lxc_log):
+
+    lxc = executor(workers = 2)
+
+    lxc.start('bad')
+    lxc.stop('good')
+
+    assert sorted(lxc.wait()) == [('bad', 'lxc-start', 3), ('good', 'lxc-stop', 0)]
+
+def test_command_timeout(lxc_log):
+
+    lxc = executor(workers = 1, timeout = 0.5)
+
+    started = time.time()
+    lxc.start('hang')
+
+    assert lxc.wait() == [('hang', 'lxc-start', None)]
+    assert time.time() - started < 5
+
+def test_missing_command(lxc_log, monkeypatch):
+
+    monkeypatch.setenv('PATH', '/nonexistent')
+    lxc = executor(workers = 1)
+
+    lxc.start('robot')
+
+    assert lxc.wait() == [('robot', 'lxc-start', None)]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+## @package test_parser
+#  Incremental OpenVPN status parser.
+from parser import OpenVPNStatusParser
+from dictdiffer import DictDiffer
+import pytest
+
+## Status file header
+HEADER = [
+    'TITLE\tOpenVPN 2.3.2 x86_64-pc-linux-gnu',
+    'TIME\tThu Jan  1 00:00:00 2026\t1767225600',
+    'HEADER\tCLIENT_LIST\tCommon Name\tReal Address\tVirtual Address\tBytes Received'
+        '\tBytes Sent\tConnected Since\tConnected Since (time_t)',
+    'HEADER\tROUTING_TABLE\tVirtual Address\tCommon Name\tReal Address\tLast Ref'
+        '\tLast Ref (time_t)',
+]
+
+## Diff fields of connector
+IDENTITY = ('virtual_address', 'real_address', 'since')
+METRICS = ('bytes_sent', 'bytes_received')
+
+## Client MAC address
+def mac(i):
+    return '26:94:e9:32:51:{0:02x}'.format(i)
+
+## Write status file
+#  @param clients Dictionary of (received, sent) counters by client number.
+def write(path, clients):
+
+    lines = list(HEADER)
+    for i in sorted(clients):
+        lines.append('CLIENT_LIST\trobot{0}\t172.16.0.{0}:1194\t10.8.0.{0}\t{1}\t{2}'
+                     '\tThu Jan  1 00:00:00 2026\t1767225600'.format(i, *clients[i]))
+    for i in sorted(clients):
+        lines.append('ROUTING_TABLE\t{0}\trobot{1}\t172.16.0.{1}:1194'
+                     '\tThu Jan  1 00:00:00 2026\t1767225600'.format(mac(i), i))
+    lines.append('END')
+
+    path.write('\n'.join(lines) + '\n')
+
+@pytest.fixture
+def status(tmpdir):
+    return tmpdir.join('openvpn.status')
+
+def test_rows_fingerprinted(status):
+
+    write(status, {1: (0, 0), 2: (0, 0)})
+    parser = OpenVPNStatusParser(str(status), incremental = True)
+    assert parser.update() == (set(['robot1', 'robot2']), set(), set())
+    first = dict(parser.connected_clients)
+
+    # Same rows keep parsed records
+    assert parser.update() == (set(), set(), set())
+    for key in first:
+        assert parser.connected_clients[key] is first[key]
+
+    # Row is added, removed and changed
+    write(status, {1: (10, 20), 3: (0, 0)})
+    assert parser.update() == (set(['robot3']), set(['robot2']), set(['robot1']))
+
+    clients = parser.connected_clients
+    assert clients['robot1'].bytes_sent == 20
+    assert first['robot1'].bytes_sent == 0
+
+def test_incomplete_file_ignored(status):
+
+    write(status, {1: (0, 0)})
+    parser = OpenVPNStatusParser(str(status), incremental = True)
+    parser.update()
+
+    status.write('\n'.join(HEADER) + '\n')
+    assert parser.update() == (set(), set(), set())
+    assert list(parser.connected_clients) == ['robot1']
+
+def test_lease_copy_on_change(status):
+
+    write(status, {1: (0, 0), 2: (0, 0)})
+    parser = OpenVPNStatusParser(str(status), incremental = True)
+    parser.update()
+    parsed = parser.connected_clients['robot1']
+
+    # Leased address replaces record, parsed one is not changed
+    assert parser.concat_dhcp({mac(1): '10.9.0.80'}) == set(['robot1'])
+    leased = parser.connected_clients['robot1']
+    assert leased is not parsed
+    assert leased.virtual_address == '10.9.0.80'
+    assert parsed.virtual_address == '10.8.0.1'
+
+    # Same lease and same status file change nothing
+    assert parser.update() == (set(), set(), set())
+    assert parser.concat_dhcp({mac(1): '10.9.0.80'}) == set()
+    assert parser.connected_clients['robot1'] is leased
+
+    # Address of status file is restored when lease is lost
+    assert parser.concat_dhcp({}) == set(['robot1'])
+    assert parser.connected_clients['robot1'].virtual_address == '10.8.0.1'
+
+def test_hint_matches_full_diff(status):
+
+    write(status, {1: (0, 0), 2: (0, 0), 3: (0, 0), 4: (0, 0)})
+    parser = OpenVPNStatusParser(str(status), incremental = True)
+    parser.update()
+    parser.concat_dhcp({mac(4): '10.9.0.4'})
+    past = dict(parser.connected_clients)
+
+    # Counters of robot1 change, robot2 gets lease, robot4 loses lease
+    write(status, {1: (5, 5), 2: (0, 0), 3: (0, 0), 4: (0, 0)})
+    added, removed, changed = parser.update()
+    leased = parser.concat_dhcp({mac(2): '10.9.0.2'})
+    assert changed | leased == set(['robot1', 'robot2', 'robot4'])
+
+    current = dict(parser.connected_clients)
+    full = DictDiffer(current, past, IDENTITY, METRICS)
+    hinted = DictDiffer(current, past, IDENTITY, METRICS, hint = changed | leased)
+
+    assert hinted.changed == full.changed
+    assert hinted.changed_identity == full.changed_identity
+    assert hinted.changed_metrics == full.changed_metrics
+    assert sorted(full.changed_identity[1]) == ['robot2', 'robot4']
+    assert sorted(full.changed_metrics[1]) == ['robot1']
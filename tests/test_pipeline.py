@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+## @package test_pipeline
+#  Status events pipeline stage.
+from pipeline import Stage, StatusEvent, CONNECT, DISCONNECT
+from parser import ClientEntry
+from threading import Thread, Event
+import logging, time
+import pytest
+
+## Stage handler recording batches
+class Recorder:
+
+    def __init__(s, fail = 0):
+
+        # Batches of (kind, anchor) events
+        s.batches = []
+
+        # First batch is applied when gate is opened
+        s.gate = Event()
+
+        # Count of failures before success
+        s.fail = fail
+
+    def __call__(s, added, removed, changed, robots):
+
+        s.gate.wait()
+
+        if s.fail:
+            s.fail -= 1
+            raise RuntimeError('stage failed')
+
+        s.batches.append(sorted([(CONNECT, key) for key in added] +
+                                [(DISCONNECT, key) for key in removed]))
+
+## Make event of robot
+def event(kind, anchor):
+    return StatusEvent(kind, anchor, ClientEntry(anchor, '172.16.0.1:1194', '10.8.0.6',
+                                                 0, 0, 'now', '1767225600'))
+
+## Wait for applied events
+def wait(stage):
+    stage.queue.join()
+
+@pytest.fixture
+def recorder():
+
+    recorder = Recorder()
+    yield recorder
+    recorder.gate.set()
+
+def test_events_of_robot_applied_in_order(recorder):
+
+    stage = Stage(logging.getLogger('test'), 'test', recorder, delay = 0)
+
+    # Worker waits on first batch while others are queued
+    stage.put(event(CONNECT, 'first'))
+    time.sleep(0.1)
+    for kind, anchor in [(CONNECT, 'a'), (CONNECT, 'b'), (DISCONNECT, 'a'),
+                         (CONNECT, 'c'), (CONNECT, 'a')]:
+        stage.put(event(kind, anchor))
+
+    recorder.gate.set()
+    wait(stage)
+
+    # Batch is cut when robot repeats
+    assert recorder.batches == [
+        [(CONNECT, 'first')],
+        [(CONNECT, 'a'), (CONNECT, 'b')],
+        [(CONNECT, 'c'), (DISCONNECT, 'a')],
+        [(CONNECT, 'a')]]
+    assert stage.stats()['events'] == 6
+
+def test_emitter_blocked_while_queue_full(recorder):
+
+    stage = Stage(logging.getLogger('test'), 'test', recorder, maxsize = 2)
+
+    stage.put(event(CONNECT, 'first'))
+    time.sleep(0.1)
+    stage.put(event(CONNECT, 'a'))
+    stage.put(event(CONNECT, 'b'))
+
+    emitter = Thread(target = stage.put, args = (event(CONNECT, 'c'),))
+    emitter.daemon = True
+    emitter.start()
+    emitter.join(0.2)
+    assert emitter.is_alive()
+
+    recorder.gate.set()
+    emitter.join(5)
+    assert not emitter.is_alive()
+
+    wait(stage)
+    assert stage.stats()['max_depth'] == 2
+
+def test_failed_batch_retried(recorder):
+
+    recorder.fail = 2
+    stage = Stage(logging.getLogger('test'), 'test', recorder, delay = 0)
+
+    recorder.gate.set()
+    stage.put(event(CONNECT, 'a'))
+    wait(stage)
+    stage.put(event(DISCONNECT, 'a'))
+    wait(stage)
+
+    assert recorder.batches == [[(CONNECT, 'a')], [(DISCONNECT, 'a')]]
+    stats = stage.stats()
+    assert stats['errors'] == 2 and stats['dropped'] == 0
+
+def test_batch_dropped_after_retries(recorder):
+
+    recorder.fail = 3
+    stage = Stage(logging.getLogger('test'), 'test', recorder, retries = 2, delay = 0)
+
+    recorder.gate.set()
+    stage.put(event(CONNECT, 'a'))
+    wait(stage)
+
+    # Next batch is applied after dropped one
+    stage.put(event(CONNECT, 'b'))
+    wait(stage)
+
+    assert recorder.batches == [[(CONNECT, 'b')]]
+    assert stage.stats()['dropped'] == 1
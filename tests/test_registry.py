@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+## @package test_registry
+#  Robot registry cache.
+#
+#  Robots are stored in in-memory SQLite database, notifications are given
+#  by fake listener.
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db import Base, Robot, Container
+from registry import RobotRegistry, RegistryListener, REGISTRY_CHANNEL
+from Queue import Queue, Empty
+import registry
+import time
+import pytest
+
+## Session counting queries
+class CountingSession(object):
+
+    def __init__(s, session, before = None):
+        s.session = session
+        s.queries = 0
+
+        # Called before every query
+        s.before = before
+
+    def query(s, *args):
+        s.queries += 1
+        if s.before is not None:
+            s.before()
+        return s.session.query(*args)
+
+## Fake clock of registry module
+class Clock(object):
+
+    def __init__(s):
+        s.now = 1000.0
+
+    def time(s):
+        return s.now
+
+    def sleep(s, seconds):
+        pass
+
+## Fake notifications listener
+class FakeListener(object):
+
+    def __init__(s):
+        s.notifies = Queue()
+
+    def wait(s, timeout = None):
+        try:
+            return [s.notifies.get(timeout = 5)]
+        except Empty:
+            return []
+
+    def close(s):
+        pass
+
+@pytest.fixture
+def session():
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind = engine)()
+
+    for i in range(10):
+        robot = Robot(id = i + 1, anchor = 'robot{0}'.format(i))
+        session.add(robot)
+        session.add(Container(robot = robot.id, address = '10.10.0.{0}'.format(i + 1)))
+    session.commit()
+
+    yield CountingSession(session)
+    session.close()
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    clock = Clock()
+    monkeypatch.setattr(registry, 'time', clock)
+    return clock
+
+def test_records_cached(session, clock):
+
+    cache = RobotRegistry(size = 10, ttl = 60)
+
+    robots = cache.resolve(session, ['robot1', 'robot2', 'missing'])
+    assert sorted(robots) == ['robot1', 'robot2']
+    assert robots['robot1'].address == '10.10.0.2'
+
+    # Missing robots are cached too
+    assert sorted(cache.resolve(session, ['robot1', 'robot2', 'missing'])) == ['robot1', 'robot2']
+    assert session.queries == 1
+    assert cache.stats() == {'size': 3, 'hits': 3, 'misses': 3}
+
+def test_least_recently_used_evicted(session, clock):
+
+    cache = RobotRegistry(size = 3, ttl = 60)
+
+    for anchor in ('robot0', 'robot1', 'robot2'):
+        cache.resolve(session, [anchor])
+
+    # Use robot0, so robot1 is the least recently used
+    cache.resolve(session, ['robot0'])
+    cache.resolve(session, ['robot3'])
+    assert cache.stats()['size'] == 3
+
+    queries = session.queries
+    cache.resolve(session, ['robot0', 'robot2', 'robot3'])
+    assert session.queries == queries
+
+    cache.resolve(session, ['robot1'])
+    assert session.queries == queries + 1
+
+def test_records_expired(session, clock):
+
+    cache = RobotRegistry(size = 10, ttl = 60)
+
+    cache.resolve(session, ['robot1'])
+    clock.now += 59
+    cache.resolve(session, ['robot1'])
+    assert session.queries == 1
+
+    clock.now += 2
+    cache.resolve(session, ['robot1'])
+    assert session.queries == 2
+
+def test_stale_load_not_cached(session, clock):
+
+    cache = RobotRegistry(size = 10, ttl = 60)
+
+    # Robot is changed while its record is loaded
+    session.before = lambda: cache.invalidate('robot1')
+    assert 'robot1' in cache.resolve(session, ['robot1'])
+    assert cache.stats()['size'] == 0
+
+    session.before = None
+    cache.resolve(session, ['robot1'])
+    assert cache.stats()['size'] == 1
+
+def test_invalidated_by_notification(session, clock):
+
+    cache = RobotRegistry(size = 10, ttl = 60)
+    cache.resolve(session, ['robot1', 'robot2', 'robot3'])
+
+    thread = RegistryListener(cache, None)
+    thread.listener = FakeListener()
+    thread.start()
+
+    # Changed robot is dropped
+    thread.listener.notifies.put((REGISTRY_CHANNEL, 'robot1'))
+    for i in range(100):
+        if cache.stats()['size'] == 2:
+            break
+        time.sleep(0.01)
+    assert cache.stats()['size'] == 2
+
+    # Empty payload drops all records
+    thread.listener.notifies.put((REGISTRY_CHANNEL, ''))
+    for i in range(100):
+        if cache.stats()['size'] == 0:
+            break
+        time.sleep(0.01)
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+## @package test_responder
+#  Embedded DNS responder tests.
+#
+#  Responder is started on loopback with fake upstream resolver, load test
+#  sends mixed queries of records, missing records and forwarded names.
+from responder import DNSResponder, parse_query
+from registry import RobotRecord
+from dnsd import DNSDaemon
+from threading import Thread
+import socket, struct, time, logging
+import pytest
+
+## Count of load test queries
+LOAD_QUERIES = 3000
+
+## Count of queries sent before reading responses
+LOAD_WINDOW = 100
+
+## Make query datagram
+def query(ident, name, qtype = 1):
+
+    labels = ''.join(chr(len(label)) + label for label in name.split('.'))
+    return struct.pack('!HHHHHH', ident, 0x0100, 1, 0, 0, 0) + \
+           labels + '\0' + struct.pack('!HH', qtype, 1)
+
+## Fake upstream resolver
+#
+#  Answer every query with its id and name, or receive queries silently.
+class Upstream(Thread):
+
+    def __init__(s, silent = False):
+        Thread.__init__(s)
+        s.daemon = True
+        s.silent = silent
+        s.ids = []
+        s.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.sock.bind(('127.0.0.1', 0))
+        s.address = s.sock.getsockname()
+
+    def run(s):
+        while True:
+            data, peer = s.sock.recvfrom(4096)
+            s.ids.append(struct.unpack('!H', data[:2])[0])
+            if not s.silent:
+                flags = struct.pack('!H', 0x8180)
+                s.sock.sendto(data[:2] + flags + data[4:], peer)
+
+@pytest.fixture
+def records():
+    return dict(('lxc-robot{0}'.format(i), '10.10.{0}.{1}'.format(i >> 8, i & 0xff))
+                for i in range(1000))
+
+def start(records, upstream):
+
+    responder = DNSResponder(records, ('127.0.0.1', 0), upstream.address)
+    upstream.start()
+    responder.start()
+
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(2)
+    return responder, client
+
+def test_load(records):
+
+    responder, client = start(records, Upstream())
+
+    names = ['lxc-robot{0}', 'lxc-missing{0}', 'host{0}.example.com']
+    expected = {}
+    received = {}
+    started = time.time()
+
+    for window in range(0, LOAD_QUERIES, LOAD_WINDOW):
+        for ident in range(window, window + LOAD_WINDOW):
+            name = names[ident % 3].format(ident % 1000)
+            expected[ident] = name
+            client.sendto(query(ident, name), responder.address)
+
+        for i in range(LOAD_WINDOW):
+            data = client.recv(4096)
+            ident, flags, ancount = struct.unpack('!HHxxH', data[:8])
+            received[ident] = (flags & 0xf, ancount, data)
+
+    elapsed = time.time() - started
+
+    assert sorted(received) == sorted(expected)
+    for ident, name in expected.items():
+        rcode, ancount, data = received[ident]
+        if name.startswith('lxc-robot'):
+            assert (rcode, ancount) == (0, 1)
+            assert socket.inet_ntoa(data[-4:]) == records[name]
+        elif name.startswith('lxc-'):
+            assert rcode == 3
+        else:
+            assert parse_query(query(ident, name))[2] == name
+            assert rcode == 0
+
+    assert responder.stats['forwarded'] == LOAD_QUERIES / 3
+    assert not responder._pending
+
+    rate = LOAD_QUERIES / elapsed
+    print('DNS responder: {0} queries in {1:.3f} s, {2:.0f} queries/s'
+            .format(LOAD_QUERIES, elapsed, rate))
+    assert rate > LOAD_QUERIES / 10.0
+
+def test_upstream_ids_are_random(records):
+
+    upstream = Upstream(silent = True)
+    responder, client = start(records, upstream)
+
+    for ident in range(200):
+        client.sendto(query(ident, 'example.com'), responder.address)
+
+    deadline = time.time() + 2
+    while len(upstream.ids) < 200 and time.time() < deadline:
+        time.sleep(0.01)
+
+    ids = upstream.ids
+    assert len(set(ids)) == 200
+    assert sum(1 for a, b in zip(ids, ids[1:]) if b == a + 1) < 10
+
+def test_response_from_other_peer_dropped(records):
+
+    upstream = Upstream(silent = True)
+    responder, client = start(records, upstream)
+
+    client.sendto(query(7, 'example.com'), responder.address)
+
+    deadline = time.time() + 2
+    while not upstream.ids and time.time() < deadline:
+        time.sleep(0.01)
+
+    # Spoofed response with right id from other address
+    port = responder.upstream_sock.getsockname()[1]
+    spoofer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    spoofer.sendto(struct.pack('!HH', upstream.ids[0], 0x8180) + '\0' * 8,
+                   ('127.0.0.1', port))
+
+    client.settimeout(0.5)
+    with pytest.raises(socket.timeout):
+        client.recv(4096)
+
+    assert upstream.ids[0] in responder._pending
+    assert responder.stats['dropped'] == 1
+
+def test_anchor_case_insensitive():
+
+    daemon = DNSDaemon(logging.getLogger('test'))
+    daemon.append(['Robot7'], {'Robot7': RobotRecord(7, 'Robot7', 7, '10.10.0.7')})
+    responder, client = start(daemon.records, Upstream())
+
+    for name in ('lxc-robot7', 'LXC-Robot7'):
+        client.sendto(query(1, name), responder.address)
+        data = client.recv(4096)
+        assert struct.unpack('!H', data[2:4])[0] & 0xf == 0
+        assert socket.inet_ntoa(data[-4:]) == '10.10.0.7'
+
+    daemon.delete(['Robot7'])
+    assert not daemon.records
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+## @package test_rollback
+#  In-memory state restore on session rollback.
+#
+#  Tables are made in in-memory SQLite database, nftables firewall backend
+#  only renders rules.
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+import db
+from db import Session, Base, Node, Robot, WsPort, Connection, session_scope
+from firewall import Firewall
+from connection import ConnectionStatus
+from throughput import ThroughputStats
+from collections import namedtuple
+import connection
+import datetime, logging
+import pytest
+
+## Robot record of registry
+class Record(object):
+
+    def __init__(s, robot):
+        s.id = robot.id
+        s.anchor = robot.anchor
+        s.address = '10.10.0.{0}'.format(robot.id)
+        s.container = None
+
+## Client of status file
+class Client(object):
+
+    def __init__(s, vaddress):
+        s.virtual_address = vaddress
+
+## Client of status file with connection columns
+Peer = namedtuple('Peer', ['connected_since', 'virtual_address', 'real_address',
+                           'bytes_sent', 'bytes_received'])
+
+@pytest.fixture
+def firewall(monkeypatch):
+
+    engine = create_engine('sqlite://', poolclass = StaticPool,
+                           connect_args = {'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    Session.configure(bind = engine)
+    monkeypatch.setattr(db, '_engine', engine)
+
+    with session_scope() as session:
+        session.add(Node(id = 1, name = 'test'))
+        for i in range(1, 4):
+            session.add(Robot(id = i, anchor = 'robot{0}'.format(i)))
+
+    with session_scope() as session:
+        f = Firewall(logging.getLogger('test'), 1, dry_run = True,
+                     backend = 'nftables')
+        robots = dict((r.anchor, Record(r)) for r in session.query(Robot))
+
+    yield f, robots
+
+    Session.remove()
+    engine.dispose()
+
+## Fail transaction after body
+def rolled_back(body):
+
+    with pytest.raises(RuntimeError):
+        with session_scope():
+            body()
+            raise RuntimeError('commit failed')
+
+def test_port_allocation_undone(firewall):
+    f, robots = firewall
+
+    # Robot 1 owns port, robot 2 takes it after release
+    with session_scope():
+        f.createRules({'robot1': Client('10.8.0.6')}, robots)
+    with session_scope():
+        f.applyRules()
+    with session_scope():
+        f.deleteRules({'robot1': None})
+    with session_scope():
+        f.applyRules()
+
+    state = (dict(f.ws_port.ports), dict(f.ws_port._owner), dict(f.ws_port._last),
+             list(f.ws_port._free), f.ws_port._next, bytearray(f.ws_port._used))
+
+    rolled_back(lambda: f.createRules({'robot2': Client('10.8.0.10'),
+                                       'robot3': Client('10.8.0.14')}, robots))
+
+    assert (f.ws_port.ports, f.ws_port._owner, f.ws_port._last,
+            list(f.ws_port._free), f.ws_port._next, f.ws_port._used) == state
+    assert not f.pending()
+
+    # Nothing is saved, next allocation takes the same ports
+    with session_scope() as session:
+        f.createRules({'robot2': Client('10.8.0.10')}, robots)
+        assert session.query(WsPort).filter_by(active = True).count() == 1
+    assert f.ws_port.ports == {2: 7000}
+
+def test_deleted_rules_restored(firewall):
+    f, robots = firewall
+
+    with session_scope():
+        f.createRules({'robot1': Client('10.8.0.6')}, robots)
+    with session_scope():
+        f.applyRules()
+
+    rolled_back(lambda: f.deleteRules({'robot1': None}))
+    assert not f.pending()
+
+    # Pending rules of rolled back session are restored
+    with session_scope():
+        f.createRules({'robot2': Client('10.8.0.10')}, robots)
+    rolled_back(lambda: f.deleteRules({'robot2': None}))
+
+    assert f._append['robot2']['wsport'] == f.ws_port.ports[2]
+
+def test_connection_changes_undone(firewall, monkeypatch):
+
+    # Buffered counters are flushed by every event
+    monkeypatch.setattr(connection, 'CONNECTION_FLUSH_INTERVAL', 0)
+
+    since = datetime.datetime(2026, 1, 1)
+    peers = dict(('robot{0}'.format(i),
+                  Peer(since, '10.8.0.{0}'.format(i), '192.0.2.{0}:1194'.format(i), i, i))
+                 for i in range(1, 4))
+
+    with session_scope() as session:
+        status = ConnectionStatus(logging.getLogger('test'), 'test')
+        for i, key in enumerate(sorted(peers), 1):
+            session.add(Connection(id = i, node = status.nodeid, raddress = peers[key].real_address))
+            status.ids[peers[key].real_address] = i
+            status._written[i] = (i, i)
+        status._pending[3] = {'id': 3, 'sent': 4, 'received': 4}
+
+    state = (dict(status.ids), dict(status._written), dict(status._pending), status._flushed)
+
+    # Robot 1 disconnects, robot 2 changes address, robot 3 counters grow
+    moved = peers['robot2']._replace(real_address = '192.0.2.20:1194')
+    grown = peers['robot3']._replace(bytes_sent = 5)
+    rolled_back(lambda: status.sync({}, {'robot1': peers['robot1']},
+                                    (({'robot2': peers['robot2']}, {'robot2': moved}),
+                                     ({'robot3': peers['robot3']}, {'robot3': grown})), {}))
+
+    assert (status.ids, status._written, status._pending, status._flushed) == state
+
+def test_throughput_samples_undone(firewall):
+    f, robots = firewall
+
+    stats = ThroughputStats(logging.getLogger('test'), 1, size = 3, interval = 10)
+    peers = dict((key, Peer(None, None, None, 0, 0)) for key in robots)
+
+    # Ring buffers are full
+    for n in range(4):
+        with session_scope():
+            stats.append(dict((key, peers[key]._replace(bytes_sent = n * 100))
+                              for key in peers), robots, now = n)
+
+    def state():
+        return (dict((key, list(samples)) for key, samples in stats.samples.items()),
+                dict(stats.rates), dict(stats.containers), dict(stats._flushed),
+                stats._flush_time)
+
+    before = state()
+
+    def event():
+        stats.delete({'robot3': None})
+        stats.append({'robot1': peers['robot1']._replace(bytes_sent = 900)},
+                     robots, now = 4)
+        assert stats.flush(now = before[-1] + 10) == 2
+
+    rolled_back(event)
+    assert state() == before
+
+    # Retried event writes the same rows
+    with session_scope() as session:
+        event()
+        assert session.query(db.ConnectionStats).count() == 2
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+## @package addresses
+#  TIGRO container address allocator.
+#
+#  This package assign IP addresses of LXC-containers network.
+from db import AddressMap, AddressRelease, Container
+from conf import GATEWAY_ADDRESS
+from collections import deque
+import socket, struct
+
+## Address to integer converter
+def ip_to_int(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+## Integer to address converter
+def int_to_ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+## Container address allocator
+#
+#  Addresses of gateway network are tracked by bitmap stored in 'address_map'
+#  table, one bit per host address. Released addresses are kept in FIFO free
+#  list of map row and never used addresses are taken from hint index up, so
+#  address is found without bitmap search. Addresses of deleted containers
+#  are queued to 'address_release' table by database trigger and released
+#  on next map lock. Map is rebuilt from containers table when it is
+#  exhausted. Map row is locked by session transaction, so creators of all
+#  nodes allocate addresses in turn. Network, broadcast and gateway addresses
+#  are reserved.
+class AddressAllocator:
+
+    ## The constructor
+    #  @param network Gateway address with prefix length.
+    def __init__(s, network = GATEWAY_ADDRESS):
+
+        # Save network
+        s.network = network
+
+        # Parse network address and size
+        gateway, prefix = network.split('/')
+        s.size = 1 << (32 - int(prefix))
+        s.base = ip_to_int(gateway) & ~(s.size - 1) & 0xffffffff
+        s.gateway = ip_to_int(gateway) - s.base
+
+    ## Empty bitmap with reserved addresses
+    def _reserved(s):
+
+        bitmap = bytearray((s.size + 7) / 8)
+        for index in (0, s.size - 1, s.gateway):
+            bitmap[index >> 3] |= 1 << (index & 7)
+
+        return bitmap
+
+    ## Bitmap of addresses used by containers
+    def _scan(s, session):
+
+        bitmap = s._reserved()
+        for (address,) in session.query(Container.address)\
+                                .filter(Container.address != None):
+            index = s._index(address)
+            if index is not None:
+                bitmap[index >> 3] |= 1 << (index & 7)
+
+        return bitmap
+
+    ## Address index in network
+    #  @return Index or None when address is out of network.
+    def _index(s, address):
+
+        try:
+            index = ip_to_int(address) - s.base
+        except socket.error:
+            return None
+
+        return index if 0 <= index < s.size else None
+
+    ## Free list of map row
+    def _free(s, row):
+
+        free = row.free or b''
+        return deque(struct.unpack('!{0}I'.format(len(free) / 4), free))
+
+    ## Get locked map row
+    #
+    #  Queued addresses of deleted containers are released.
+    def _map(s, session):
+
+        row = session.query(AddressMap)\
+                    .filter_by(network = s.network)\
+                    .with_for_update()\
+                    .first()
+
+        if row is None:
+            # Make map of addresses used by existing containers
+            row = AddressMap(network = s.network, bitmap = bytes(s._scan(session)),
+                             free = b'', hint = 0)
+            session.add(row)
+            session.flush()
+
+        # Release addresses of deleted containers
+        released = session.query(AddressRelease).all()
+        if released:
+            s._release(row, [item.address for item in released])
+            for item in released:
+                session.delete(item)
+
+        return row
+
+    ## Allocate addresses
+    #  @param session Database session, map row is locked till its commit.
+    #  @param count Count of addresses.
+    #  @return List of addresses.
+    def allocate(s, session, count = 1):
+
+        if count <= 0:
+            return []
+
+        row = s._map(session)
+        bitmap = bytearray(row.bitmap)
+        free = s._free(row)
+        hint = row.hint or 0
+
+        used = lambda index: bitmap[index >> 3] & (1 << (index & 7))
+
+        indexes = []
+        reclaimed = False
+        while len(indexes) < count:
+            index = None
+
+            if free:
+                # take released address
+                index = free.popleft()
+
+            # Take never used address, addresses of existing containers
+            # are skipped
+            while index is None and hint < s.size:
+                if not used(hint):
+                    index = hint
+                hint += 1
+
+            if index is None:
+                if reclaimed:
+                    raise RuntimeError('Container addresses exhausted')
+
+                # Reclaim addresses of containers deleted without release
+                bitmap = s._scan(session)
+                for index in indexes:
+                    bitmap[index >> 3] |= 1 << (index & 7)
+                free, hint = deque(), 0
+                reclaimed = True
+                continue
+
+            # Mark address as used
+            bitmap[index >> 3] |= 1 << (index & 7)
+            indexes.append(index)
+
+        # Save map
+        row.bitmap = bytes(bitmap)
+        row.free = struct.pack('!{0}I'.format(len(free)), *free)
+        row.hint = hint
+
+        return [int_to_ip(s.base + index) for index in indexes]
+
+    ## Release addresses
+    #  @param session Database session, map row is locked till its commit.
+    #  @param addresses List of addresses.
+    def release(s, session, addresses):
+
+        if addresses:
+            s._release(s._map(session), addresses)
+
+    ## Release addresses in map row
+    #
+    #  Addresses under hint are put to free list, others are found by hint.
+    #  Address is put only when it is used, so free list has no duplicates.
+    def _release(s, row, addresses):
+
+        bitmap = bytearray(row.bitmap)
+        hint = row.hint or 0
+
+        released = []
+        for address in addresses:
+            index = s._index(address)
+
+            if index in (None, 0, s.size - 1, s.gateway):
+                # out of network or reserved
+                continue
+
+            if not bitmap[index >> 3] & (1 << (index & 7)):
+                # already free
+                continue
+
+            bitmap[index >> 3] &= ~(1 << (index & 7)) & 0xff
+            if index < hint:
+                released.append(index)
+
+        # Save map
+        row.bitmap = bytes(bitmap)
+        row.free = (row.free or b'') + struct.pack('!{0}I'.format(len(released)), *released)
@@ -5,32 +5,150 @@
 #  This file contain some configuration details.
 
 ## DNS daemon config file
+#
+#  Additional hosts file of dnsmasq, it should be enabled by
+#  'addn-hosts=/etc/lxc-hosts' in dnsmasq configuration.
 DNSD_CONFIG = '/etc/lxc-hosts'
 
+## DNS daemon pid file
+DNSD_PIDFILE = '/var/run/dnsmasq/dnsmasq.pid'
+
+## Embedded DNS responder enable flag
+#
+#  When enabled, 'lxc-<anchor>' names are answered by TIGRO from memory and
+#  dnsmasq is not reloaded on records change.
+DNS_RESPONDER = False
+
+## Embedded DNS responder listen address
+DNS_LISTEN = ('10.10.255.254', 53)
+
+## Upstream resolver of names out of 'lxc-*' zone
+DNS_UPSTREAM = ('127.0.0.1', 5353)
+
+## Optional domain of 'lxc-*' names, for example 'robots.local'
+DNS_DOMAIN = ''
+
+## TTL of 'lxc-*' answers, in seconds
+DNS_TTL = 5
+
 ## DHCP leases file
 DHCP_LEASES_FILE = '/var/lib/misc/dnsmasq.leases'
 
 ## Start WebSocket port number
 WS_START_PORT = 7000
 
+## End WebSocket port number
+WS_END_PORT = 65535
+
+## Firewall backend: 'iptables' or 'nftables'
+FIREWALL_BACKEND = 'iptables'
+
+## Count of firewall dispatch buckets
+#
+#  Robot NAT rules are spread over this count of chains by container address,
+#  client address and WebSocket port, so new connection walks only rules of
+#  one bucket. Power of two, not greater than 64.
+FIREWALL_BUCKETS = 64
+
+## Count of attempts to apply firewall change of robot
+#
+#  Changes failed by batch transaction are applied robot by robot, change of
+#  robot failed this count of times is dropped.
+FIREWALL_RETRIES = 3
+
 ## LXC-containers directory
 LXC_DIR = '/lxc'
 
+## Size of status events queue of every pipeline stage
+PIPELINE_QUEUE_SIZE = 1024
+
+## Max count of events applied by pipeline stage at once
+PIPELINE_BATCH = 256
+
+## Count of retries of failed pipeline stage batch
+#
+#  Stage is blocked while failed batch is retried with delay growing twice by
+#  every attempt, so later events of its robots are not applied before it.
+#  Batch is dropped after this count of retries.
+PIPELINE_RETRIES = 5
+
+## First retry delay of failed pipeline stage batch, in seconds
+PIPELINE_RETRY_DELAY = 1
+
+## Count of parallel lxc-start/lxc-stop workers
+LXC_WORKERS = 8
+
+## Timeout of lxc-start/lxc-stop command, in seconds
+LXC_TIMEOUT = 30
+
+## Creation queue poll interval, in seconds
+#
+#  Creators are woken by database notifications, poll is a fallback for lost
+#  notifications.
+CREATOR_POLL_INTERVAL = 60
+
+## Max count of creation tasks claimed by one transaction
+CREATOR_BATCH = 100
+
+## Max count of creation attempts of one task
+#
+#  Failed tasks are retried with delay growing twice by every attempt and
+#  left in queue as failed after this count of attempts.
+CREATOR_MAX_ATTEMPTS = 5
+
+## First retry delay of failed creation task, in seconds
+CREATOR_RETRY_DELAY = 30
+
+## Count of config writer threads of creator
+CREATOR_IO_THREADS = 8
+
 ## LXC-container config template
 #
 #  This is template config file for LXC container.
 #  Template accept two arguments: anchor and ipaddr for new container.
 CONFIG_TEMPLATE = '{0}/config.template'.format(LXC_DIR)
 
-## LXC-container IP-address template
-ADDRESS_TEMPLATE = '10.10.{0}.{1}'
-
 ## LXC-container gateway address
 GATEWAY_ADDRESS = '10.10.255.254/16'
 
 ## OpenVPN status file, version 3
 OPENVPN_STATUS_FILE = '/run/openvpn.status'
 
+## Connection byte counters write interval, in seconds
+#
+#  Changed counters of connected clients are buffered and written to the
+#  connection table once per interval.
+CONNECTION_FLUSH_INTERVAL = 60
+
+## Connection byte counters write threshold, in bytes
+#
+#  Counters grown by this count of bytes since last write are written at once.
+CONNECTION_FLUSH_DELTA = 64 * 1024 * 1024
+
+## Count of throughput samples kept per connected client
+STATS_SAMPLES = 120
+
+## Weight of new rate in throughput moving average, from 0 to 1
+STATS_EWMA_ALPHA = 0.3
+
+## Throughput statistics write interval, in seconds
+STATS_FLUSH_INTERVAL = 300
+
+## Client throughput reported as saturating VPN link, in bytes per second
+STATS_SATURATION_RATE = 1024 * 1024
+
+## OpenVPN status events coalescing window, in seconds
+#
+#  Burst of status file modifications separated by less than this window
+#  makes only one status update. Zero value disables coalescing.
+STATUS_COALESCE_WINDOW = 0.2
+
+## Max latency of coalesced status update, in seconds
+#
+#  Status update runs after this time since first event of burst even if
+#  modifications are still coming.
+STATUS_MAX_LATENCY = 1.0
+
 ## Database name
 DB_NAME = 'tigro'
 
@@ -45,3 +163,30 @@ DB_HOST = 'localhost'
 
 ## Database driver
 DB_DRIVER = 'postgresql+psycopg2'
+
+## Count of kept open database connections
+DB_POOL_SIZE = 5
+
+## Count of database connections over pool size
+DB_MAX_OVERFLOW = 10
+
+## Timeout of waiting for free database connection, in seconds
+DB_POOL_TIMEOUT = 30
+
+## Database connection recycle time, in seconds
+DB_POOL_RECYCLE = 3600
+
+## Check database connection liveness on checkout
+DB_PRE_PING = True
+
+## Count of cached compiled statements
+DB_STATEMENT_CACHE = 500
+
+## Max count of robots cached in registry
+REGISTRY_SIZE = 10000
+
+## Robot registry record time to live, in seconds
+#
+#  Records are dropped on database notifications, TTL is a fallback for lost
+#  notifications.
+REGISTRY_TTL = 300
@@ -3,126 +3,267 @@
 #  OpenVPN connection status.
 #
 #  This package exports information about OpenVPN connections to database.
-from db import Connection, Robot, Node
+from db import Session, Connection, Node, on_rollback
+from conf import CONNECTION_FLUSH_INTERVAL, CONNECTION_FLUSH_DELTA
+import time
+
+## Connection table
+table = Connection.__table__
+
+## Missing key marker of undo journal
+MISSING = object()
 
 ## Connection status class 
 #
-#  This class provide access to connection status table.
+#  This class provide access to connection status table. Connection ids are
+#  kept by client real address, so every kind of change is written by one
+#  bulk statement. Connects, disconnects and address changes are written at
+#  once, byte counters are buffered and written by interval or when they
+#  grow by delta threshold.
 class ConnectionStatus:
 
     ## The constructor
-    def __init__(s, logger, session, nodename):
+    def __init__(s, logger, nodename):
 
         # Save logger
         s.log = logger
 
-        # Save database connection session
-        s.db = session
-        s.db_changed = False
+        # Init connection ids by client real address
+        s.ids = {}
+
+        # Init written byte counters and buffered rows by connection id
+        s._written = {}
+        s._pending = {}
+        s._flushed = time.time()
+
+        # Previous values of keys changed by current event, None when
+        # changes are not journaled
+        s._journal = None
+
+        # Init statement counters
+        s.stats = {'events': 0, 'statements': 0, 'last_statements': 0,
+                   'buffered': 0, 'written': 0}
 
         # Save node id
-        s.nodeid = s.db.query(Node).filter_by(name = nodename).first().id
+        s.nodeid = Session.query(Node.id).filter_by(name = nodename).scalar()
 
         # Init empty table
         s.log.debug('Init connection table')
-        items = s.db.query(Connection).filter_by(node = s.nodeid).all()
-        if len(items) > 0:
-            for i in items:
-                s.db.delete(i)
-                s.log.debug('Drop connection from {0}'.format(i.raddress))
-            s.db.commit()
-        s.log.debug('Connection table crear')
-
-    ## Commit changes to database
-    def commit(s):
-
-        # Commit current session
-        if s.db_changed:
-            s.db.commit()
-            s.db_changed = False
+        count = s._execute(table.delete().where(table.c.node == s.nodeid)).rowcount
+        s.log.debug('Connection table clear, dropped {0} rows'.format(count))
+
+    ## Execute statement in current session
+    def _execute(s, statement):
+
+        s.stats['statements'] += 1
+        return Session.execute(statement)
+
+    ## Synchronize connection table with status event
+    #  @param added Dictionary of connected clients by anchor.
+    #  @param removed Dictionary of disconnected clients by anchor.
+    #  @param changed Tuple of identity and metrics changes, both are tuples
+    #         of (before, after) dictionaries of changed clients.
+    #  @param robots Dictionary of robot records by anchor.
+    def sync(s, added, removed, changed, robots):
+
+        statements = s.stats['statements']
+
+        # Restore connection ids and counters when transaction rolls back,
+        # only keys changed by event are journaled
+        journal = s._journal = []
+        pending, flushed = s._pending, s._flushed
+
+        ## Synchronization undo
+        def undo():
+            s._pending, s._flushed = pending, flushed
+            for dictionary, key, value in reversed(journal):
+                if value is MISSING:
+                    dictionary.pop(key, None)
+                else:
+                    dictionary[key] = value
+
+        on_rollback(undo)
+
+        s.delete(removed)
+        s.update(*changed)
+        s.append(added, robots)
+
+        # Write buffered counters by interval
+        if time.time() - s._flushed >= CONNECTION_FLUSH_INTERVAL:
+            s.flush()
+
+        s.stats['events'] += 1
+        s.stats['last_statements'] = s.stats['statements'] - statements
+        s.log.debug('Connection table statements: {0}'
+                        .format(s.stats['last_statements']))
+
+    ## Set dictionary key, previous value is journaled
+    def _set(s, dictionary, key, value):
+
+        if s._journal is not None:
+            s._journal.append((dictionary, key, dictionary.get(key, MISSING)))
+        dictionary[key] = value
+
+    ## Pop dictionary key, previous value is journaled
+    #  @return Popped value or None.
+    def _pop(s, dictionary, key):
+
+        value = dictionary.pop(key, MISSING)
+        if value is MISSING:
+            return None
+
+        if s._journal is not None:
+            s._journal.append((dictionary, key, value))
+        return value
+
+    ## Connection columns of client
+    def _columns(s, client):
+
+        return {'since':    client.connected_since,
+                'vaddress': client.virtual_address,
+                'raddress': client.real_address,
+                'sent':     client.bytes_sent,
+                'received': client.bytes_received}
 
     ## append new connected clients
-    def append(s, clients):
+    #  @param clients Dictionary of clients by anchor.
+    #  @param robots Dictionary of robot records by anchor.
+    def append(s, clients, robots):
+
+        rows = []
 
         # Insert to table all clients in list
         for key in clients:
 
             # Get robot by anchor
-            r = s.db.query(Robot)\
-                            .join('container')\
-                            .filter(Robot.anchor==key)\
-                            .first()
+            r = robots.get(key)
 
             if not r:
                 # robot doesn't exist - skip
                 s.log.critical('Robot {0} does NOT exist'.format(key))
                 continue
 
-            # Create connection row
-            c = Connection(
-                since     = clients[key]['Connected Since'],
-                vaddress  = clients[key]['Virtual Address'],
-                raddress  = clients[key]['Real Address'],
-                sent      = int(clients[key]['Bytes Sent']),
-                received  = int(clients[key]['Bytes Received']),
-                container = r.container.id,
-                node      = s.nodeid
-            )
-
-            # Add new item to session
+            # Make connection row
+            row = s._columns(clients[key])
+            row['container'] = r.container
+            row['node'] = s.nodeid
+            rows.append(row)
+
             s.log.info('Append new connection: {0} -> {1}'
-                            .format(c.raddress, c.vaddress))
-            s.db.add(c)
-            s.db_changed = True
+                            .format(row['raddress'], row['vaddress']))
+
+        if not rows:
+            # nothing to insert
+            return
+
+        # Insert rows by one statement and save its ids
+        result = s._execute(table.insert().values(rows)
+                                .returning(table.c.id, table.c.raddress))
+        for ident, raddress in result:
+            s._set(s.ids, raddress, ident)
+
+        # Save written counters
+        for row in rows:
+            s._set(s._written, s.ids[row['raddress']], (row['sent'], row['received']))
 
     ## Delete disconnected clients
     def delete(s, clients):
 
+        ids = []
+
         # Drop all clients in list
         for key in clients:
 
-            # Select connection by source IP
-            c = s.db.query(Connection).filter(
-                    Connection.raddress == clients[key]['Real Address']
-                ).first()
+            # Get connection by source IP
+            ident = s._pop(s.ids, clients[key].real_address)
 
-            if not c:
+            if ident is None:
                 # nothing to drop - skip
                 continue
 
-            # Drop item
-            s.log.info('Delete connection from {0}'.format(c.raddress))
-            s.db.delete(c)
-            s.db_changed = True
+            s.log.info('Delete connection from {0}'
+                            .format(clients[key].real_address))
+            ids.append(ident)
+
+            # Drop counters of connection
+            s._pop(s._written, ident)
+            s._pop(s._pending, ident)
+
+        if ids:
+            # Drop rows by one statement
+            s._execute(table.delete().where(table.c.id.in_(ids)))
 
     ## Update client connection
-    def update(s, clients):
+    #
+    #  Rows with changed identity (addresses or since time) and rows with
+    #  counters grown by delta threshold are written at once, other rows are
+    #  buffered.
+    #  @param identity Tuple of (before, after) dictionaries of clients with
+    #         changed identity.
+    #  @param metrics Tuple of (before, after) dictionaries of clients with
+    #         changed counters only.
+    def update(s, identity, metrics = ({}, {})):
 
-        # Decomposition of clients
-        before, after = clients
+        rows = []
 
-        # Drop all clients in list
-        for key in before:
+        # Update all clients in lists
+        for (before, after), buffered in ((identity, False), (metrics, True)):
+            for key in before:
 
-            # Select connection by source IP
-            c = s.db.query(Connection).filter(
-                    Connection.raddress == before[key]['Real Address']
-                ).first()
+                # Get connection by source IP
+                ident = s._pop(s.ids, before[key].real_address)
 
-            if not c:
-                # nothing to change - skip
-                continue
+                if ident is None:
+                    # nothing to change - skip
+                    continue
+
+                # Make changed row
+                row = s._columns(after[key])
+                row['id'] = ident
+                s._set(s.ids, row['raddress'], ident)
+
+                # Get counters growth since last write
+                sent, received = s._written.get(ident, (0, 0))
+                delta = abs(row['sent'] - sent) + abs(row['received'] - received)
+
+                if buffered and delta < CONNECTION_FLUSH_DELTA:
+                    # counters only - buffer row
+                    s._set(s._pending, ident, row)
+                    s.stats['buffered'] += 1
+                    continue
+
+                s._pop(s._pending, ident)
+                rows.append(row)
+
+                s.log.debug('Update connection stats: {0} -> {1}'
+                                .format(row['raddress'], row['vaddress']))
+
+        s._write(rows)
+
+    ## Write buffered counters
+    #
+    #  Buffer is replaced, so rollback handler of sync restores the previous
+    #  one without copy.
+    def flush(s):
+
+        rows = s._pending.values()
+        s._pending = {}
+        s._flushed = time.time()
+
+        s._write(rows)
+
+    ## Write changed rows
+    def _write(s, rows):
 
-            # Update columns
-            c.since    = after[key]['Connected Since']
-            c.vaddress = after[key]['Virtual Address']
-            c.raddress = after[key]['Real Address']
-            c.sent     = int(after[key]['Bytes Sent'])
-            c.received = int(after[key]['Bytes Received'])
+        if not rows:
+            # nothing to write
+            return
 
-            # Update connection information
-            s.log.debug('Update connection stats: {0} -> {1}'
-                            .format(c.raddress, c.vaddress))
-            s.db.add(c)
-            s.db_changed = True
+        # Update rows by one executemany statement
+        s.stats['statements'] += 1
+        s.stats['written'] += len(rows)
+        Session.bulk_update_mappings(Connection, rows)
 
+        # Save written counters
+        for row in rows:
+            s._set(s._written, row['id'], (row['sent'], row['received']))
@@ -3,18 +3,23 @@
 #  LXC-container connector package.
 #
 #  This package makes firewall rules for LXC-containers.
-from pyinotify import WatchManager, Notifier, ProcessEvent, IN_MODIFY
+from pyinotify import WatchManager, Notifier, ProcessEvent, IN_MODIFY, IN_CLOSE_WRITE
 from conf import OPENVPN_STATUS_FILE, DHCP_LEASES_FILE
-from db import Connection, Robot, DB_CONN_STRING
+from conf import STATUS_COALESCE_WINDOW, STATUS_MAX_LATENCY, DNS_RESPONDER
+from db import session_scope, pool_stats
 from connection import ConnectionStatus
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from throughput import ThroughputStats
 from parser import OpenVPNStatusParser
+from leases import LeaseIndex
+from registry import RobotRegistry
 from dictdiffer import DictDiffer
+from pipeline import Pipeline, CONNECT, DISCONNECT, CHANGE, METRICS
 from firewall import Firewall
-from subprocess import Popen
+from lifecycle import ContainerExecutor
 from threading import Thread
 from dnsd import DNSDaemon
+from startup import profiler
+from responder import DNSResponder
 import time, logging
 
 ## Container connector thread
@@ -24,33 +29,75 @@ import time, logging
 #
 class Connector(Thread):
 
-    ## Database connection engine
-    db = create_engine(DB_CONN_STRING, client_encoding='utf8')
-
-    ## Session class with private engine
-    Session = sessionmaker(bind=db)
-
     ## Connected clients dictionary
     clients = {}
 
     ## The constructor
-    def __init__(s, nodename):
+    #  @param nodename Host node name in the database.
+    #  @param registry Robot registry shared with other threads.
+    def __init__(s, nodename, registry = None):
         Thread.__init__(s)
 
         # Init logger
         s.log = logging.getLogger('Connector-{0}'.format(s.name))
 
-        # Init new database session
-        s._sess = s.Session()
+        # Save robot registry
+        s.registry = registry if registry is not None else RobotRegistry()
 
-        # Init firewall tables
-        s.f = Firewall(s.log, s._sess)
+        with session_scope():
 
-        # Init DNS daemon
-        s.dns = DNSDaemon(s.log, s._sess)
+            # Init database connection status table
+            with profiler.phase('connection table reset'):
+                s.connections = ConnectionStatus(s.log, nodename)
+
+            # Init firewall tables
+            with profiler.phase('firewall flush'):
+                s.f = Firewall(s.log, s.connections.nodeid)
 
-        # Init database connection status table
-        s.connections = ConnectionStatus(s.log, s._sess, nodename)
+        # Init connection throughput statistics
+        s.throughput = ThroughputStats(s.log, s.connections.nodeid)
+
+        # Init DNS daemon
+        s.dns = DNSDaemon(s.log)
+
+        # Init embedded DNS responder with shared records
+        s.responder = None
+        if DNS_RESPONDER:
+            s.responder = DNSResponder(s.dns.records)
+            s.responder.start()
+
+        # Init LXC-containers lifecycle executor
+        s.lxc = ContainerExecutor(s.log)
+
+        # Init incremental OpenVPN status parser
+        s.status = OpenVPNStatusParser(OPENVPN_STATUS_FILE, incremental=True)
+
+        # Parser change feed is usable as diff hint only when previous
+        # update has been completed
+        s._synced = False
+
+        # Init DHCP leases index
+        s.leases = LeaseIndex(DHCP_LEASES_FILE)
+
+        # Init side effect stages, stages run in parallel and every stage
+        # apply events of one robot in order
+        s.pipeline = Pipeline(s.log)
+        s.pipeline.add('firewall', s.applyFirewall)
+        s.pipeline.add('database', s.applyDatabase, (CONNECT, DISCONNECT, CHANGE, METRICS))
+        if s.responder is None:
+            # DNS daemon is reloaded after veth of started containers are up
+            s.pipeline.add('lxc', s.applyContainersDNS)
+        else:
+            s.pipeline.add('dns', s.applyDNS)
+            s.pipeline.add('lxc', s.applyContainers)
+
+        # Init status events coalescing state
+        s._first_event = None
+        s._last_event = None
+        s._closed = False
+
+        # Init events statistics
+        s.stats = {'events': 0, 'reconciliations': 0}
 
         # Make inotify watcher
         wm = WatchManager()
@@ -58,38 +105,121 @@ class Connector(Thread):
         ## OpenVPN status update handler
         class PUpdateStatus(ProcessEvent):
 
+            ## Modify file event method
+            def process_IN_MODIFY(self, event):
+
+                # Schedule status update
+                s.statusChanged()
+
             ## Close file event method
+            def process_IN_CLOSE_WRITE(self, event):
+
+                # Status file completely written, update at once
+                s.statusChanged(closed=True)
+
+        ## DHCP leases update handler
+        class PUpdateLeases(ProcessEvent):
+
+            ## Modify file event method
             def process_IN_MODIFY(self, event):
 
-                # Update status and firewall rules
-                s.updateStatus()
+                # Reload changed leases
+                s.leases.refresh()
 
         # Make notificator
         s.notifier = Notifier(wm, PUpdateStatus())
 
         # Add OpenVPN status file watcher
-        wm.watch_transient_file(OPENVPN_STATUS_FILE, IN_MODIFY, PUpdateStatus)
+        wm.watch_transient_file(OPENVPN_STATUS_FILE,
+                                IN_MODIFY | IN_CLOSE_WRITE, PUpdateStatus)
+
+        # Add DHCP leases file watcher
+        wm.watch_transient_file(DHCP_LEASES_FILE, IN_MODIFY, PUpdateLeases)
+
+    ## Status file change handler
+    #  @param closed True when status file has been closed after write.
+    def statusChanged(s, closed = False):
+
+        # Count received event
+        s.stats['events'] += 1
+
+        # Save burst timestamps
+        s._last_event = time.time()
+        if s._first_event is None:
+            s._first_event = s._last_event
+
+        s._closed = s._closed or closed
+
+    ## Time of coalesced status update
+    def _deadline(s):
+
+        # Wait for end of burst, but no longer than max latency
+        return min(s._last_event + STATUS_COALESCE_WINDOW,
+                   s._first_event + STATUS_MAX_LATENCY)
+
+    ## Time to wait for inotify events in milliseconds
+    def _timeout(s):
+
+        if s._first_event is None:
+            # nothing scheduled - wait forever
+            return None
+
+        return int(max(0, s._deadline() - time.time()) * 1000)
+
+    ## Run scheduled status update if it is time to do
+    def reconcile(s):
+
+        if s._first_event is None:
+            # nothing scheduled
+            return
+
+        if not s._closed and time.time() < s._deadline():
+            # burst is not finished
+            return
+
+        # Drop coalescing state
+        s._first_event = None
+        s._last_event = None
+        s._closed = False
 
-        s._sess.close()
+        # Update status and firewall rules
+        s.stats['reconciliations'] += 1
+        s.updateStatus()
+        s.log.debug('Status events: {0}, reconciliations: {1}'
+                        .format(s.stats['events'], s.stats['reconciliations']))
 
     ## Status updater method
     def updateStatus(s):
-        # Init new database session
-        s._sess = s.Session()
 
-        # Parse OpenVPN status file
-        status = OpenVPNStatusParser(OPENVPN_STATUS_FILE)
+        # Parse changed rows of OpenVPN status file
+        status = s.status
+        added, removed, changed = status.update()
+        s.log.debug('Status rows added: {0}, removed: {1}, changed: {2}'
+                        .format(len(added), len(removed), len(changed)))
 
-        # Parse DHCP daemon leases
-        status.concat_dhcp(DHCP_LEASES_FILE)
+        # Concatenate DHCP daemon leases, entries with changed lease address
+        # are replaced by copies
+        s.leases.refresh()
+        leased = status.concat_dhcp(s.leases)
+
+        # Entries are never changed in place, so rows changed by status file
+        # or by leases are the only changed values
+        hint = (changed | leased) if s._synced else None
+        s._synced = False
 
         s.log.debug('Connected clients: {0}'.format(status.connected_clients.keys()))
 
         # Filter clients where doesn not have IP address
         clients = s.empty_va_filter(status.connected_clients.values())
 
+        # Resolve robots by one transaction
+        with session_scope() as session:
+
+            # Get robots of clients by single query
+            robots = s.resolveRobots(session, [c.common_name for c in clients])
+
         # Filter clients where robot does not exist
-        clients = s.robot_exist_filter(clients)
+        clients = s.robot_exist_filter(clients, robots)
 
         # Conver client list to dictionary
         clients = s.list_to_dict(clients)
@@ -97,64 +227,135 @@ class Connector(Thread):
         s.log.debug('Filtered clients: {0}'.format(clients.keys()))
 
         # Get difference between old and new client lists
-        diff = DictDiffer(clients, s.clients)
+        diff = DictDiffer(clients, s.clients,
+                          identity = ('virtual_address', 'real_address', 'since'),
+                          metrics = ('bytes_sent', 'bytes_received'),
+                          hint = hint)
 
         s.log.debug('Clients added: {0}'.format(diff.added))
         s.log.debug('Clients removed: {0}'.format(diff.removed))
+        s.log.debug('Clients changed identity: {0}, metrics: {1}'
+                        .format(len(diff.changed_identity[1]),
+                                len(diff.changed_metrics[1])))
+
+        # Put robot events to side effect stages
+        s.pipeline.emit(diff, robots)
 
-        # Create new firewall rules
-        s.f.createRules(diff.added)
+        s.log.debug('Pipeline: {0}'.format(s.pipeline.stats()))
+        s.log.debug('Database pool: {0}'.format(pool_stats))
+
+        # Replace status by new
+        s.clients = clients
+        s._synced = True
 
-        # Delete old firewall rules
-        s.f.deleteRules(diff.removed)
+    ## Firewall stage handler
+    def applyFirewall(s, added, removed, changed, robots):
+
+        with session_scope():
+
+            # Create new firewall rules
+            s.f.createRules(added, robots)
+
+            # Delete old firewall rules
+            s.f.deleteRules(removed)
+
+        # Apply firewall changes by one transaction after allocated ports
+        # are committed, ports of deleted rules are released by next session
+        with session_scope():
+            if not s.f.applyRules():
+                # changes are pending - retry batch
+                raise RuntimeError('Firewall changes are not applied')
+
+    ## DNS stage handler
+    def applyDNS(s, added, removed, changed, robots):
 
         # Create new DNS records
-        s.dns.append(diff.added)
+        s.dns.append(added, robots)
 
         # Delete old DNS records
-        s.dns.delete(diff.removed)
+        s.dns.delete(removed)
+
+        # Reload DNS daemon, records are served from memory by embedded
+        # responder
+        if s.responder is None:
+            s.dns.reload()
 
-        # Update database records
-        s.connections.append(diff.added)
-        s.connections.delete(diff.removed)
-        s.connections.update(diff.changed)
-        s.connections.commit()
+    ## Database stage handler
+    def applyDatabase(s, added, removed, changed, robots):
+
+        # Database changes of batch are committed by one transaction
+        with session_scope():
+
+            # Update database records by bulk statements
+            s.connections.sync(added, removed, changed, robots)
+
+            # Save throughput samples of connected and changed clients
+            identity, metrics = changed
+            clients = dict(added)
+            clients.update(identity[1])
+            clients.update(metrics[1])
+            s.throughput.delete(removed)
+            s.throughput.append(clients, robots)
+
+            # Write throughput samples by interval
+            s.throughput.flush()
+
+    ## LXC-containers stage handler
+    def applyContainers(s, added, removed, changed, robots):
 
         # Start connected LXC-containers
-        for name in diff.added:
+        for name in added:
 
             # Spawn lxc-start for added connections
             s.log.info('Start container: {0}'.format(name))
-            Popen(['lxc-start', '--name', name, '-d']).wait()
+            s.lxc.start(name)
 
         # Stop disconnected LXC-containers
-        for name in diff.removed:
+        for name in removed:
 
             # Spawn lxc-stop for removed connections
-            Popen(['lxc-stop', '--name', name]).wait()
             s.log.info('Stop container: {0}'.format(name))
+            s.lxc.stop(name)
 
-        # Restart DNS daemon (after all veth.* in status UP)
-        s.dns.restart()
+        # Wait for parallel lxc-start/lxc-stop commands
+        for name, command, status in s.lxc.wait():
+            if status != 0:
+                s.log.error('{0} failed for container {1}: {2}'
+                                .format(command, name, status))
 
-        # Replace status by new
-        s.clients = clients
+    ## LXC-containers and DNS stage handler
+    #
+    #  DNS daemon is reloaded after containers of batch are started, so it
+    #  serves veth interfaces of them.
+    def applyContainersDNS(s, added, removed, changed, robots):
 
-        s._sess.close()
+        s.applyContainers(added, removed, changed, robots)
+        s.applyDNS(added, removed, changed, robots)
 
     ## Empty virtual address filter method
     def empty_va_filter(s, clients):
 
         # Filter clients where does not have IP
-        return filter(lambda x: len(x['Virtual Address']) > 0, clients)
+        return filter(lambda x: len(x.virtual_address) > 0, clients)
 
 
+    ## Robots resolver method
+    #  @param session Database session.
+    #  @param anchors List of robot anchors.
+    #  @return Dictionary of robot records by anchor.
+    def resolveRobots(s, session, anchors):
+
+        # Get cached robots, missed robots are loaded by one query
+        robots = s.registry.resolve(session, anchors)
+        s.log.debug('Robot registry: {0}'.format(s.registry.stats()))
+
+        return robots
+
     ## Filter clients if robot does not exist
-    def robot_exist_filter(s, clients):
+    def robot_exist_filter(s, clients, robots):
 
         # Filter clients where does not have robot
-        return filter(lambda x: s._sess.query(Robot)\
-                        .filter_by(anchor=x['Common Name']).first(), clients)
+        return filter(lambda x: x.common_name in robots, clients)
 
     ## Client list to dictionary converter
     def list_to_dict(s, clients):
@@ -162,13 +363,23 @@ class Connector(Thread):
         # Format client list as dictionary
         dict_clients = {}
         for c in clients:
-            dict_clients[c['Common Name']] = c
+            dict_clients[c.common_name] = c
 
         return dict_clients
 
     ## Main cycle
     def run(s):
 
-        # Process inotify events
-        s.notifier.loop()
+        # Infinity cycle =)
+        while True:
+
+            # Wait for inotify events or coalesced update time
+            if s.notifier.check_events(s._timeout()):
+
+                # Process inotify events
+                s.notifier.read_events()
+                s.notifier.process_events()
+
+            # Update status after burst of events
+            s.reconcile()
 
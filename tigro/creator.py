@@ -3,12 +3,20 @@
 #  LXC-container creator package.
 #
 #  This package makes new containers.
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from db import DB_CONN_STRING, Container, NewContainer, Robot, Node
-from conf import CONFIG_TEMPLATE, ADDRESS_TEMPLATE, LXC_DIR
-from threading import Thread
-import time, os, logging
+from db import get_engine, session_scope, Container, NewContainer, Robot, Node, Listener
+from sqlalchemy import func, or_
+from addresses import AddressAllocator
+from conf import CONFIG_TEMPLATE, LXC_DIR, CREATOR_POLL_INTERVAL
+from conf import CREATOR_BATCH, CREATOR_IO_THREADS, CREATOR_MAX_ATTEMPTS, CREATOR_RETRY_DELAY
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Lock
+import datetime, time, os, logging
+
+## Creation queue notification channel
+#
+#  New task in 'new_container' table notify this channel with task id.
+#  Notification trigger is installed by database migrations.
+CREATOR_CHANNEL = 'tigro_new_container'
 
 ## Container creator thread
 #
@@ -16,132 +24,325 @@ import time, os, logging
 #  link to container item. 
 class Creator(Thread):
 
-    ## Database connection engine
-    db = create_engine(DB_CONN_STRING, client_encoding='utf8')
+    ## LXC-config template, read by first config writer
+    _template = None
 
-    ## Session class with private engine
-    Session = sessionmaker(bind=db)
+    ## LXC-config template read lock
+    _template_lock = Lock()
 
-    ## LXC-config template
-    template = file(CONFIG_TEMPLATE).read()
+    ## Reconnect delay in seconds
+    reconnect = 5
 
     ## The constructor
+    #  @param nodename Host node name in the database.
     def __init__(s, nodename):
         Thread.__init__(s)
 
         # Init logger
         s.log = logging.getLogger('Creator-{0}'.format(s.name))
 
-        # Create new database connection s._session
-        s._sess = s.Session()
-
         # Save node name
         s.nodename = nodename
 
-        # Count containers on node
-        s.count = len(s._sess.query(Node).\
-                        filter_by(name = nodename).\
-                        first().containers)
-        s._sess.close()
-
-    ## Container IP generation method
-    def genAddress(s, ident):
-        # Only two bytes for /16 network, one address reserved for server
-        assert (ident < 65535 - 1)
-        # Address generates by id as high and low bytes.
-        return ADDRESS_TEMPLATE.format(ident / 255, ident % 255)
-
-    ## Container creation method
-    def createContainer(s, robotid):
-
-        # Generate address for new container
-        robot = s._sess.query(Robot)\
-                    .join('container')\
-                    .filter_by(id = robotid).first()
-        robot.container.address = s.genAddress(robot.container.id)
-        s.log.debug('Gen address {0}'.format(robot.container.address))
-
-        # Set node id
-        robot.container.node = s._sess.query(Node).\
-                        filter_by(name = s.nodename).\
-                        first().id
-        s.log.debug('Append container to node {0}'.format(s.nodename))
-
-        # Commit changes
-        s._sess.add(robot.container)
-        s._sess.commit()
+        # Node id is resolved on first batch
+        s.nodeid = None
+
+        # Make creation queue listener
+        s.listener = Listener(get_engine(), [CREATOR_CHANNEL])
+
+        # Make config writers pool
+        s.pool = ThreadPool(CREATOR_IO_THREADS)
+
+        # Make container address allocator
+        s.addresses = AddressAllocator()
+
+        # Init statistics, latency is time from task enqueue to config written
+        s.stats = {'created': 0, 'wakeups': 0, 'last_latency': 0.0}
+
+    ## Containers creation method
+    #
+    #  Addresses and node of all containers are set in session transaction
+    #  with claimed tasks drop. Batch is made in one savepoint, when it fails
+    #  every container is made in its own savepoint, so one broken task does
+    #  not fail the others.
+    #  @param session Database session.
+    #  @param links Container ids of claimed tasks.
+    #  @return Tuple of list of (robot anchor, address, container id) tuples
+    #          and list of container ids of failed tasks.
+    def createContainers(s, session, links):
+
+        if not links:
+            # nothing to do
+            return [], []
+
+        # Get node id once
+        s.getNodeId(session)
+
+        # Get robots and containers of all tasks by single query
+        rows = session.query(Robot.anchor, Container)\
+                    .filter(Container.robot == Robot.id)\
+                    .filter(Container.id.in_(links))\
+                    .all()
+
+        if len(rows) < len(links):
+            # broken tasks are dropped
+            found = set(c.id for a, c in rows)
+            s.log.error('Containers of tasks have no robot: {0}'
+                            .format([l for l in links if l not in found]))
+
+        try:
+            # Make all containers at once
+            with session.begin_nested():
+                return s.assign(session, rows), []
+
+        except Exception as e:
+            s.log.warning('Batch of {0} containers failed, retry one by one: {1}'
+                            .format(len(rows), e))
+
+        configs, failed = [], []
+        for row in rows:
+            link = row[1].id
+            try:
+                with session.begin_nested():
+                    configs += s.assign(session, [row])
+
+            except Exception as e:
+                s.log.error('Container {0} creation failed: {1}'.format(link, e))
+                failed.append(link)
+
+        return configs, failed
+
+    ## Containers address assign method
+    #  @param session Database session.
+    #  @param rows List of (robot anchor, container) tuples.
+    #  @return List of (robot anchor, address, container id) tuples.
+    def assign(s, session, rows):
+
+        # Allocate addresses
+        addresses = s.addresses.allocate(session, len(rows))
+
+        # Set addresses and node id for new containers
+        configs = []
+        for anchor, container in rows:
+            container.address = addresses.pop()
+            container.node = s.nodeid
+            configs.append((anchor, container.address, container.id))
+            s.log.debug('Gen address {0} for {1}'.format(container.address, anchor))
+
+        s.log.debug('Append {0} containers to node {1}'
+                        .format(len(configs), s.nodename))
+
+        return configs
+
+    ## LXC-config template getter
+    @classmethod
+    def getTemplate(cls):
+
+        with cls._template_lock:
+            if cls._template is None:
+                cls._template = file(CONFIG_TEMPLATE).read()
+
+        return cls._template
+
+    ## Host node id getter
+    #  @param session Database session.
+    def getNodeId(s, session):
+
+        if s.nodeid is None:
+            s.nodeid = session.query(Node.id)\
+                            .filter_by(name = s.nodename).scalar()
+
+        return s.nodeid
+
+    ## Container config writer
+    #  @param item Tuple of robot anchor, container address and container id.
+    #  @return True when config saved.
+    def writeConfig(s, item):
+
+        anchor, address, link = item
+
+        # Create config from template
+        try:
+            config = s.getTemplate().format(anchor=anchor, address=address)
+
+        except IOError as e:
+            # task is retried when template is fixed
+            s.log.critical('Cannot read config template: {0}'.format(e))
+            return False
+
+        s.log.debug('Gen config with anchor={0} and address={1}'
+                        .format(anchor, address))
 
         # Create target directory
-        target = os.path.join(LXC_DIR, robot.anchor)
+        target = os.path.join(LXC_DIR, anchor)
         try:
             os.makedirs(target)
             s.log.debug('Created directory \'{0}\''.format(target))
 
         except OSError as e:
             s.log.critical('Cannot create directory: {0}'.format(e))
-        
-        # Create config from template
-        config = s.template.format(anchor=robot.anchor, address=robot.container.address)
-        s.log.debug('Gen config with anchor={0} and address={1}'
-                        .format(robot.anchor, robot.container.address))
 
         # Save config file
-        file(os.path.join(target, 'config'), 'w').write(config)
-        s.log.debug('Saved config file')
+        try:
+            file(os.path.join(target, 'config'), 'w').write(config)
+            s.log.debug('Saved config file')
 
-        # Inc count of containers
-        s.count += 1
+        except IOError as e:
+            s.log.critical('Cannot save config file: {0}'.format(e))
+            return False
 
-    ## Get task from database method
-    def getWork(s):
+        return True
 
-        # Get one work from db
-        work = s._sess.query(NewContainer).first()
+    ## Container configs writer
+    #
+    #  Configs are written by pool of threads. Containers with unwritten
+    #  config lose its address, so it is released, and get new one on retry.
+    #  @param session Database session.
+    #  @param configs List of config tuples of createContainers.
+    #  @return Tuple of list of written config tuples and list of container
+    #          ids of unwritten configs.
+    def writeConfigs(s, session, configs):
 
-        if not work:
-            # nothing to do
-            return None
+        if not configs:
+            # nothing to write
+            return [], []
 
-        # Save container link
-        link = work.link
-        s.log.debug('New task: conatiner.id={0}'.format(link))
+        results = s.pool.map(s.writeConfig, configs)
 
-        # Drop work from queue safely
-        try:
-            s._sess.delete(work)
-            s._sess.commit()
-        except:
-            # Rollback the changes
-            s._sess.rollback()
-            return None
-
-        # Return robot id from link or None if doesn't exist
-        robot = s._sess.query(Robot)\
-                    .filter_by(id = link).first()
-
-        if robot:
-            return int(robot.id)
-        else:
-            return None
+        written = [c for c, ok in zip(configs, results) if ok]
+        unwritten = [c[2] for c, ok in zip(configs, results) if not ok]
+
+        if unwritten:
+            s.log.error('Configs of containers {0} are not written'.format(unwritten))
+            session.query(Container).filter(Container.id.in_(unwritten))\
+                        .update({'address': None, 'node': None},
+                                synchronize_session = False)
+
+        return written, unwritten
+
+    ## Get tasks from database method
+    #
+    #  Task rows are locked in session transaction and dropped by finishWork,
+    #  so they are dropped from queue only when container creation committed.
+    #  Tasks locked by other creators, delayed and failed tasks are skipped.
+    #  Task age is measured by database clock, so enqueue time does not
+    #  depend on clocks of nodes.
+    #  @param session Database session.
+    #  @return List of (task, enqueue time) tuples of claimed tasks, empty
+    #          when queue is empty.
+    def getWork(s, session):
+
+        # Claim batch of unlocked works from db with its age in seconds
+        works = session.query(NewContainer, func.extract('epoch',
+                                func.clock_timestamp() - NewContainer.created))\
+                    .filter(or_(NewContainer.attempts == None,
+                                NewContainer.attempts < CREATOR_MAX_ATTEMPTS))\
+                    .filter(or_(NewContainer.retry == None,
+                                NewContainer.retry <= func.now()))\
+                    .order_by(NewContainer.id)\
+                    .with_for_update(skip_locked=True, of=NewContainer)\
+                    .limit(CREATOR_BATCH)\
+                    .all()
+
+        now = time.time()
+        tasks = [(work, now - float(age or 0)) for work, age in works]
+
+        if tasks:
+            s.log.debug('New tasks: container.id={0}'.format([t[0].link for t in tasks]))
+
+        return tasks
+
+    ## Finish claimed tasks method
+    #
+    #  Done tasks are dropped from queue. Failed tasks are delayed with
+    #  growing delay, so they leave head of queue, and kept as failed after
+    #  max count of attempts.
+    #  @param session Database session.
+    #  @param tasks List of (task, enqueue time) tuples.
+    #  @param failed List of container ids of failed tasks.
+    def finishWork(s, session, tasks, failed):
+
+        failed = set(failed)
+        for work, enqueued in tasks:
+
+            if work.link not in failed:
+                # done - drop from queue
+                session.delete(work)
+                continue
+
+            work.attempts = (work.attempts or 0) + 1
+            if work.attempts >= CREATOR_MAX_ATTEMPTS:
+                s.log.critical('Task of container {0} failed {1} times, it is left in queue'
+                                    .format(work.link, work.attempts))
+                continue
+
+            delay = CREATOR_RETRY_DELAY * 2 ** (work.attempts - 1)
+            work.retry = func.now() + datetime.timedelta(seconds = delay)
+            s.log.warning('Task of container {0} is delayed for {1}s'
+                                .format(work.link, delay))
+
+    ## Create containers of all queued tasks
+    def drain(s):
+
+        while True:
+            try:
+                # Create containers of task batch by one transaction
+                with session_scope() as session:
+                    tasks = s.getWork(session)
+                    configs, failed = s.createContainers(session,
+                                            [work.link for work, enqueued in tasks])
+
+                    # Write configs before tasks are dropped
+                    configs, unwritten = s.writeConfigs(session, configs)
+                    s.finishWork(session, tasks, failed + unwritten)
+                    tasks = [(work.link, enqueued) for work, enqueued in tasks]
+
+            except Exception as e:
+                # Claimed tasks are returned to queue
+                s.log.error('Container creation failed: {0}'.format(e))
+                return
+
+            if not tasks:
+                # queue is empty
+                return
+
+            # Save time from enqueue to ready
+            now = time.time()
+            enqueued = dict(tasks)
+            elapsed = 0.0
+            for anchor, address, link in configs:
+                elapsed = max(elapsed, now - enqueued[link])
+
+            s.stats['created'] += len(configs)
+            s.stats['last_latency'] = elapsed
+            s.log.info('Containers for robots {0} created in {1:.3f}s since enqueue'
+                            .format([c[0] for c in configs], elapsed))
 
     ## Main cycle
     def run(s):
 
+        subscribed = False
+
         # Infinity cycle =)
         while True:
-            # Create new database connection s._session
-            s._sess = s.Session()
-
-            # Get robot for creation task
-            robot = s.getWork()
+            try:
+                if not subscribed:
+                    # Subscribe before queue check, so no task is missed
+                    s.listener.connect()
+                    subscribed = True
 
-            if robot is not None:
-                # task exist - do create container
-                s.createContainer(robot)
-                s.log.info('Container for robot {0} created'.format(robot))
+                else:
+                    # Wait for new tasks, poll interval is a fallback for
+                    # lost notifications
+                    s.listener.wait(CREATOR_POLL_INTERVAL)
+                    s.stats['wakeups'] += 1
 
-            else:
-                # waiting for other tasks
-                s._sess.close()
-                time.sleep(5 + s.count)
+            except Exception as e:
+                s.log.error('Creator listener failed: {0}'.format(e))
+                s.listener.close()
+                subscribed = False
+                time.sleep(s.reconnect)
+                continue
 
+            # Create containers of queued tasks
+            s.drain()
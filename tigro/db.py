@@ -3,10 +3,19 @@
 #  TIGRO database tables defines.
 #
 #  This package provide declarative tables for working with TIGRO database.
-from sqlalchemy import Column, Integer, String, Sequence, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Boolean, LargeBinary, DateTime
+from sqlalchemy import Sequence, ForeignKey
+from sqlalchemy import create_engine, event, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import LRUCache
 from conf import DB_DRIVER, DB_USER, DB_PASSWORD, DB_HOST, DB_NAME 
+from conf import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from conf import DB_PRE_PING, DB_STATEMENT_CACHE
+from contextlib import contextmanager
+from threading import Lock
+import select, time
 
 ## Database connection string
 #
@@ -17,6 +26,115 @@ DB_CONN_STRING = '{0}://{1}:{2}@{3}/{4}'.format(
 ## Declarative database synonym
 Base = declarative_base()
 
+## Connection pool statistics
+#
+#  Count of opened connections, connections checked out now, total count of
+#  checkouts and time spent waiting for free connection in seconds.
+pool_stats = {'connections': 0, 'checked_out': 0, 'checkouts': 0,
+              'wait_time': 0.0, 'max_wait_time': 0.0}
+
+## Connection pool statistics lock
+_stats_lock = Lock()
+
+## Connection pool with checkout statistics
+class InstrumentedPool(QueuePool):
+
+    ## Get connection from pool
+    def _do_get(s):
+
+        started = time.time()
+        try:
+            return QueuePool._do_get(s)
+
+        finally:
+            wait = time.time() - started
+            with _stats_lock:
+                pool_stats['checkouts'] += 1
+                pool_stats['wait_time'] += wait
+                pool_stats['max_wait_time'] = max(pool_stats['max_wait_time'], wait)
+
+## Pool events handler
+def _pool_event(name, change):
+
+    def handler(*args):
+        with _stats_lock:
+            pool_stats[name] += change
+
+    return handler
+
+## Shared database engine
+_engine = None
+
+## Shared database engine lock
+_engine_lock = Lock()
+
+## Thread local database session registry
+#
+#  Components use current session of thread, sessions are opened and closed
+#  by session_scope.
+Session = scoped_session(sessionmaker())
+
+## Database engine factory
+#
+#  Engine is made on first call and shared by all threads of process.
+#  @return Database connection engine.
+def get_engine():
+
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(DB_CONN_STRING, client_encoding='utf8',
+                                    poolclass = InstrumentedPool,
+                                    pool_size = DB_POOL_SIZE,
+                                    max_overflow = DB_MAX_OVERFLOW,
+                                    pool_timeout = DB_POOL_TIMEOUT,
+                                    pool_recycle = DB_POOL_RECYCLE,
+                                    pool_pre_ping = DB_PRE_PING,
+                                    execution_options = {'compiled_cache':
+                                                LRUCache(DB_STATEMENT_CACHE)})
+            Session.configure(bind=_engine)
+
+            # Count opened and checked out connections
+            event.listen(_engine, 'connect', _pool_event('connections', 1))
+            event.listen(_engine, 'checkout', _pool_event('checked_out', 1))
+            event.listen(_engine, 'checkin', _pool_event('checked_out', -1))
+
+    return _engine
+
+## Register rollback handler of current session
+#
+#  Components changing in-memory state together with database rows register
+#  handler restoring the state, handlers are called in reverse order when
+#  session_scope rolls back.
+#  @param handler Callable without arguments.
+def on_rollback(handler):
+    Session().info.setdefault('rollback', []).append(handler)
+
+## Unit of work session scope
+#
+#  Session is committed on exit and rolled back on exception, then closed.
+#  Components called inside scope use the same session through Session.
+@contextmanager
+def session_scope():
+
+    get_engine()
+    session = Session()
+    try:
+        yield session
+        session.commit()
+
+    except:
+        session.rollback()
+
+        # Restore in-memory state of rolled back changes
+        for handler in reversed(session.info.pop('rollback', [])):
+            handler()
+        raise
+
+    finally:
+        Session.remove()
+
 ## TIGRO-node server table
 class Node(Base):
 
@@ -27,7 +145,7 @@ class Node(Base):
     id = Column(Integer, Sequence('node_id_seq'), primary_key=True)
 
     ## Node name
-    name = Column(String)
+    name = Column(String, index=True, unique=True)
 
     ## Node address
     address = Column(String)
@@ -51,7 +169,7 @@ class Robot(Base):
     name = Column(String)
 
     ## Anchor string
-    anchor = Column(String)
+    anchor = Column(String, index=True, unique=True)
 
     ## Web-socket port
     wsport = Column(Integer)
@@ -75,7 +193,7 @@ class Container(Base):
     robot = Column(Integer, ForeignKey('robot.id'))
 
     ## Relationship link to node item
-    node = Column(Integer, ForeignKey('node.id'))
+    node = Column(Integer, ForeignKey('node.id'), index=True)
 
     ## Container IP address
     address = Column(String)
@@ -95,6 +213,15 @@ class NewContainer(Base):
     ## Relationship link to container item
     link = Column(Integer, ForeignKey('container.id'))
 
+    ## Task enqueue time
+    created = Column(DateTime, server_default=func.now())
+
+    ## Count of failed creation attempts
+    attempts = Column(Integer, server_default='0')
+
+    ## Time of next attempt of failed task
+    retry = Column(DateTime)
+
 ## Connection status table
 class Connection(Base):
 
@@ -108,16 +235,16 @@ class Connection(Base):
     container = Column(Integer, ForeignKey('container.id'))
 
     ## Relationship link to node item
-    node = Column(Integer, ForeignKey('node.id'))
+    node = Column(Integer, ForeignKey('node.id'), index=True)
 
-    ## Connection since string
-    since = Column(String)
+    ## Connection since time
+    since = Column(DateTime)
 
     ## Client virtual address
     vaddress = Column(String)
 
     ## Client real address
-    raddress = Column(String)
+    raddress = Column(String, index=True)
 
     ## Bytes sent
     sent = Column(Integer)
@@ -125,3 +252,153 @@ class Connection(Base):
     ## Bytes received
     received = Column(Integer)
 
+## Connection throughput table
+class ConnectionStats(Base):
+
+    ## Table name
+    __tablename__ = 'connection_stats'
+
+    ## Primary key
+    id = Column(Integer, Sequence('connection_stats_id_seq'), primary_key=True)
+
+    ## Relationship link to node item
+    node = Column(Integer, ForeignKey('node.id'))
+
+    ## Relationship link to container item
+    container = Column(Integer, ForeignKey('container.id'), index=True)
+
+    ## Sample time
+    time = Column(DateTime, index=True)
+
+    ## Bytes sent since connect
+    sent = Column(BigInteger)
+
+    ## Bytes received since connect
+    received = Column(BigInteger)
+
+    ## Average sent bytes per second since previous sample
+    sent_rate = Column(Float)
+
+    ## Average received bytes per second since previous sample
+    received_rate = Column(Float)
+
+## WebSocket port allocation table
+class WsPort(Base):
+
+    ## Table name
+    __tablename__ = 'ws_port'
+
+    ## Primary key
+    id = Column(Integer, Sequence('ws_port_id_seq'), primary_key=True)
+
+    ## Relationship link to node item
+    node = Column(Integer, ForeignKey('node.id'))
+
+    ## WebSocket port number
+    port = Column(Integer)
+
+    ## Relationship link to last robot item used port
+    robot = Column(Integer, ForeignKey('robot.id'))
+
+    ## Port is used by connected robot
+    active = Column(Boolean)
+
+## Container address map table
+class AddressMap(Base):
+
+    ## Table name
+    __tablename__ = 'address_map'
+
+    ## Primary key
+    id = Column(Integer, Sequence('address_map_id_seq'), primary_key=True)
+
+    ## Network address with prefix length
+    network = Column(String, unique=True)
+
+    ## Bitmap of used addresses, one bit per host address
+    bitmap = Column(LargeBinary)
+
+    ## Free list of released address indexes, big endian 32-bit integers
+    free = Column(LargeBinary)
+
+    ## Index of first never used address
+    hint = Column(Integer)
+
+## Released container address queue
+#
+#  Addresses of deleted containers are queued by database trigger and
+#  released by address allocator.
+class AddressRelease(Base):
+
+    ## Table name
+    __tablename__ = 'address_release'
+
+    ## Primary key
+    id = Column(Integer, Sequence('address_release_id_seq'), primary_key=True)
+
+    ## Released container IP address
+    address = Column(String)
+
+## Database notifications listener
+#
+#  This class wait for PostgreSQL NOTIFY messages on given channels. Listener
+#  holds own connection in autocommit mode, it is made by engine dialect
+#  out of engine pool, so autocommit connection is never used by sessions.
+class Listener:
+
+    ## The constructor
+    #  @param engine Database connection engine.
+    #  @param channels List of notification channels.
+    def __init__(s, engine, channels):
+
+        # Save engine and channels
+        s.engine = engine
+        s.channels = channels
+
+        # Connection will be opened on first wait
+        s._conn = None
+
+    ## Open connection and subscribe to channels
+    def connect(s):
+
+        dialect = s.engine.dialect
+        cargs, cparams = dialect.create_connect_args(s.engine.url)
+        s._conn = dialect.connect(*cargs, **cparams)
+        s._conn.autocommit = True
+
+        cursor = s._conn.cursor()
+        for channel in s.channels:
+            cursor.execute('LISTEN {0}'.format(channel))
+        cursor.close()
+
+    ## Close listener connection
+    def close(s):
+
+        if s._conn is not None:
+            try:
+                s._conn.close()
+            except Exception:
+                pass
+            s._conn = None
+
+    ## Wait for notifications
+    #  @param timeout Max time to wait in seconds, None for infinity.
+    #  @return List of (channel, payload) tuples.
+    def wait(s, timeout = None):
+
+        if s._conn is None:
+            s.connect()
+
+        # Wait for data on connection socket
+        conn = s._conn
+        if not conn.notifies and \
+                select.select([conn], [], [], timeout) == ([], [], []):
+            # timeout
+            return []
+
+        # Read received notifications
+        conn.poll()
+        notifies = [(n.channel, n.payload) for n in conn.notifies]
+        del conn.notifies[:]
+
+        return notifies
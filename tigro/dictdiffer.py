@@ -12,51 +12,72 @@
 #  (2) items removed
 #  (3) keys same in both but changed values
 #  
+#  All results are calculated once by constructor. Changed values can be
+#  split by declared fields to values with changed identity fields and
+#  values with changed metric fields only. Values which are the same
+#  object in both dictionaries are not compared, so values must never be
+#  changed in place: changed value is replaced by new object.
+#
 class DictDiffer:
 
     ## The constructor
     #  @param current_dict The current dictionary for matching.
     #  @param past_dict The old dictionary for matching.
-    def __init__(s, current_dict, past_dict):
+    #  @param identity Names of value fields identifying item.
+    #  @param metrics Names of value fields measured by item.
+    #  @param hint Keys which values may be replaced, all keys by default.
+    #         Values of other keys are taken as not changed.
+    def __init__(s, current_dict, past_dict, identity = (), metrics = (), hint = None):
 
         # Save dictionaries on self
         s.current_dict, s.past_dict = current_dict, past_dict
 
-        # Save dictionaries sets on self
-        s.set_current, s.set_past = set(current_dict.keys()), set(past_dict.keys())
+        # Save declared fields on self
+        s.identity, s.metrics = tuple(identity), tuple(metrics)
+
+        # Find added and removed keys by key views
+        current_keys, past_keys = current_dict.viewkeys(), past_dict.viewkeys()
+        added_set = current_keys - past_keys
+        removed_set = past_keys - current_keys
+
+        # Save dicts of added and removed items
+        s.added = { i : current_dict[i] for i in added_set }
+        s.removed = { i : past_dict[i] for i in removed_set }
+
+        # Keys same in both dictionaries, narrowed by change hint
+        if hint is None:
+            intersect = current_keys & past_keys
+        else:
+            intersect = [i for i in hint if i in current_dict and i in past_dict]
 
-        # Save current dictionary intersection on self
-        s.intersect = s.set_current.intersection(s.set_past)
+        # Find changed items, split by changed fields
+        before, after = {}, {}
+        s.changed_identity, s.changed_metrics = ({}, {}), ({}, {})
 
-    ## Items added calculate method
-    @property
-    def added(s):
+        for i in intersect:
+            past, current = past_dict[i], current_dict[i]
 
-        # Find added items
-        added_set = s.set_current - s.intersect 
+            if past is current or past == current:
+                # value not changed
+                continue
 
-        # Return dict of added items
-        return { i : s.current_dict[i] for i in added_set }
+            before[i], after[i] = past, current
 
-    ## Items removed calculate method
-    @property
-    def removed(s):
+            if s._differ(past, current, s.identity):
+                s.changed_identity[0][i], s.changed_identity[1][i] = past, current
 
-        # Find removed items
-        removed_set = s.set_past - s.intersect
+            elif s._differ(past, current, s.metrics):
+                s.changed_metrics[0][i], s.changed_metrics[1][i] = past, current
 
-        # Return dict of removed items
-        return { i : s.past_dict[i] for i in removed_set }
+        # Save dict of changed items (before, after)
+        s.changed = (before, after)
 
-    ## Items changed calculate method
-    @property
-    def changed(s):
+    ## Compare fields of values
+    #  @return True when any of fields differ.
+    def _differ(s, past, current, fields):
 
-        # Find changed items
-        changed_set = set(o for o in s.intersect if s.past_dict[o] != s.current_dict[o]) 
+        for name in fields:
+            if getattr(past, name) != getattr(current, name):
+                return True
 
-        # Return dict of changed items (before, after)
-        return (
-            { i : s.past_dict[i] for i in changed_set },
-            { i : s.current_dict[i] for i in changed_set }
-        )
+        return False
@@ -3,10 +3,18 @@
 #  TIGRO DNS daemon configurator.
 #
 #  This package provide interface for DNS daemon.
-from conf import DNSD_CONFIG
+from conf import DNSD_CONFIG, DNSD_PIDFILE
 from subprocess import Popen
-from db import Robot
-import io
+import io, os, signal, tempfile, time
+
+## DNS record name of robot
+#
+#  DNS names are case insensitive, records are keyed by lowercase names as
+#  looked up by embedded responder.
+#  @param anchor Robot anchor.
+#  @return Record name 'lxc-<anchor>'.
+def record_name(anchor):
+    return 'lxc-{0}'.format(anchor).lower()
 
 ## DNS daemon class
 #
@@ -14,30 +22,33 @@ import io
 class DNSDaemon:
 
     ## The constructor
-    def __init__(s, logger, session):
+    def __init__(s, logger):
 
         # Save logger
         s.log = logger
 
-        # Save database connection session
-        s.db = session
-
         # Init empty records list
         s.records = {}
         
         s._restart = False
 
+        # Last written config content
+        s._config = None
+
+        # Init reload statistics
+        s.stats = {'reloads': 0, 'restarts': 0, 'skipped': 0,
+                   'last_reload_time': 0.0, 'total_reload_time': 0.0}
+
     ## Append address to config
-    def append(s, clients):
+    #  @param clients Dictionary of clients by anchor.
+    #  @param robots Dictionary of robot records by anchor.
+    def append(s, clients, robots):
 
         # Create dns records for all connections
         for key in clients:
 
             # Get robot by anchor
-            r = s.db.query(Robot)\
-                            .join('container')\
-                            .filter(Robot.anchor==key)\
-                            .first()
+            r = robots.get(key)
 
             if not r:
                 # robot doesn't exist - skip
@@ -46,7 +57,7 @@ class DNSDaemon:
 
             # Append record
             s.log.info("Create DNS record for: lxc-{0}".format(key))
-            s.records['lxc-{0}'.format(key)] = r.container.address
+            s.records[record_name(key)] = r.address
 
             # Up restart flag
             s._restart = True
@@ -54,29 +65,27 @@ class DNSDaemon:
     ## Remove address from config
     def delete(s, clients):
 
-        # Create dns records for all connections
+        # Drop dns records for all connections
         for key in clients:
 
-            # Get robot by anchor
-            r = s.db.query(Robot)\
-                            .join('container')\
-                            .filter(Robot.anchor==key)\
-                            .first()
-
-            if not r:
-                # robot doesn't exist - skip
-                s.log.critical('Robot {0} does NOT exist'.format(key))
+            if record_name(key) not in s.records:
+                # record doesn't exist - skip
+                s.log.critical('DNS record lxc-{0} does NOT exist'.format(key))
                 continue
-            
+
             # Drop record
             s.log.info("Delete DNS record for: lxc-{0}".format(key))
-            s.records.pop('lxc-{0}'.format(key))
+            s.records.pop(record_name(key))
 
             # Up restart flag
             s._restart = True
 
-    ## Restart DNS daemon with new config file
-    def restart(s):
+    ## Reload DNS daemon with new hosts file
+    #
+    #  Hosts file is rewritten only when its content changed, then running
+    #  daemon is signalled by SIGHUP to re-read it. Daemon is restarted when
+    #  it is not running.
+    def reload(s):
 
         if not s._restart:
             # No records changed
@@ -85,30 +94,105 @@ class DNSDaemon:
         # Down restart flag
         s._restart = False
 
+        started = time.time()
+
         # Generate new config
-        config = s._gen_config()
+        try:
+            changed = s._gen_config()
+
+        except (IOError, OSError) as e:
+            # Up restart flag again, config is written by next reload
+            s.log.critical('Can not write DNSD config file: {0}'.format(e))
+            s._restart = True
+            return
+
+        if not changed:
+            # Config content not changed
+            s.stats['skipped'] += 1
+            return
+
+        # Get running daemon
+        pid = s._pid()
+
+        try:
+            if pid is None:
+                raise OSError('DNS daemon pid file is not readable')
+
+            # Reload daemon
+            os.kill(pid, signal.SIGHUP)
+            s.stats['reloads'] += 1
+
+        except OSError as e:
+            s.log.warning('Can not reload DNS daemon: {0}'.format(e))
+            s.restart()
+
+        # Save reload latency
+        s.stats['last_reload_time'] = time.time() - started
+        s.stats['total_reload_time'] += s.stats['last_reload_time']
+        s.log.debug('DNS daemon reloaded in {0:.3f}s with hosts: {1}'
+                        .format(s.stats['last_reload_time'], DNSD_CONFIG))
+
+    ## Restart DNS daemon
+    def restart(s):
 
         # Restart daemon
         dns = Popen(['/etc/init.d/dnsmasq', 'restart'])
         dns.wait()
-        s.log.debug('DNS daemon restarted with hosts: {0}'.format(config))
+        s.stats['restarts'] += 1
+        s.log.debug('DNS daemon restarted with hosts: {0}'.format(DNSD_CONFIG))
+
+    ## Running DNS daemon pid
+    #  @return Process id or None.
+    def _pid(s):
+
+        try:
+            with open(DNSD_PIDFILE) as pidfile:
+                return int(pidfile.read().strip())
+
+        except (IOError, ValueError):
+            return None
 
     ## DNS config file generator
+    #  @return True when config file changed.
+    #  @throw IOError, OSError when config file can not be written.
     def _gen_config(s):
 
-        # Open config file
-        try:
-            config = io.open(DNSD_CONFIG, 'w')
+        # Make config content
+        config = u''.join(u'{0}  {1}\n'.format(s.records[name], name)
+                            for name in sorted(s.records))
 
-        except OSError as e:
-            s.log.critical('Can not open DNSD config file: {0}'.format(e))
+        if s._config is None:
+            # Read config written before start
+            try:
+                with io.open(DNSD_CONFIG, 'r') as current:
+                    s._config = current.read()
 
-        s.log.debug('DNS config open file: {0}'.format(config.name))
+            except IOError:
+                s._config = u''
 
-        # For any record from records
-        for name in s.records:
-            # Write formatted string
-            config.write(unicode('{0}  {1}\n'.format(s.records[name], name)))
-            s.log.debug('DNS config write item: {0}'.format(name))
+        if config == s._config:
+            # nothing to write
+            return False
 
-        return config.name
+        # Write config to temporary file and replace old config by it
+        fd, path = tempfile.mkstemp(dir = os.path.dirname(DNSD_CONFIG),
+                                    prefix = '.lxc-hosts.')
+        try:
+            with io.open(fd, 'w') as tmp:
+                tmp.write(config)
+            os.chmod(path, 0644)
+            os.rename(path, DNSD_CONFIG)
+            path = None
+
+        finally:
+            if path is not None:
+                # Drop temporary file of failed write
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+        s._config = config
+        s.log.debug('DNS config write items: {0}'.format(len(s.records)))
+
+        return True
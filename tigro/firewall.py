@@ -3,65 +3,472 @@
 #  TIGRO firewall package.
 #
 #  This package makes firewall rules for LXC-containers.
-from netfilter.rule import Rule, Match, Target
-from netfilter.table import Table
-from db import Robot, DB_CONN_STRING
-from conf import GATEWAY_ADDRESS, WS_START_PORT
+from conf import GATEWAY_ADDRESS, WS_START_PORT, WS_END_PORT
+from conf import FIREWALL_BUCKETS, FIREWALL_BACKEND, FIREWALL_RETRIES
+from subprocess import Popen, PIPE
+from collections import deque
+from abc import ABCMeta, abstractmethod
+from db import Session, Robot, WsPort, on_rollback
+
+## WebSocket port allocator
+#
+#  Used ports are marked in bitmap, released ports are kept in FIFO free list
+#  and never used ports are taken from the top of range. Robot gets its last
+#  port back when nobody took it meanwhile, such port stays in free list and
+#  is skipped when popped, so free list holds every port once at most.
+#  Allocations are saved in 'ws_port' table of node, so robots keep its ports
+#  after restart. No robot is connected at start, so all saved ports of node
+#  are released by constructor. Changes of rolled back session are undone.
+class PortAllocator:
 
-## WebSocket port generator
-class PortGenerator:
+    ## The constructor
+    #  @param nodeid Host node id.
+    #  @param start First port of range.
+    #  @param end Last port of range.
+    def __init__(s, nodeid, start = WS_START_PORT, end = WS_END_PORT):
+
+        # Save node
+        s.nodeid = nodeid
+
+        # Save port range
+        s.start = start
+        s.end = end
+
+        # Init empty bitmap and free list with its members
+        s._used = bytearray(end - start + 1)
+        s._free = deque()
+        s._queued = set()
+        s._next = start
+
+        # Port by connected robot, last robot by port and last port by robot
+        s.ports = {}
+        s._owner = {}
+        s._last = {}
+
+        # Release ports of robots connected before stop
+        Session.query(WsPort).filter_by(node = nodeid, active = True)\
+                        .update({'active': False}, synchronize_session = False)
+
+        # Load saved allocations
+        for item in Session.query(WsPort).filter_by(node = nodeid).order_by(WsPort.id):
+            if not start <= item.port <= end:
+                continue
+
+            s._owner[item.port] = item.robot
+            s._last[item.robot] = item.port
+            s._next = max(s._next, item.port + 1)
+            s._enqueue(item.port)
+
+    ## Allocate port for robot
+    #  @param robot Robot id.
+    #  @return Port number.
+    def allocate(s, robot):
+
+        if robot in s.ports:
+            # robot already has port
+            return s.ports[robot]
+
+        # Try last port of robot
+        port = s._last.get(robot)
+
+        # Save state for undo
+        owner = s._owner.get(port) if port is not None else None
+        last = port
+        fresh = False
+
+        if port is None or s._used[port - s.start]:
+            port = None
+
+            # Take released port, ports taken back by its robots are skipped
+            while s._free and port is None:
+                port = s._free.popleft()
+                s._queued.discard(port)
+                if s._used[port - s.start]:
+                    port = None
+
+            if port is None:
+                # take never used port
+                if s._next > s.end:
+                    raise RuntimeError('WebSocket ports exhausted')
+                port = s._next
+                s._next += 1
+                fresh = True
+
+            owner = s._owner.get(port)
+
+        # Mark port as used
+        s._used[port - s.start] = 1
+        s.ports[robot] = port
+
+        ## Allocation undo
+        def undo():
+            s._used[port - s.start] = 0
+            s.ports.pop(robot, None)
+
+            # Restore last robot of port and last port of robots
+            s._last.pop(robot, None)
+            if last is not None:
+                s._last[robot] = last
+            if owner is None:
+                s._owner.pop(port, None)
+            else:
+                s._owner[port] = owner
+                s._last[owner] = port
+
+            # Return port to its source
+            if fresh:
+                s._next = port
+            elif port not in s._queued:
+                s._free.appendleft(port)
+                s._queued.add(port)
+
+        on_rollback(undo)
+
+        # Save allocation
+        if port in s._owner:
+            s._last.pop(s._owner[port], None)
+            Session.query(WsPort).filter_by(node = s.nodeid, port = port)\
+                            .update({'robot': robot, 'active': True},
+                                    synchronize_session = False)
+        else:
+            Session.add(WsPort(node = s.nodeid, port = port, robot = robot, active = True))
+
+        s._owner[port] = robot
+        s._last[robot] = port
+
+        return port
+
+    ## Release port of robot
+    #  @param robot Robot id.
+    def release(s, robot):
+
+        port = s.ports.pop(robot, None)
+
+        if port is None:
+            # nothing to release
+            return
+
+        # Mark port as free
+        s._used[port - s.start] = 0
+        s._enqueue(port)
+
+        ## Release undo, port stays in free list and is skipped when popped
+        def undo():
+            s._used[port - s.start] = 1
+            s.ports[robot] = port
+
+        on_rollback(undo)
+
+        # Save release
+        Session.query(WsPort).filter_by(node = s.nodeid, port = port)\
+                        .update({'active': False}, synchronize_session = False)
+
+    ## Put port to free list once
+    def _enqueue(s, port):
+
+        if port not in s._queued:
+            s._free.append(port)
+            s._queued.add(port)
+
+## Firewall backend interface
+#
+#  Backend makes NAT rules for robots. Robot is described by dictionary with
+#  keys: 'anchor', 'vaddress' (client virtual address), 'address' (container
+#  address) and 'wsport' (external WebSocket port). Changes are applied by
+#  batches: all or nothing. Backends implement all abstract methods.
+class FirewallBackend(object):
+    __metaclass__ = ABCMeta
 
     ## The constructor
-    def __init__(s, start_port):
+    #  @param logger Logger instance.
+    #  @param dry_run Only render rules, do not touch kernel tables.
+    def __init__(s, logger, dry_run = False):
+
+        # Save logger
+        s.log = logger
+
+        # Save dry run flag
+        s.dry_run = dry_run
+
+    ## Purge NAT rules and make initial tables
+    @abstractmethod
+    def setup(s):
+        pass
+
+    ## Initial tables renderer
+    @abstractmethod
+    def renderSetup(s):
+        pass
+
+    ## Changes renderer
+    #  @param append Dictionary of new robots by anchor.
+    #  @param delete Dictionary of deleted robots by anchor.
+    @abstractmethod
+    def render(s, append, delete):
+        pass
+
+    ## Apply changes in one transaction
+    #  @param append Dictionary of new robots by anchor.
+    #  @param delete Dictionary of deleted robots by anchor.
+    #  @return True when changes applied.
+    @abstractmethod
+    def apply(s, append, delete):
+        pass
+
+    ## Check that robot rules are not in kernel tables
+    #
+    #  Rules may be removed outside of TIGRO, for example by flush of NAT
+    #  table, so its delete fails.
+    #  @param robot Robot description.
+    #  @return True when no rule of robot is found.
+    @abstractmethod
+    def missing(s, robot):
+        pass
+
+## IPTables firewall backend
+#
+#  PREROUTING has only one jump to 'tigro' chain. It dispatches packets from
+#  clients (tun0), from containers (veth.*) and to WebSocket ports to bucket
+#  chains, where bucket is selected by a few bits of client address, container
+#  address or port. Robot rules are placed to its buckets, so per-packet
+#  matching walks about 1/FIREWALL_BUCKETS of robot rules. Changes are applied
+#  by iptables-restore transaction.
+class IptablesBackend(FirewallBackend):
+
+    ## The constructor
+    #  @param logger Logger instance.
+    #  @param dry_run Only render rules, do not touch NAT table.
+    def __init__(s, logger, dry_run = False):
+        FirewallBackend.__init__(s, logger, dry_run)
+
+        # Save count of buckets
+        s.buckets = FIREWALL_BUCKETS
+        assert 0 < s.buckets <= 64 and s.buckets & (s.buckets - 1) == 0
 
-        # Init zero count of ports
-        s.ports = 0
+    ## Purge NAT table and make dispatch chains
+    def setup(s):
 
-        # Save start port
-        s.start = start_port
+        if s.dry_run:
+            return
 
-    def gen(s):
+        from netfilter.table import Table
 
-        # Inc count of ports
-        s.ports += 1
+        s.log.debug('Init NAT firewall table')
+        s.table = Table('nat')
+        s.table.flush_chain()
+        s.table.delete_chain()
+
+        if not s._restore(s.renderSetup()):
+            raise RuntimeError('Can not init NAT dispatch chains')
+
+    ## Address bucket number
+    #
+    #  Bits 2..7 of last octet are used, low bits are the same for many
+    #  clients in OpenVPN net30 topology.
+    def _address_bucket(s, address):
+        return (int(address.split('.')[3]) >> 2) & (s.buckets - 1)
+
+    ## WebSocket port bucket number
+    def _port_bucket(s, port):
+        return port & (s.buckets - 1)
+
+    ## Robot rules maker
+    #  @return List of (chain, rule) tuples.
+    def _rules(s, robot):
+        from netfilter.rule import Rule, Match, Target
+
+        vaddress, address = robot['vaddress'], robot['address']
+
+        # Make client firewall rules
+        client_rule = Rule(
+            protocol     = 'tcp',
+            destination  = address,
+            source       = vaddress,
+            in_interface = 'tun0',
+            jump         = Target('DNAT', '--to-destination {0}'.format(address))
+        )
+
+        # Make container firewall rules
+        container_rule = Rule(
+            protocol     = 'tcp',
+            source       = address,
+            destination  = vaddress,
+            in_interface = 'veth.{0}'.format(robot['anchor']),
+            jump         = Target('DNAT', '--to-destination {0}'.format(vaddress))
+        )
+        master_rule = Rule(
+            protocol     = 'tcp',
+            source       = address,
+            destination  = GATEWAY_ADDRESS,
+            in_interface = 'veth.{0}'.format(robot['anchor']),
+            matches      = [ Match('tcp', '--dport 11311') ],
+            jump         = Target('DNAT', '--to-destination {0}:11311'.format(vaddress))
+        )
+
+        websock_rule = Rule(
+            protocol     = 'tcp',
+            matches      = [ Match('tcp', '--dport {0}'
+                                            .format(robot['wsport'])) ],
+            jump         = Target('DNAT', '--to-destination {0}:9090'
+                                            .format(address))
+        )
+
+        return [
+            ('tigro-c{0}'.format(s._address_bucket(vaddress)), client_rule),
+            ('tigro-v{0}'.format(s._address_bucket(address)), container_rule),
+            ('tigro-v{0}'.format(s._address_bucket(address)), master_rule),
+            ('tigro-w{0}'.format(s._port_bucket(robot['wsport'])), websock_rule) ]
+
+    ## Dispatch chains renderer
+    #  @return NAT table dispatch chains in iptables-restore format.
+    def renderSetup(s):
+
+        lines = ['*nat']
+
+        # Declare chains
+        chains = ['tigro', 'tigro-client', 'tigro-veth', 'tigro-ws']
+        for i in range(0, s.buckets):
+            chains += ['tigro-c{0}'.format(i), 'tigro-v{0}'.format(i),
+                       'tigro-w{0}'.format(i)]
+        lines += [':{0} - [0:0]'.format(chain) for chain in chains]
+
+        # Jump from PREROUTING to TIGRO chains
+        lines += [
+            '-A PREROUTING -p tcp -j tigro',
+            '-A tigro -i tun0 -j tigro-client',
+            '-A tigro -i veth.+ -j tigro-veth',
+            '-A tigro ! -f -j tigro-ws' ]
+
+        # Dispatch to buckets
+        mask = (s.buckets - 1) << 2
+        for i in range(0, s.buckets):
+            lines.append('-A tigro-client -s 0.0.0.{0}/0.0.0.{1} -j tigro-c{2}'
+                            .format(i << 2, mask, i))
+            lines.append('-A tigro-veth -s 0.0.0.{0}/0.0.0.{1} -j tigro-v{2}'
+                            .format(i << 2, mask, i))
+            lines.append('-A tigro-ws -m u32 --u32 "0>>22&0x3C@0&0x{0:X}=0x{1:X}" -j tigro-w{2}'
+                            .format(s.buckets - 1, i, i))
+
+        lines.append('COMMIT')
+        return '\n'.join(lines) + '\n'
+
+    ## Changes renderer
+    #  @return NAT table changes in iptables-restore format.
+    def render(s, append, delete):
+
+        lines = ['*nat']
+
+        # Delete rules first
+        for key in sorted(delete):
+            for chain, rule in s._rules(delete[key]):
+                lines.append(' '.join(['-D', chain] + rule.specbits()))
+
+        # Append new rules
+        for key in sorted(append):
+            for chain, rule in s._rules(append[key]):
+                lines.append(' '.join(['-A', chain] + rule.specbits()))
+
+        lines.append('COMMIT')
+        return '\n'.join(lines) + '\n'
+
+    ## Apply changes by one iptables-restore transaction
+    def apply(s, append, delete):
+
+        # Render changes
+        rules = s.render(append, delete)
+        s.log.debug('Apply NAT rules:\n{0}'.format(rules))
+
+        if s.dry_run:
+            return True
+
+        return s._restore(rules)
+
+    ## Check robot rules by 'iptables -C'
+    def missing(s, robot):
+
+        if s.dry_run:
+            return False
+
+        for chain, rule in s._rules(robot):
+            check = Popen(['iptables', '-t', 'nat', '-C', chain] + rule.specbits(),
+                          stderr=PIPE)
+            check.communicate()
+            if check.returncode == 0:
+                return False
+
+        return True
+
+    ## Run iptables-restore transaction
+    #  @return True when rules applied.
+    def _restore(s, rules):
+
+        restore = Popen(['iptables-restore', '--noflush'],
+                        stdin=PIPE, stderr=PIPE)
+        error = restore.communicate(rules)[1]
+
+        if restore.returncode != 0:
+            s.log.critical('Can not apply NAT rules: {0}'.format(error))
+            return False
+
+        return True
+
+## Firewall backends by name
+backends = {'iptables': IptablesBackend}
 
-        return  s.start + s.ports
+## Make firewall backend by name
+#  @param name Backend name.
+#  @param logger Logger instance.
+#  @param dry_run Only render rules, do not touch kernel tables.
+def make_backend(name, logger, dry_run = False):
+
+    if name == 'nftables' and name not in backends:
+        # load on demand
+        from nft import NftablesBackend
+        backends[name] = NftablesBackend
+
+    return backends[name](logger, dry_run)
 
 ## Firewall controller class
+#
+#  Rule changes are collected by createRules and deleteRules and applied by
+#  applyRules in one firewall backend transaction.
 class Firewall:
 
     ## The constructor
-    def __init__(s, logger, session):
+    #  @param logger Logger instance.
+    #  @param nodeid Host node id.
+    #  @param dry_run Only render rules, do not touch NAT table.
+    #  @param backend Firewall backend name.
+    def __init__(s, logger, nodeid, dry_run = False, backend = FIREWALL_BACKEND):
 
         # Save logger
         s.log = logger
 
-        # Save database connection session
-        s.db = session
+        # Make firewall backend and purge NAT rules
+        s.backend = make_backend(backend, logger, dry_run)
+        s.backend.setup()
 
-        # Purge NAT table
-        s.log.debug('Init NAT firewall table')
-        s.table = Table('nat')
-        s.table.flush_chain()
-        s.table.delete_chain()
-
-        # Init port generator
-        s.ws_port = PortGenerator(WS_START_PORT)
+        # Init port allocator
+        s.ws_port = PortAllocator(nodeid)
 
-        # Init rules dictionary
+        # Init robots dictionary
         s.rules = {}
 
+        # Init pending changes and failed attempts of robots
+        s._append = {}
+        s._delete = {}
+        s._attempts = {}
+
     ## Firewall rule creator method
-    def createRules(s, clients):
+    #  @param clients Dictionary of clients by anchor.
+    #  @param robots Dictionary of robot records by anchor.
+    def createRules(s, clients, robots):
 
         # Create firewall rules for all connections
         for key in clients:
 
             # Get robot by anchor
-            r = s.db.query(Robot)\
-                            .join('container')\
-                            .filter(Robot.anchor==key)\
-                            .first()
+            r = robots.get(key)
 
             if not r:
                 # robot doesn't exist - skip
@@ -69,70 +476,36 @@ class Firewall:
                 continue
 
             # Get virtual address of client from dict
-            vaddress = clients[key]['Virtual Address']
+            vaddress = clients[key].virtual_address
 
-            # Gen WebSocket port
-            r.wsport = s.ws_port.gen()
-            s.log.debug('Gen WebSocket port {0} for robot {1}'
-                            .format(r.wsport, key))
+            # Allocate WebSocket port
+            wsport = s.ws_port.allocate(r.id)
+            s.log.debug('Allocate WebSocket port {0} for robot {1}'
+                            .format(wsport, key))
 
             # Save container external WebSocket port in database
-            s.db.add(r)
-            s.db.commit()
+            Session.query(Robot).filter_by(id = r.id)\
+                            .update({'wsport': wsport}, synchronize_session = False)
 
-            # Make client firewall rules
             s.log.info('Create firewall rule for: {0} -> {1}'
-                            .format(vaddress, r.container.address))
-            client_rule = Rule(
-                protocol     = 'tcp',
-                destination  = r.container.address,
-                source       = vaddress,
-                in_interface = 'tun0',
-                jump         = Target('DNAT', '--to-destination {0}'.format(r.container.address))
-            )
-
-            # Make container firewall rules
+                            .format(vaddress, r.address))
             s.log.info('Create firewall rule for: {0} <- {1}'
-                            .format(vaddress, r.container.address))
-            container_rule = Rule(
-                protocol     = 'tcp',
-                source       = r.container.address,
-                destination  = vaddress,
-                in_interface = 'veth.{0}'.format(r.anchor),
-                jump         = Target('DNAT', '--to-destination {0}'.format(vaddress))
-            )
-            master_rule = Rule(
-                protocol     = 'tcp',
-                source       = r.container.address,
-                destination  = GATEWAY_ADDRESS,
-                in_interface = 'veth.{0}'.format(r.anchor),
-                matches      = [ Match('tcp', '--dport 11311') ],
-                jump         = Target('DNAT', '--to-destination {0}:11311'.format(vaddress))
-            )
-
+                            .format(vaddress, r.address))
             s.log.info('Create firewall rule for: WebSocket -> {0}'
-                            .format(r.container.address))
-            websock_rule = Rule(
-                protocol     = 'tcp',
-                matches      = [ Match('tcp', '--dport {0}'
-                                                .format(r.wsport)) ],
-                jump         = Target('DNAT', '--to-destination {0}:9090'
-                                                .format(r.container.address))
-            )
-
-            # Append rules to table
-            s.table.append_rule('PREROUTING', client_rule)
-            s.table.append_rule('PREROUTING', container_rule)
-            s.table.append_rule('PREROUTING', master_rule)
-            s.table.append_rule('PREROUTING', websock_rule)
-
-            # Append rules to internal list
-            s.rules[r.anchor] = {
-                            'client': client_rule,
-                            'container': container_rule,
-                            'master': master_rule,
-                            'websock': websock_rule }
+                            .format(r.address))
+
+            rules = {'robot': r.id,
+                     'anchor': r.anchor,
+                     'vaddress': vaddress,
+                     'address': r.address,
+                     'wsport': wsport }
+
+            if s.rules.get(r.anchor) == rules and r.anchor not in s._delete:
+                # rules are applied already, batch is retried
+                continue
 
+            # Append rules to pending changes
+            s._pend(s._append, r.anchor, rules)
 
     ## Firewall rule remover method
     def deleteRules(s, clients):
@@ -140,22 +513,149 @@ class Firewall:
         # Delete firewall rules for clients in list
         for key in clients:
 
+            if key in s._append:
+                # rules are not applied yet - just forget it
+                s.ws_port.release(s._append[key]['robot'])
+                s._pend(s._append, key, None)
+                continue
+
+            if key not in s.rules:
+                # nothing to delete - skip
+                s.log.critical('Firewall rules for {0} does NOT exist'.format(key))
+                continue
+
             # Delete rules from table
             s.log.info('Delete firewall rule for: {0} -> {1}'
-                            .format(s.rules[key]['client'].source,
-                                    s.rules[key]['client'].destination))
-            s.table.delete_rule('PREROUTING', s.rules[key]['client'])
-
+                            .format(s.rules[key]['vaddress'], s.rules[key]['address']))
             s.log.info('Delete firewall rule for: {0} <- {1}'
-                            .format(s.rules[key]['container'].destination,
-                                    s.rules[key]['container'].source))
-            s.table.delete_rule('PREROUTING', s.rules[key]['container'])
-            s.table.delete_rule('PREROUTING', s.rules[key]['master'])
-
+                            .format(s.rules[key]['vaddress'], s.rules[key]['address']))
             s.log.info('Delete firewall rule for: WebSocket -> {0}'
-                                    .format(s.rules[key]['container'].source))
-            s.table.delete_rule('PREROUTING', s.rules[key]['websock'])
+                                    .format(s.rules[key]['address']))
+
+            # Append rules to pending changes
+            s._pend(s._delete, key, s.rules[key])
+
+    ## Set pending change, previous change is restored on rollback
+    #  @param changes Pending changes dictionary.
+    #  @param key Robot anchor.
+    #  @param value Robot rules or None to drop change.
+    def _pend(s, changes, key, value):
+
+        previous = changes.get(key)
+
+        ## Change undo
+        def undo():
+            if previous is None:
+                changes.pop(key, None)
+            else:
+                changes[key] = previous
+
+        on_rollback(undo)
+
+        if value is None:
+            changes.pop(key, None)
+        else:
+            changes[key] = value
+
+    ## Pending changes renderer
+    #  @return Pending changes in backend format.
+    def render(s):
+        return s.backend.render(s._append, s._delete)
+
+    ## Apply pending changes
+    #
+    #  All changes are applied by one backend transaction. When it failed,
+    #  changes are applied robot by robot, so one broken change does not
+    #  block the others. Delete of rules missing in kernel tables is done.
+    #  Failed changes of robot are kept pending and retried by next call,
+    #  they are dropped after FIREWALL_RETRIES attempts. Rules are applied
+    #  after commit of session allocated its ports, ports of deleted rules
+    #  are released in current session.
+    #  @return True when no changes are pending.
+    def applyRules(s):
+
+        if not s._append and not s._delete:
+            # nothing to apply
+            return True
+
+        keys = sorted(set(s._append) | set(s._delete))
+
+        if s.backend.apply(s._append, s._delete):
+            for key in keys:
+                s._applied(key)
+            return True
+
+        s.log.error('Firewall batch of {0} robots failed, apply robot by robot'
+                        .format(len(keys)))
+
+        for key in keys:
+            append = {key: s._append[key]} if key in s._append else {}
+            delete = {key: s._delete[key]} if key in s._delete else {}
+
+            if s.backend.apply(append, delete):
+                s._applied(key)
+                continue
+
+            if delete and s.backend.missing(delete[key]):
+                # rules are removed already
+                s.log.warning('Firewall rules of {0} are missing, delete is done'
+                                .format(key))
+                s._applied(key, appended = False)
+
+                if not append or s.backend.apply(append, {}):
+                    s._applied(key)
+                    continue
+
+            # Count failed attempt
+            s._attempts[key] = s._attempts.get(key, 0) + 1
+            if s._attempts[key] < FIREWALL_RETRIES:
+                s.log.error('Firewall change of {0} is pending, attempt {1}'
+                                .format(key, s._attempts[key]))
+                continue
+
+            s.log.critical('Firewall change of {0} failed {1} times, it is dropped'
+                                .format(key, s._attempts[key]))
+            s._dropped(key)
+
+        return not s.pending()
+
+    ## Save applied change of robot
+    #  @param key Robot anchor.
+    #  @param appended False when only delete is applied.
+    def _applied(s, key, appended = True):
+
+        # Drop deleted rules, port of reconnected robot is kept
+        if key in s._delete:
+            robot = s._delete.pop(key)['robot']
+            s.rules.pop(key, None)
+            if key not in s._append or s._append[key]['robot'] != robot:
+                s.ws_port.release(robot)
+
+        if appended and key in s._append:
+            s.rules[key] = s._append.pop(key)
+
+        if key not in s._append:
+            s._attempts.pop(key, None)
+
+    ## Drop failed change of robot
+    #
+    #  Rules of failed delete are left in kernel tables, robot port is
+    #  released anyway.
+    #  @param key Robot anchor.
+    def _dropped(s, key):
+
+        if key in s._delete:
+            robot = s._delete.pop(key)['robot']
+            s.rules.pop(key, None)
+            if key not in s._append or s._append[key]['robot'] != robot:
+                s.ws_port.release(robot)
+
+        if key in s._append:
+            s.ws_port.release(s._append.pop(key)['robot'])
 
-            # Delete rules from internal list
-            s.rules.pop(key)
+        s._attempts.pop(key, None)
 
+    ## Pending changes check
+    #  @return True when some changes are not applied yet.
+    def pending(s):
+        return bool(s._append or s._delete)
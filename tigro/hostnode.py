@@ -3,32 +3,41 @@
 #  TIGRO host nodes package.
 #
 #  This package provide interface to TIGRO host nodes.
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from db import DB_CONN_STRING, Node
+from db import get_engine, session_scope, Node
 from connector import Connector
 from creator import Creator
-from threading import Thread
+from registry import RobotRegistry, RegistryListener
+from schema import upgrade
+from startup import profiler
+from threading import Thread, Lock
 import socket, logging
 
+## Host node IP address, resolved on first use
+_address = None
+
+## Host node IP address lock
+_address_lock = Lock()
+
+## Host node IP address getter
+def host_address():
+
+    global _address
+
+    with _address_lock:
+        if _address is None:
+            _address = socket.gethostbyname(socket.gethostname())
+
+    return _address
+
 ## Host node class
 #
 #  This class register node on main database and start creators and connector.
 class HostNode(Thread):
 
-    ## Database connection engine
-    db = create_engine(DB_CONN_STRING, client_encoding='utf8')
-
-    ## Session class with private engine
-    Session = sessionmaker(bind=db)
-
-    ## Host node IP address
-    address = socket.gethostbyname(socket.gethostname())
-
     ## The constructor
-    #  @param nodename Host node name in the database.
+    #  @param nodename Host node name in the database, host name by default.
     #  @param creators Count of creator threads to start.
-    def __init__(s, nodename = socket.gethostname(), creators = 1):
+    def __init__(s, nodename = None, creators = 1):
         Thread.__init__(s)
 
         s.log = logging.getLogger('HostNode-{0}'.format(s.name))
@@ -37,31 +46,48 @@ class HostNode(Thread):
         s.creators = creators
 
         # Save node name
-        s.nodename = nodename
+        s.nodename = nodename if nodename is not None else socket.gethostname()
 
-        # Create database session
-        sess = s.Session()
+        with profiler.phase('host address'):
+            s.address = host_address()
 
-        # Get node by name
-        node = sess.query(Node).filter_by(name=nodename).first()
+        with profiler.phase('db registration'):
 
-        if node is not None:
-            # update IP address
-            node.address = s.address
+            # Get shared database engine
+            s.db = get_engine()
 
-        else:
-            node = Node(name=nodename, address=s.address)
+            # Upgrade database schema and notification triggers
+            upgrade(s.db)
 
-        # Commit changes
-        sess.add(node)
-        sess.commit()
-        sess.close()
+            with session_scope() as sess:
+
+                # Get node by name
+                node = sess.query(Node).filter_by(name=s.nodename).first()
+
+                if node is not None:
+                    # update IP address
+                    node.address = s.address
+
+                else:
+                    node = Node(name=s.nodename, address=s.address)
+
+                # Changes are committed on scope exit
+                sess.add(node)
+
+        # Make robot registry shared by node threads
+        s.registry = RobotRegistry()
 
     ## Main cycle
     def run(s):
 
         s.log.info('Started host node {0} on {1}'.format(s.nodename, s.address))
 
+        with profiler.phase('thread spawn'):
+            s.spawn()
+
+    ## Start node threads
+    def spawn(s):
+
         # Make some count of creator
         for i in range(0, s.creators):
 
@@ -74,8 +100,13 @@ class HostNode(Thread):
             # Logging
             s.log.info('Started creator thread: {0}'.format(creator.name))
 
+        # Run robot registry invalidation thread
+        listener = RegistryListener(s.registry, s.db)
+        listener.start()
+        s.log.info('Started registry thread: {0}'.format(listener.name))
+
         # Make connector
-        connector = Connector(s.nodename)
+        connector = Connector(s.nodename, s.registry)
 
         # Run connector thread
         connector.start()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+## @package leases
+#  DHCP daemon leases index.
+#
+#  This package provide cached access to DHCP daemon leases file.
+import os
+
+## DHCP leases index class
+#
+#  This class map client MAC address to leased IP address. Leases file is read
+#  again only when its inode, modification time or size changed, and only
+#  added or changed lines are applied to index.
+class LeaseIndex:
+
+    ## The constructor
+    #  @param filename DHCP daemon leases file.
+    def __init__(s, filename):
+
+        # Save leases file name
+        s.filename = filename
+
+        # Init empty index
+        s.leases = {}
+        s._lines = set()
+        s._stat = None
+
+        # Count of index changes
+        s.version = 0
+
+    ## Mark index as outdated
+    def invalidate(s):
+
+        # Drop saved file stat
+        s._stat = None
+
+    ## Reload index if leases file changed
+    #  @return True when index has been changed.
+    def refresh(s):
+
+        # Get file identity
+        try:
+            st = os.stat(s.filename)
+            stat = (st.st_ino, st.st_mtime, st.st_size)
+
+        except OSError:
+            # leases file does not exist yet
+            stat = None
+
+        if stat is not None and stat == s._stat:
+            # file not changed
+            return False
+
+        s._stat = stat
+
+        # Read all lines of leases file
+        lines = set()
+        if stat is not None:
+            with open(s.filename, 'r') as leases:
+                lines = set(leases.read().splitlines())
+
+        removed = s._lines - lines
+        added = lines - s._lines
+        s._lines = lines
+
+        # Drop leases of removed lines
+        for line in removed:
+            lease = s._parse(line)
+            if lease and s.leases.get(lease[0]) == lease[1]:
+                s.leases.pop(lease[0])
+
+        # Append leases of new lines
+        for line in added:
+            lease = s._parse(line)
+            if lease:
+                s.leases[lease[0]] = lease[1]
+
+        if not added and not removed:
+            return False
+
+        s.version += 1
+        return True
+
+    ## Leases line parser
+    #  @return Tuple of (MAC, IP) or None for invalid line.
+    def _parse(s, line):
+
+        # Parse string for example:
+        #   1378854745 26:94:e9:32:51:70 10.9.0.80 hostname ...
+        item = line.split(' ')
+        if len(item) < 3:
+            return None
+
+        return item[1], item[2]
+
+    ## Check MAC address is leased
+    def __contains__(s, mac):
+        return mac in s.leases
+
+    ## Get leased IP address by MAC address
+    def __getitem__(s, mac):
+        return s.leases[mac]
+
+    ## Count of leases
+    def __len__(s):
+        return len(s.leases)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+## @package lifecycle
+#  LXC-container lifecycle package.
+#
+#  This package starts and stops LXC-containers in parallel.
+from conf import LXC_WORKERS, LXC_TIMEOUT
+from subprocess import Popen
+from threading import Thread
+from Queue import Queue
+import time
+
+## Container lifecycle executor
+#
+#  This class run lxc-start and lxc-stop commands by pool of worker threads.
+#  Commands for one container are always executed by the same worker in order
+#  of submission, so start and stop of one container never race.
+class ContainerExecutor:
+
+    ## Command state poll interval in seconds
+    poll_interval = 0.05
+
+    ## The constructor
+    #  @param logger Logger instance.
+    #  @param workers Count of worker threads.
+    #  @param timeout Command timeout in seconds.
+    def __init__(s, logger, workers = LXC_WORKERS, timeout = LXC_TIMEOUT):
+
+        # Save logger
+        s.log = logger
+
+        # Save command timeout
+        s.timeout = timeout
+
+        # Init results queue
+        s._results = Queue()
+
+        # Make workers with private task queues
+        s._queues = []
+        for i in range(0, workers):
+            queue = Queue()
+            worker = Thread(target = s._work, args = (queue,))
+            worker.daemon = True
+            worker.start()
+            s._queues.append(queue)
+
+    ## Start container
+    #  @param name Container name.
+    def start(s, name):
+        s._submit(name, ['lxc-start', '--name', name, '-d'])
+
+    ## Stop container
+    #  @param name Container name.
+    def stop(s, name):
+        s._submit(name, ['lxc-stop', '--name', name])
+
+    ## Put command to queue of container worker
+    def _submit(s, name, command):
+        s._queues[hash(name) % len(s._queues)].put((name, command))
+
+    ## Wait for all submitted commands
+    #  @return List of (name, command, exit status) tuples, exit status is
+    #          None when command failed to run or timed out.
+    def wait(s):
+
+        # Wait for empty task queues
+        for queue in s._queues:
+            queue.join()
+
+        return s.collect()
+
+    ## Get results of finished commands
+    #  @return List of (name, command, exit status) tuples.
+    def collect(s):
+
+        results = []
+        while not s._results.empty():
+            results.append(s._results.get())
+
+        return results
+
+    ## Worker thread cycle
+    def _work(s, queue):
+
+        # Infinity cycle =)
+        while True:
+            name, command = queue.get()
+            try:
+                s._results.put((name, command[0], s._run(command)))
+            finally:
+                queue.task_done()
+
+    ## Run command with timeout
+    #  @return Exit status or None.
+    def _run(s, command):
+
+        try:
+            proc = Popen(command)
+
+        except OSError as e:
+            s.log.critical('Can not run {0}: {1}'.format(command[0], e))
+            return None
+
+        # Wait for command finish
+        deadline = time.time() + s.timeout
+        while proc.poll() is None:
+
+            if time.time() > deadline:
+                # timeout - kill command
+                s.log.error('Command timeout: {0}'.format(' '.join(command)))
+                proc.kill()
+                proc.wait()
+                return None
+
+            time.sleep(s.poll_interval)
+
+        return proc.returncode
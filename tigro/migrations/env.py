@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+## @package env
+#  TIGRO database migrations environment.
+#
+#  Migrations run on connection given by schema.upgrade or on new engine
+#  connection when started by alembic command.
+from alembic import context
+from sqlalchemy import create_engine
+import os, sys
+
+# Make tigro package importable for alembic command
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from tigro.db import Base, DB_CONN_STRING
+
+## Alembic config
+config = context.config
+
+## Run migrations on database connection
+def run_migrations_online():
+
+    connection = config.attributes.get('connection')
+
+    if connection is not None:
+        # connection of caller
+        context.configure(connection = connection,
+                          target_metadata = Base.metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    engine = create_engine(DB_CONN_STRING, client_encoding='utf8')
+    with engine.connect() as connection:
+        context.configure(connection = connection,
+                          target_metadata = Base.metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+## Render migrations as SQL script
+def run_migrations_offline():
+
+    context.configure(url = DB_CONN_STRING, target_metadata = Base.metadata,
+                      literal_binds = True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+## @package ${up_revision}
+#  ${message}
+#
+#  Revision ID: ${up_revision}
+#  Revises: ${down_revision | comma,n}
+#  Create Date: ${create_date}
+from alembic import op
+import sqlalchemy as sa
+${imports if imports else ""}
+
+revision = ${repr(up_revision)}
+down_revision = ${repr(down_revision)}
+branch_labels = ${repr(branch_labels)}
+depends_on = ${repr(depends_on)}
+
+## Upgrade schema
+def upgrade():
+    ${upgrades if upgrades else "pass"}
+
+## Downgrade schema
+def downgrade():
+    ${downgrades if downgrades else "pass"}
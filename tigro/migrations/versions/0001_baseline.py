@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+## @package 0001_baseline
+#  Baseline TIGRO schema with notification triggers.
+#
+#  Existing tables are kept and triggers are replaced, so this revision also
+#  upgrades databases made by create_all before migrations.
+#
+#  Revision ID: 0001
+#  Revises:
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+## Registry invalidation triggers
+#
+#  Robot and container changes notify 'tigro_registry' channel with robot
+#  anchor. Empty payload invalidates all registry entries. Containers without
+#  robot are not notified. Trigger DDL is kept in
+#  revision, so it does not change with application modules.
+REGISTRY_TRIGGERS = [
+'''
+CREATE OR REPLACE FUNCTION tigro_robot_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.id = NEW.id
+                        AND OLD.anchor IS NOT DISTINCT FROM NEW.anchor THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        PERFORM pg_notify('tigro_registry', COALESCE(OLD.anchor, ''));
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        PERFORM pg_notify('tigro_registry', COALESCE(NEW.anchor, ''));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+''',
+'''
+CREATE OR REPLACE FUNCTION tigro_container_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.robot IS NOT NULL THEN
+        PERFORM pg_notify('tigro_registry', COALESCE(
+            (SELECT anchor FROM robot WHERE id = OLD.robot), ''));
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.robot IS NOT NULL THEN
+        PERFORM pg_notify('tigro_registry', COALESCE(
+            (SELECT anchor FROM robot WHERE id = NEW.robot), ''));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+''',
+'DROP TRIGGER IF EXISTS tigro_robot_notify ON robot',
+'''
+CREATE TRIGGER tigro_robot_notify AFTER INSERT OR UPDATE OR DELETE ON robot
+    FOR EACH ROW EXECUTE PROCEDURE tigro_robot_notify()
+''',
+'DROP TRIGGER IF EXISTS tigro_container_notify ON container',
+'''
+CREATE TRIGGER tigro_container_notify AFTER INSERT OR UPDATE OR DELETE ON container
+    FOR EACH ROW EXECUTE PROCEDURE tigro_container_notify()
+''',
+]
+
+## Creation queue triggers
+#
+#  New task in 'new_container' table notify 'tigro_new_container' channel
+#  with task id.
+CREATOR_TRIGGERS = [
+'''
+CREATE OR REPLACE FUNCTION tigro_new_container_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('tigro_new_container', NEW.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+''',
+'DROP TRIGGER IF EXISTS tigro_new_container_notify ON new_container',
+'''
+CREATE TRIGGER tigro_new_container_notify AFTER INSERT ON new_container
+    FOR EACH ROW EXECUTE PROCEDURE tigro_new_container_notify()
+''',
+]
+
+## Create table if it does not exist
+#
+#  Databases made before migrations already have some of baseline tables.
+def create_table(name, *columns):
+
+    if name not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(name, *columns)
+
+## Upgrade schema
+def upgrade():
+
+    create_table('node',
+        sa.Column('id', sa.Integer, sa.Sequence('node_id_seq'), primary_key=True),
+        sa.Column('name', sa.String),
+        sa.Column('address', sa.String))
+
+    create_table('robot',
+        sa.Column('id', sa.Integer, sa.Sequence('robot_id_seq'), primary_key=True),
+        sa.Column('name', sa.String),
+        sa.Column('anchor', sa.String),
+        sa.Column('wsport', sa.Integer),
+        sa.Column('wsauth', sa.String))
+
+    create_table('container',
+        sa.Column('id', sa.Integer, sa.Sequence('container_id_seq'), primary_key=True),
+        sa.Column('robot', sa.Integer, sa.ForeignKey('robot.id')),
+        sa.Column('node', sa.Integer, sa.ForeignKey('node.id')),
+        sa.Column('address', sa.String))
+
+    create_table('new_container',
+        sa.Column('id', sa.Integer, sa.Sequence('new_container_id_seq'), primary_key=True),
+        sa.Column('link', sa.Integer, sa.ForeignKey('container.id')))
+
+    create_table('connection',
+        sa.Column('id', sa.Integer, sa.Sequence('connection_id_seq'), primary_key=True),
+        sa.Column('container', sa.Integer, sa.ForeignKey('container.id')),
+        sa.Column('node', sa.Integer, sa.ForeignKey('node.id')),
+        sa.Column('since', sa.String),
+        sa.Column('vaddress', sa.String),
+        sa.Column('raddress', sa.String),
+        sa.Column('sent', sa.Integer),
+        sa.Column('received', sa.Integer))
+
+    create_table('ws_port',
+        sa.Column('id', sa.Integer, sa.Sequence('ws_port_id_seq'), primary_key=True),
+        sa.Column('node', sa.Integer, sa.ForeignKey('node.id')),
+        sa.Column('port', sa.Integer),
+        sa.Column('robot', sa.Integer, sa.ForeignKey('robot.id')),
+        sa.Column('active', sa.Boolean))
+
+    create_table('address_map',
+        sa.Column('id', sa.Integer, sa.Sequence('address_map_id_seq'), primary_key=True),
+        sa.Column('network', sa.String, unique=True),
+        sa.Column('bitmap', sa.LargeBinary),
+        sa.Column('hint', sa.Integer))
+
+    # Robot registry invalidation triggers
+    for statement in REGISTRY_TRIGGERS:
+        op.execute(statement)
+
+    # Creation queue notification triggers
+    for statement in CREATOR_TRIGGERS:
+        op.execute(statement)
+
+## Downgrade schema
+def downgrade():
+
+    op.execute('DROP TRIGGER IF EXISTS tigro_new_container_notify ON new_container')
+    op.execute('DROP TRIGGER IF EXISTS tigro_container_notify ON container')
+    op.execute('DROP TRIGGER IF EXISTS tigro_robot_notify ON robot')
+    op.execute('DROP FUNCTION IF EXISTS tigro_new_container_notify()')
+    op.execute('DROP FUNCTION IF EXISTS tigro_container_notify()')
+    op.execute('DROP FUNCTION IF EXISTS tigro_robot_notify()')
+
+    for table in ('address_map', 'ws_port', 'connection', 'new_container',
+                  'container', 'robot', 'node'):
+        op.drop_table(table)
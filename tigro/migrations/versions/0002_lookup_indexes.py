@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+## @package 0002_lookup_indexes
+#  Indexes and unique constraints of hot lookup columns.
+#
+#  Revision ID: 0002
+#  Revises: 0001
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+## Upgrade schema
+def upgrade():
+
+    # Robots are resolved by anchor, nodes by name
+    op.create_index('ix_robot_anchor', 'robot', ['anchor'], unique=True)
+    op.create_index('ix_node_name', 'node', ['name'], unique=True)
+
+    # Node rows of connections and containers
+    op.create_index('ix_connection_node', 'connection', ['node'])
+    op.create_index('ix_container_node', 'container', ['node'])
+
+    # Connections are found by client real address
+    op.create_index('ix_connection_raddress', 'connection', ['raddress'])
+
+## Downgrade schema
+def downgrade():
+
+    op.drop_index('ix_connection_raddress', 'connection')
+    op.drop_index('ix_container_node', 'container')
+    op.drop_index('ix_connection_node', 'connection')
+    op.drop_index('ix_node_name', 'node')
+    op.drop_index('ix_robot_anchor', 'robot')
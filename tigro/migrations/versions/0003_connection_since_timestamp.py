@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+## @package 0003_connection_since_timestamp
+#  Connection since column as timestamp.
+#
+#  Revision ID: 0003
+#  Revises: 0002
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+## Upgrade schema
+def upgrade():
+
+    # OpenVPN since strings look like 'Thu Jun 18 04:23:03 2015', other
+    # values are dropped
+    op.alter_column('connection', 'since', type_ = sa.DateTime,
+                    postgresql_using = '''
+        CASE WHEN since ~ '^[A-Za-z]{3} [A-Za-z]{3} +[0-9]{1,2} [0-9:]{8} [0-9]{4}$'
+             THEN to_timestamp(since, 'Dy Mon DD HH24:MI:SS YYYY')::timestamp
+        END''')
+
+## Downgrade schema
+def downgrade():
+
+    op.alter_column('connection', 'since', type_ = sa.String,
+                    postgresql_using = '''
+        to_char(since, 'Dy Mon FMDD HH24:MI:SS YYYY')''')
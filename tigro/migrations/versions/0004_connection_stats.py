@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+## @package 0004_connection_stats
+#  Connection throughput table.
+#
+#  Revision ID: 0004
+#  Revises: 0003
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+## Upgrade schema
+def upgrade():
+
+    op.create_table('connection_stats',
+        sa.Column('id', sa.Integer, sa.Sequence('connection_stats_id_seq'), primary_key=True),
+        sa.Column('node', sa.Integer, sa.ForeignKey('node.id')),
+        sa.Column('container', sa.Integer, sa.ForeignKey('container.id')),
+        sa.Column('time', sa.DateTime),
+        sa.Column('sent', sa.BigInteger),
+        sa.Column('received', sa.BigInteger),
+        sa.Column('sent_rate', sa.Float),
+        sa.Column('received_rate', sa.Float))
+
+    op.create_index('ix_connection_stats_container', 'connection_stats', ['container'])
+    op.create_index('ix_connection_stats_time', 'connection_stats', ['time'])
+
+## Downgrade schema
+def downgrade():
+
+    op.drop_index('ix_connection_stats_time', 'connection_stats')
+    op.drop_index('ix_connection_stats_container', 'connection_stats')
+    op.drop_table('connection_stats')
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+## @package 0005_new_container_created
+#  Enqueue time of container creation tasks.
+#
+#  Revision ID: 0005
+#  Revises: 0004
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+## Upgrade schema
+def upgrade():
+
+    op.add_column('new_container',
+        sa.Column('created', sa.DateTime, server_default=sa.func.now()))
+
+## Downgrade schema
+def downgrade():
+
+    op.drop_column('new_container', 'created')
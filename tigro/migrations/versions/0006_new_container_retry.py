@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+## @package 0006_new_container_retry
+#  Retry state of failed container creation tasks.
+#
+#  Revision ID: 0006
+#  Revises: 0005
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+## Upgrade schema
+def upgrade():
+
+    op.add_column('new_container',
+        sa.Column('attempts', sa.Integer, server_default='0'))
+    op.add_column('new_container',
+        sa.Column('retry', sa.DateTime))
+
+## Downgrade schema
+def downgrade():
+
+    op.drop_column('new_container', 'retry')
+    op.drop_column('new_container', 'attempts')
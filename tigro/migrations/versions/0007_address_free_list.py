@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+## @package 0007_address_free_list
+#  Container address free list and release queue.
+#
+#  Addresses of deleted containers (and old addresses of changed containers)
+#  with robot are queued to 'address_release' table by trigger.
+#
+#  Revision ID: 0007
+#  Revises: 0006
+#  Create Date: 2026-10-18
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+## Address release trigger
+RELEASE_TRIGGER = [
+'''
+CREATE OR REPLACE FUNCTION tigro_address_release() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.address IS NOT DISTINCT FROM NEW.address THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    IF OLD.robot IS NOT NULL AND OLD.address IS NOT NULL THEN
+        INSERT INTO address_release (address) VALUES (OLD.address);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+''',
+'DROP TRIGGER IF EXISTS tigro_address_release ON container',
+'''
+CREATE TRIGGER tigro_address_release AFTER UPDATE OF address OR DELETE ON container
+    FOR EACH ROW EXECUTE PROCEDURE tigro_address_release()
+''',
+]
+
+## Upgrade schema
+def upgrade():
+
+    op.add_column('address_map', sa.Column('free', sa.LargeBinary))
+
+    op.create_table('address_release',
+        sa.Column('id', sa.Integer, sa.Sequence('address_release_id_seq'), primary_key=True),
+        sa.Column('address', sa.String))
+
+    for statement in RELEASE_TRIGGER:
+        op.execute(statement)
+
+## Downgrade schema
+def downgrade():
+
+    op.execute('DROP TRIGGER IF EXISTS tigro_address_release ON container')
+    op.execute('DROP FUNCTION IF EXISTS tigro_address_release()')
+    op.drop_table('address_release')
+    op.drop_column('address_map', 'free')
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+## @package nft
+#  TIGRO nftables firewall backend.
+#
+#  This package makes NAT rules for LXC-containers by nftables.
+from conf import GATEWAY_ADDRESS
+from firewall import FirewallBackend
+from subprocess import Popen, PIPE
+
+## Network of address in CIDR notation
+#  @param address Address with prefix length, for example 10.10.255.254/16.
+#  @return Network address with prefix length, for example 10.10.0.0/16.
+def network(address):
+
+    host, prefix = address.split('/')
+    octets = [int(o) for o in host.split('.')]
+    value = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    value &= (0xffffffff << (32 - int(prefix))) & 0xffffffff
+
+    return '{0}.{1}.{2}.{3}/{4}'.format(value >> 24, (value >> 16) & 0xff,
+                                        (value >> 8) & 0xff, value & 0xff, prefix)
+
+## NFTables firewall backend
+#
+#  All robots share the same four rules of 'tigro' table; rules look up robot
+#  addresses in sets and maps:
+#   - clients: client address . container address of tun0 packets;
+#   - containers: veth name . container address . client address;
+#   - masters: veth name . container address -> client address;
+#   - websock: WebSocket port -> container address . 9090.
+#  So robot connect or disconnect is one element update in every set. Changes
+#  are applied by one 'nft -f' transaction.
+class NftablesBackend(FirewallBackend):
+
+    ## Table name
+    table = 'tigro'
+
+    ## Purge TIGRO table and make sets, maps and rules
+    def setup(s):
+
+        if s.dry_run:
+            return
+
+        s.log.debug('Init NAT firewall table')
+        if not s._nft(s.renderSetup()):
+            raise RuntimeError('Can not init nftables table')
+
+    ## Table renderer
+    #  @return TIGRO table in nft script format.
+    def renderSetup(s):
+
+        return '\n'.join([
+            'table ip {0}',
+            'delete table ip {0}',
+            'table ip {0} {{',
+            '    set clients {{ type ipv4_addr . ipv4_addr; }}',
+            '    set containers {{ type ifname . ipv4_addr . ipv4_addr; }}',
+            '    map masters {{ type ifname . ipv4_addr : ipv4_addr; }}',
+            '    map websock {{ type inet_service : ipv4_addr . inet_service; }}',
+            '    chain prerouting {{',
+            '        type nat hook prerouting priority -100; policy accept;',
+            '        iifname "tun0" ip saddr . ip daddr @clients'
+                        ' meta l4proto tcp dnat to ip daddr',
+            '        iifname . ip saddr . ip daddr @containers'
+                        ' meta l4proto tcp dnat to ip daddr',
+            '        ip daddr {1} tcp dport 11311'
+                        ' dnat to iifname . ip saddr map @masters',
+            '        dnat ip addr . port to tcp dport map @websock',
+            '    }}',
+            '}}', '']).format(s.table, network(GATEWAY_ADDRESS))
+
+    ## Robot elements maker
+    #  @return Dictionary of set elements by set name.
+    def _elements(s, robot):
+
+        veth = '"veth.{0}"'.format(robot['anchor'])
+        return {
+            'clients': '{0} . {1}'.format(robot['vaddress'], robot['address']),
+            'containers': '{0} . {1} . {2}'.format(veth, robot['address'],
+                                                   robot['vaddress']),
+            'masters': '{0} . {1} : {2}'.format(veth, robot['address'],
+                                                robot['vaddress']),
+            'websock': '{0} : {1} . 9090'.format(robot['wsport'], robot['address']) }
+
+    ## Set element commands renderer
+    def _render_elements(s, command, robots):
+
+        if not robots:
+            return []
+
+        # Collect elements by set
+        sets = {}
+        for key in sorted(robots):
+            for name, element in s._elements(robots[key]).items():
+                sets.setdefault(name, []).append(element)
+
+        return ['{0} element ip {1} {2} {{ {3} }}'
+                    .format(command, s.table, name, ', '.join(sets[name]))
+                for name in sorted(sets)]
+
+    ## Changes renderer
+    #  @return Set element changes in nft script format.
+    def render(s, append, delete):
+
+        lines = s._render_elements('delete', delete) + \
+                s._render_elements('add', append)
+
+        return '\n'.join(lines) + '\n'
+
+    ## Apply changes by one nft transaction
+    def apply(s, append, delete):
+
+        # Render changes
+        rules = s.render(append, delete)
+        s.log.debug('Apply NAT rules:\n{0}'.format(rules))
+
+        if s.dry_run:
+            return True
+
+        return s._nft(rules)
+
+    ## Check robot elements by 'nft get element'
+    def missing(s, robot):
+
+        if s.dry_run:
+            return False
+
+        for name, element in s._elements(robot).items():
+            # map elements are looked up by key
+            key = element.split(' : ')[0]
+            get = Popen(['nft', 'get', 'element', 'ip', s.table, name,
+                         '{{ {0} }}'.format(key)], stdout=PIPE, stderr=PIPE)
+            get.communicate()
+            if get.returncode == 0:
+                return False
+
+        return True
+
+    ## Run nft script transaction
+    #  @return True when script applied.
+    def _nft(s, script):
+
+        nft = Popen(['nft', '-f', '-'], stdin=PIPE, stderr=PIPE)
+        error = nft.communicate(script)[1]
+
+        if nft.returncode != 0:
+            s.log.critical('Can not apply nftables rules: {0}'.format(error))
+            return False
+
+        return True
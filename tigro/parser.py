@@ -37,13 +37,113 @@ import csv
 import datetime
 import logging
 import sys
+import io
+import os
+
+class _Entry(object):
+    """ Base class of compact status file records """
+    __slots__ = ()
+
+    # Header names of status file columns mapped to constructor arguments
+    columns = ()
+
+    def _fields(self):
+        return tuple(getattr(self, name) for name in self.__slots__
+                     if not name.startswith('_'))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._fields() == other._fields()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self.__slots__
+            if not name.startswith('_')))
+
+
+class ClientEntry(_Entry):
+    """ Connected client, row of CLIENT_LIST """
+    __slots__ = ('common_name', 'real_address', 'virtual_address',
+                 'bytes_received', 'bytes_sent', 'since',
+                 '_since_t', '_connected_since', '_status_address')
+
+    columns = ('Common Name', 'Real Address', 'Virtual Address',
+               'Bytes Received', 'Bytes Sent', 'Connected Since',
+               'Connected Since (time_t)')
+
+    def __init__(self, common_name, real_address, virtual_address,
+                 bytes_received, bytes_sent, since, since_t):
+        self.common_name = common_name
+        self.real_address = real_address
+        self.virtual_address = virtual_address
+        self.bytes_received = int(bytes_received)
+        self.bytes_sent = int(bytes_sent)
+        self.since = since
+        self._since_t = since_t
+        self._connected_since = None
+        # Virtual address of status file, kept when leased address is set
+        self._status_address = virtual_address
+
+    def with_address(self, virtual_address):
+        """ Copy of entry with other virtual address """
+        entry = ClientEntry.__new__(ClientEntry)
+        for name in self.__slots__:
+            setattr(entry, name, getattr(self, name))
+        entry.virtual_address = virtual_address
+        return entry
+
+    @property
+    def connected_since(self):
+        """ Connection time, parsed on first access """
+        if self._connected_since is None:
+            self._connected_since = datetime.datetime.fromtimestamp(int(self._since_t))
+        return self._connected_since
+
+
+class RouteEntry(_Entry):
+    """ Route to client, row of ROUTING_TABLE """
+    __slots__ = ('virtual_address', 'common_name', 'real_address',
+                 'last_ref', '_last_ref_t', '_last_ref_time')
+
+    columns = ('Virtual Address', 'Common Name', 'Real Address',
+               'Last Ref', 'Last Ref (time_t)')
+
+    def __init__(self, virtual_address, common_name, real_address,
+                 last_ref, last_ref_t):
+        self.virtual_address = virtual_address
+        self.common_name = common_name
+        self.real_address = real_address
+        self.last_ref = last_ref
+        self._last_ref_t = last_ref_t
+        self._last_ref_time = None
+
+    @property
+    def last_ref_time(self):
+        """ Last reference time, parsed on first access """
+        if self._last_ref_time is None:
+            self._last_ref_time = datetime.datetime.fromtimestamp(int(self._last_ref_t))
+        return self._last_ref_time
+
 
 class OpenVPNStatusParser:
-    def __init__(self, filename):
+    def __init__(self, filename, incremental=False):
         self.filename = filename
+        self.incremental = incremental
         self._connected_clients = None
         self._routing_table = None
         self._details = None
+        # Incremental mode state: reusable read buffer and raw row
+        # fingerprints of the previous snapshot.
+        self._buffer = bytearray(4096)
+        self._headers = {}
+        self._client_rows = {}
+        self._routing_rows = {}
+        # Row indexes of record columns for known headers
+        self._indexes = {}
 
     def _parse_file(self):
         self._details = {}
@@ -73,16 +173,14 @@ class OpenVPNStatusParser:
 
             elif row_title == "CLIENT_LIST":
                 try:
-                    self._connected_clients[row[1]] = dict(zip(topics_for["CLIENT_LIST"], row[1:]))
-                    self._connected_clients[row[1]]["connected_since"] = datetime.datetime.fromtimestamp(int(row[-1]))
-                except IndexError:
+                    self._connected_clients[row[1]] = self._parse_client(topics_for, row)
+                except (IndexError, KeyError, ValueError):
                     logging.error("CLIENT_LIST row is invalid: %s" % row)
 
             elif row_title == "ROUTING_TABLE":
                 try:
-                    self._routing_table[row[2]] = dict(zip(topics_for["ROUTING_TABLE"], row[1:]))
-                    self._routing_table[row[2]]["last_ref"] = datetime.datetime.fromtimestamp(int(row[-1]))
-                except IndexError:
+                    self._routing_table[row[2]] = self._parse_route(topics_for, row)
+                except (IndexError, KeyError, ValueError):
                     logging.error("ROUTING_TABLE row is invalid: %s" % row)
 
             elif row_title == "GLOBAL_STATS":
@@ -99,43 +197,204 @@ class OpenVPNStatusParser:
         logging.error("File was incomplete. END line was missing.")
         return False
 
+    def _make_entry(self, entry_class, topics, row):
+        """ Convert row to record using column names from header """
+        key = (entry_class, tuple(topics))
+        indexes = self._indexes.get(key)
+        if indexes is None:
+            indexes = [topics.index(name) + 1 for name in entry_class.columns]
+            self._indexes[key] = indexes
+        return entry_class(*[row[i] for i in indexes])
+
+    def _parse_client(self, topics_for, row):
+        """ Convert CLIENT_LIST row to ClientEntry """
+        return self._make_entry(ClientEntry, topics_for["CLIENT_LIST"], row)
+
+    def _parse_route(self, topics_for, row):
+        """ Convert ROUTING_TABLE row to RouteEntry """
+        return self._make_entry(RouteEntry, topics_for["ROUTING_TABLE"], row)
+
+    def _read_lines(self):
+        """ Read status file into reusable buffer and split it to lines """
+        status = io.open(self.filename, 'rb', buffering=0)
+        try:
+            size = os.fstat(status.fileno()).st_size
+            if len(self._buffer) <= size:
+                self._buffer = bytearray(size * 2)
+            length = status.readinto(self._buffer)
+            # File grown between stat and read, enlarge buffer and retry
+            while length == len(self._buffer):
+                self._buffer.extend(bytearray(len(self._buffer)))
+                length += status.readinto(memoryview(self._buffer)[length:])
+        finally:
+            status.close()
+        return memoryview(self._buffer)[:length].tobytes().splitlines()
+
+    def update(self):
+        """ Incrementally re-read status file.
+
+        Every CLIENT_LIST and ROUTING_TABLE row is fingerprinted by its raw
+        text: rows which are the same as in the previous snapshot keep their
+        parsed objects, only new or modified rows are parsed again. Incomplete
+        files (without END line) are ignored and the previous snapshot is kept.
+
+        Returns tuple of client common name sets (added, removed, changed)
+        since the previous snapshot.
+        """
+        details = {}
+        headers = {}
+        stale = set()
+        topics_for = {}
+        clients, client_rows = {}, {}
+        routing, routing_rows = {}, {}
+        complete = False
+
+        for line in self._read_lines():
+            row_title, _, rest = line.partition('\t')
+
+            if row_title == "CLIENT_LIST":
+                key = rest.partition('\t')[0]
+                if "CLIENT_LIST" not in stale and self._client_rows.get(key) == line:
+                    clients[key] = self._connected_clients[key]
+                else:
+                    try:
+                        clients[key] = self._parse_client(topics_for, line.split('\t'))
+                    except (IndexError, KeyError, ValueError):
+                        logging.error("CLIENT_LIST row is invalid: %s" % line)
+                        continue
+                client_rows[key] = line
+
+            elif row_title == "ROUTING_TABLE":
+                key = rest.split('\t', 2)[1:2]
+                if not key:
+                    logging.error("ROUTING_TABLE row is invalid: %s" % line)
+                    continue
+                key = key[0]
+                if "ROUTING_TABLE" not in stale and self._routing_rows.get(key) == line:
+                    routing[key] = self._routing_table[key]
+                else:
+                    try:
+                        routing[key] = self._parse_route(topics_for, line.split('\t'))
+                    except (IndexError, KeyError, ValueError):
+                        logging.error("ROUTING_TABLE row is invalid: %s" % line)
+                        continue
+                routing_rows[key] = line
+
+            elif row_title == "HEADER":
+                row = line.split('\t')
+                if len(row) < 2:
+                    logging.error("HEADER row is invalid: %s" % row)
+                    continue
+                topics_for[row[1]] = row[2:]
+                headers[row[1]] = line
+                if self._headers.get(row[1]) != line:
+                    # Columns layout changed, cached rows are not reusable
+                    stale.add(row[1])
+
+            elif row_title == "TITLE":
+                details["title"] = rest
+
+            elif row_title == "TIME":
+                try:
+                    details["timestamp"] = datetime.datetime.fromtimestamp(int(rest.split('\t')[1]))
+                except (IndexError, ValueError):
+                    logging.error("TIME row is invalid: %s" % line)
+
+            elif row_title == "GLOBAL_STATS":
+                try:
+                    name, value = rest.split('\t')[:2]
+                    details[name] = value
+                except ValueError:
+                    logging.error("GLOBAL_STATS row is invalid: %s" % line)
+
+            elif row_title == "END":
+                complete = True
+                break
+
+            elif line:
+                logging.warning("Line was not parsed. Keyword %s not recognized. %s" % (row_title, line))
+
+        if not complete:
+            logging.error("File was incomplete. END line was missing.")
+            return set(), set(), set()
+
+        past = self._client_rows
+        added = set(client_rows).difference(past)
+        removed = set(past).difference(client_rows)
+        if "CLIENT_LIST" in stale:
+            changed = set(client_rows).intersection(past)
+        else:
+            changed = set(key for key in client_rows
+                            if key in past and past[key] != client_rows[key])
+
+        self._details, self._headers = details, headers
+        self._connected_clients, self._client_rows = clients, client_rows
+        self._routing_table, self._routing_rows = routing, routing_rows
+        return added, removed, changed
+
+    def _load(self):
+        """ Make first snapshot of status file """
+        if self.incremental:
+            self.update()
+        else:
+            self._parse_file()
+
     @property
     def details(self):
         """ Returns miscellaneous details from status file """
-        if not self._details:
-            self._parse_file()
+        if self._details is None:
+            self._load()
         return self._details
 
     @property
     def connected_clients(self):
         """ Returns dictionary of connected clients with details."""
-        if not self._connected_clients:
-            self._parse_file()
+        if self._connected_clients is None:
+            self._load()
         return self._connected_clients
 
     @property
     def routing_table(self):
         """ Returns dictionary of routing_table used by OpenVPN """
-        if not self._routing_table:
-            self._parse_file()
+        if self._routing_table is None:
+            self._load()
         return self._routing_table
 
     def concat_dhcp(self, leases):
-        """ Concatenate DHCP leases file """
-        dhcp_leases = {}
+        """ Concatenate DHCP leases file or MAC to IP mapping (LeaseIndex)
+
+        Returns set of client common names which virtual address changed.
+        """
+        if not isinstance(leases, basestring):
+            dhcp_leases = leases
+        else:
+            dhcp_leases = {}
+
+            for item in open(leases, 'r'):
+                """ Parse string for example:
+                1378854745 26:94:e9:32:51:70 10.9.0.80 hostname ...
+                """
+                item = item.split(' ')
+                dhcp_leases[item[1]] = item[2]
+
+        # Entries may be shared with the previous snapshot, so address is
+        # never changed in place: changed entries are replaced by copies.
+        # Address of status file is restored when lease is lost.
+        clients = self.connected_clients
+        routing = self.routing_table
+        changed = set()
+        for cn in clients:
+            address = clients[cn]._status_address
+            route = routing.get(cn)
 
-        for item in open(leases, 'r'):
-            """ Parse string for example:
-            1378854745 26:94:e9:32:51:70 10.9.0.80 hostname ...
-            """
-            item = item.split(' ')
-            dhcp_leases[item[1]] = item[2]
+            if route is not None and route.virtual_address in dhcp_leases:
+                address = dhcp_leases[route.virtual_address]
 
-        for cn in self.routing_table:
-            mac = self.routing_table[cn]['Virtual Address']
+            if clients[cn].virtual_address != address:
+                clients[cn] = clients[cn].with_address(address)
+                changed.add(cn)
 
-            if mac in dhcp_leases:
-                self._connected_clients[cn]['Virtual Address'] = dhcp_leases[mac]
+        return changed
 
 def main():
     if len(sys.argv) == 1:
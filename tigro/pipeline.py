@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+## @package pipeline
+#  Client status events pipeline.
+#
+#  This package apply connect and disconnect events of clients by parallel
+#  stages of side effects.
+from conf import PIPELINE_QUEUE_SIZE, PIPELINE_BATCH, PIPELINE_RETRIES, PIPELINE_RETRY_DELAY
+from threading import Thread, Lock
+from Queue import Queue, Empty
+import time
+
+## Client connected
+CONNECT = 'connect'
+
+## Client disconnected
+DISCONNECT = 'disconnect'
+
+## Client identity changed: addresses or connection time
+CHANGE = 'change'
+
+## Client byte counters changed only
+METRICS = 'metrics'
+
+## Client status snapshot
+#
+#  Copy of client fields used by stages, so stage workers do not share
+#  records of status parser.
+class ClientStatus(object):
+    __slots__ = ('virtual_address', 'real_address', 'connected_since',
+                 'bytes_sent', 'bytes_received')
+
+    ## The constructor
+    #  @param client Client record of status parser.
+    def __init__(s, client):
+        for name in s.__slots__:
+            setattr(s, name, getattr(client, name))
+
+## Client status event
+class StatusEvent(object):
+    __slots__ = ('kind', 'anchor', 'client', 'past', 'robot', 'time')
+
+    ## The constructor
+    #  @param kind Event kind.
+    #  @param anchor Robot anchor.
+    #  @param client Current client status.
+    #  @param past Previous client status.
+    #  @param robot Robot record.
+    def __init__(s, kind, anchor, client, past = None, robot = None):
+        s.kind = kind
+        s.anchor = anchor
+        s.client = ClientStatus(client)
+        s.past = ClientStatus(past) if past is not None else None
+        s.robot = robot
+        s.time = time.time()
+
+## Pipeline stage
+#
+#  Stage worker thread apply events from bounded queue in order of emission,
+#  so events of one robot are never reordered. Queued events are applied by
+#  batch of distinct robots, batch is cut when robot repeats. Emitter is
+#  blocked while queue is full. Failed batch is retried before next events,
+#  so handlers apply batch again after failure.
+class Stage:
+
+    ## The constructor
+    #  @param logger Logger instance.
+    #  @param name Stage name.
+    #  @param handler Callable of (added, removed, changed, robots), changed
+    #         is tuple of identity and metrics changes, both are tuples of
+    #         (before, after) dictionaries.
+    #  @param kinds Kinds of applied events.
+    #  @param maxsize Queue size.
+    #  @param batch Max count of events in batch.
+    #  @param retries Count of retries of failed batch.
+    #  @param delay First retry delay in seconds.
+    def __init__(s, logger, name, handler, kinds = (CONNECT, DISCONNECT),
+                 maxsize = PIPELINE_QUEUE_SIZE, batch = PIPELINE_BATCH,
+                 retries = PIPELINE_RETRIES, delay = PIPELINE_RETRY_DELAY):
+
+        # Save logger
+        s.log = logger
+
+        # Save stage parameters
+        s.name = name
+        s.handler = handler
+        s.kinds = frozenset(kinds)
+        s.batch = batch
+        s.retries = retries
+        s.delay = delay
+
+        # Init events queue
+        s.queue = Queue(maxsize)
+
+        # Init stage statistics
+        s._lock = Lock()
+        s._stats = {'events': 0, 'batches': 0, 'errors': 0, 'dropped': 0,
+                    'max_depth': 0, 'last_latency': 0.0, 'max_latency': 0.0,
+                    'total_latency': 0.0}
+
+        # Start worker
+        worker = Thread(target = s._work, name = 'Stage-{0}'.format(name))
+        worker.daemon = True
+        worker.start()
+
+    ## Put event to queue
+    def put(s, event):
+
+        s.queue.put(event)
+
+        depth = s.queue.qsize()
+        with s._lock:
+            s._stats['max_depth'] = max(s._stats['max_depth'], depth)
+
+    ## Stage statistics
+    #  @return Dictionary of queue depth, event counters and latency.
+    def stats(s):
+
+        with s._lock:
+            stats = dict(s._stats)
+
+        stats['depth'] = s.queue.qsize()
+        stats['avg_latency'] = stats['total_latency'] / stats['events'] \
+                                    if stats['events'] else 0.0
+        return stats
+
+    ## Worker thread cycle
+    def _work(s):
+
+        held = None
+
+        # Infinity cycle =)
+        while True:
+
+            # Wait for first event of batch
+            events = [held if held is not None else s.queue.get()]
+            anchors = set([events[0].anchor])
+            held = None
+
+            # Append queued events of distinct robots
+            while len(events) < s.batch:
+                try:
+                    event = s.queue.get_nowait()
+
+                except Empty:
+                    break
+
+                if event.anchor in anchors:
+                    # robot repeats - apply event by next batch
+                    held = event
+                    break
+
+                events.append(event)
+                anchors.add(event.anchor)
+
+            try:
+                s._retry(events)
+
+            finally:
+                for event in events:
+                    s.queue.task_done()
+
+    ## Apply batch of events until success or retries end
+    def _retry(s, events):
+
+        for attempt in range(s.retries + 1):
+
+            if attempt:
+                # wait before retry
+                time.sleep(s.delay * 2 ** (attempt - 1))
+
+            if s._apply(events):
+                break
+
+        else:
+            s.log.critical('Stage {0} dropped {1} events of robots {2}'
+                            .format(s.name, len(events), [e.anchor for e in events]))
+            with s._lock:
+                s._stats['dropped'] += len(events)
+
+        # Save events latency
+        now = time.time()
+        with s._lock:
+            s._stats['batches'] += 1
+            for event in events:
+                latency = now - event.time
+                s._stats['events'] += 1
+                s._stats['last_latency'] = latency
+                s._stats['total_latency'] += latency
+                s._stats['max_latency'] = max(s._stats['max_latency'], latency)
+
+    ## Apply batch of events
+    #  @return True when handler succeeded.
+    def _apply(s, events):
+
+        added, removed, robots = {}, {}, {}
+        identity, metrics = ({}, {}), ({}, {})
+
+        # Group events by kind
+        for event in events:
+
+            if event.kind == CONNECT:
+                added[event.anchor] = event.client
+
+            elif event.kind == DISCONNECT:
+                removed[event.anchor] = event.client
+
+            else:
+                changed = identity if event.kind == CHANGE else metrics
+                changed[0][event.anchor] = event.past
+                changed[1][event.anchor] = event.client
+
+            if event.robot is not None:
+                robots[event.anchor] = event.robot
+
+        try:
+            s.handler(added, removed, (identity, metrics), robots)
+            return True
+
+        except Exception as e:
+            s.log.error('Stage {0} failed on {1} events: {2}'
+                            .format(s.name, len(events), e))
+            with s._lock:
+                s._stats['errors'] += 1
+            return False
+
+## Status events pipeline
+#
+#  This class split client list difference to events of robots and put them
+#  to stages which apply events of its kinds.
+class Pipeline:
+
+    ## The constructor
+    #  @param logger Logger instance.
+    def __init__(s, logger):
+
+        # Save logger
+        s.log = logger
+
+        # Init empty stages list
+        s.stages = []
+
+    ## Append stage
+    #  @param name Stage name.
+    #  @param handler Callable of (added, removed, changed, robots).
+    #  @param kinds Kinds of applied events.
+    #  @return Stage instance.
+    def add(s, name, handler, kinds = (CONNECT, DISCONNECT)):
+
+        stage = Stage(s.log, name, handler, kinds)
+        s.stages.append(stage)
+
+        return stage
+
+    ## Put events of client list difference to stages
+    #  @param diff DictDiffer of client lists.
+    #  @param robots Dictionary of robot records by anchor.
+    def emit(s, diff, robots):
+
+        events = []
+
+        for key in diff.removed:
+            events.append(StatusEvent(DISCONNECT, key, diff.removed[key]))
+
+        for kind, (before, after) in ((CHANGE, diff.changed_identity),
+                                      (METRICS, diff.changed_metrics)):
+            for key in after:
+                events.append(StatusEvent(kind, key, after[key], before[key], robots.get(key)))
+
+        for key in diff.added:
+            events.append(StatusEvent(CONNECT, key, diff.added[key], robot = robots.get(key)))
+
+        for stage in s.stages:
+            for event in events:
+                if event.kind in stage.kinds:
+                    stage.put(event)
+
+    ## Pipeline statistics
+    #  @return Dictionary of stage statistics by stage name.
+    def stats(s):
+        return {stage.name: stage.stats() for stage in s.stages}
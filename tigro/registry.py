@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+## @package registry
+#  TIGRO robot registry.
+#
+#  This package provide in-process cache of robots and their containers.
+from db import Robot, Container, Listener
+from conf import REGISTRY_SIZE, REGISTRY_TTL
+from collections import OrderedDict
+from threading import Thread, Lock
+import time, logging
+
+## Registry notification channel
+#
+#  Robot and container changes notify this channel with robot anchor, empty
+#  payload invalidates all registry entries. Notification triggers are
+#  installed by database migrations.
+REGISTRY_CHANNEL = 'tigro_registry'
+
+## Robot registry record
+#
+#  Detached copy of robot and container columns used by connector.
+class RobotRecord(object):
+
+    __slots__ = ('id', 'anchor', 'container', 'address')
+
+    ## The constructor
+    #  @param id Robot id.
+    #  @param anchor Robot anchor string.
+    #  @param container Container id.
+    #  @param address Container IP address.
+    def __init__(s, id, anchor, container, address):
+        s.id = id
+        s.anchor = anchor
+        s.container = container
+        s.address = address
+
+## Robot registry class
+#
+#  This class cache robot records by anchor. Cache is bounded by count of
+#  records (least recently used records are evicted) and records live no
+#  longer than TTL. Missing robots are cached too.
+class RobotRegistry:
+
+    ## The constructor
+    #  @param size Max count of cached records.
+    #  @param ttl Record time to live in seconds.
+    def __init__(s, size = REGISTRY_SIZE, ttl = REGISTRY_TTL):
+
+        # Save cache limits
+        s.size = size
+        s.ttl = ttl
+
+        # Init empty cache of (expire time, record) by anchor
+        s._cache = OrderedDict()
+        s._lock = Lock()
+
+        # Count of invalidations, loaded records are not cached when
+        # invalidation happens during loading
+        s._generation = 0
+
+        # Init statistics
+        s.hits = 0
+        s.misses = 0
+
+    ## Resolve robots by anchors
+    #  @param session Database session for cache misses.
+    #  @param anchors List of robot anchors.
+    #  @return Dictionary of robot records by anchor for existing robots.
+    def resolve(s, session, anchors):
+
+        robots = {}
+        missed = []
+        now = time.time()
+
+        # Get records from cache
+        with s._lock:
+            for anchor in anchors:
+                item = s._cache.pop(anchor, None)
+
+                if item is None or item[0] < now:
+                    # not cached or expired
+                    missed.append(anchor)
+                    continue
+
+                # Move record to the end of LRU order
+                s._cache[anchor] = item
+                if item[1] is not None:
+                    robots[anchor] = item[1]
+
+            s.hits += len(anchors) - len(missed)
+            s.misses += len(missed)
+            generation = s._generation
+
+        if not missed:
+            # all records cached
+            return robots
+
+        # Get missed robots with containers by one query
+        loaded = dict.fromkeys(missed)
+        rows = session.query(Robot.id, Robot.anchor, Container.id, Container.address)\
+                        .join('container')\
+                        .filter(Robot.anchor.in_(missed))\
+                        .all()
+        for row in rows:
+            loaded[row[1]] = RobotRecord(*row)
+
+        # Save loaded records
+        expire = time.time() + s.ttl
+        with s._lock:
+            if generation == s._generation:
+                for anchor in loaded:
+                    s._cache[anchor] = (expire, loaded[anchor])
+
+            # Evict least recently used records
+            while len(s._cache) > s.size:
+                s._cache.popitem(last=False)
+
+        for anchor in loaded:
+            if loaded[anchor] is not None:
+                robots[anchor] = loaded[anchor]
+
+        return robots
+
+    ## Drop cached records
+    #  @param anchor Robot anchor, all records dropped when None.
+    def invalidate(s, anchor = None):
+
+        with s._lock:
+            s._generation += 1
+            if anchor is None:
+                s._cache.clear()
+            else:
+                s._cache.pop(anchor, None)
+
+    ## Cache statistics
+    def stats(s):
+
+        with s._lock:
+            return {'size': len(s._cache), 'hits': s.hits, 'misses': s.misses}
+
+## Registry invalidation thread
+#
+#  This thread listen registry notification channel and drop changed records.
+class RegistryListener(Thread):
+
+    ## Reconnect delay in seconds
+    reconnect = 5
+
+    ## The constructor
+    #  @param registry Robot registry.
+    #  @param engine Database connection engine.
+    def __init__(s, registry, engine):
+        Thread.__init__(s)
+        s.daemon = True
+
+        # Init logger
+        s.log = logging.getLogger('Registry-{0}'.format(s.name))
+
+        # Save registry
+        s.registry = registry
+
+        # Make notifications listener
+        s.listener = Listener(engine, [REGISTRY_CHANNEL])
+
+    ## Main cycle
+    def run(s):
+
+        # Infinity cycle =)
+        while True:
+            try:
+                notifies = s.listener.wait(s.registry.ttl)
+
+            except Exception as e:
+                # notifications may be lost - drop all records
+                s.log.error('Registry listener failed: {0}'.format(e))
+                s.listener.close()
+                s.registry.invalidate()
+                time.sleep(s.reconnect)
+                continue
+
+            # Drop changed records
+            for channel, anchor in notifies:
+                s.log.debug('Invalidate robot: {0}'.format(anchor))
+                s.registry.invalidate(anchor or None)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+## @package responder
+#  TIGRO embedded DNS responder.
+#
+#  This package provide authoritative DNS server for LXC-container names.
+from conf import DNS_LISTEN, DNS_UPSTREAM, DNS_TTL, DNS_DOMAIN
+from threading import Thread
+import socket, select, struct, time, random, logging
+
+## DNS record type A
+TYPE_A = 1
+
+## DNS query type ANY
+TYPE_ANY = 255
+
+## DNS class IN
+CLASS_IN = 1
+
+## DNS response code NXDOMAIN
+RCODE_NXDOMAIN = 3
+
+## DNS query parser
+#  @param data Raw query datagram.
+#  @return Tuple (id, flags, name, qtype, end of question) or None.
+def parse_query(data):
+
+    if len(data) < 12:
+        return None
+
+    ident, flags, qdcount = struct.unpack('!HHH', data[:6])
+    if flags & 0x8000 or qdcount != 1:
+        # not a query or not a single question
+        return None
+
+    # Read question name labels
+    labels = []
+    pos = 12
+    while True:
+        if pos >= len(data):
+            return None
+        length = ord(data[pos])
+        if length == 0:
+            pos += 1
+            break
+        if length & 0xc0:
+            # compression is not expected in question
+            return None
+        labels.append(data[pos + 1:pos + 1 + length])
+        pos += 1 + length
+
+    if pos + 4 > len(data):
+        return None
+
+    qtype, qclass = struct.unpack('!HH', data[pos:pos + 4])
+    if qclass != CLASS_IN:
+        return None
+
+    return ident, flags, '.'.join(labels).lower(), qtype, pos + 4
+
+## Embedded DNS responder thread
+#
+#  This thread answer A queries for 'lxc-<anchor>' names straight from
+#  records dictionary of DNS daemon, so record changes are visible at once.
+#  Other names are forwarded to upstream resolver with random ids, responses
+#  are accepted only from upstream address.
+class DNSResponder(Thread):
+
+    ## Forwarded query timeout in seconds
+    forward_timeout = 5
+
+    ## The constructor
+    #  @param records Dictionary of addresses by name, shared with DNSDaemon.
+    #  @param listen Listen address tuple (host, port).
+    #  @param upstream Upstream resolver address tuple (host, port).
+    def __init__(s, records, listen = DNS_LISTEN, upstream = DNS_UPSTREAM):
+        Thread.__init__(s)
+        s.daemon = True
+
+        # Init logger
+        s.log = logging.getLogger('DNSResponder-{0}'.format(s.name))
+
+        # Save records dictionary
+        s.records = records
+
+        # Save upstream resolver address as received from socket
+        s.upstream = (socket.gethostbyname(upstream[0]), upstream[1])
+
+        # Zone suffix of names
+        s.suffix = '.' + DNS_DOMAIN.strip('.').lower() if DNS_DOMAIN else None
+
+        # Make server socket
+        s.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.sock.bind(listen)
+        s.address = s.sock.getsockname()
+
+        # Make upstream socket
+        s.upstream_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # Forwarded queries: (client id, client address, time) by upstream id
+        s._pending = {}
+        s._random = random.SystemRandom()
+
+        # Init statistics
+        s.stats = {'answered': 0, 'nxdomain': 0, 'forwarded': 0, 'dropped': 0}
+
+    ## Record name of query name
+    #  @return Record name or None when name out of zone.
+    def _record_name(s, name):
+
+        if s.suffix and name.endswith(s.suffix):
+            name = name[:-len(s.suffix)]
+
+        if '.' in name or not name.startswith('lxc-'):
+            return None
+
+        return name
+
+    ## Make response for query in zone
+    #  @return Response datagram.
+    def answer(s, ident, flags, name, qtype, question):
+
+        address = s.records.get(name)
+
+        # Response flags: QR, AA and copied opcode and RD
+        rflags = 0x8400 | (flags & 0x7900)
+
+        answers = ''
+        if address is None:
+            rflags |= RCODE_NXDOMAIN
+            s.stats['nxdomain'] += 1
+
+        elif qtype in (TYPE_A, TYPE_ANY):
+            answers = struct.pack('!HHHIH', 0xc00c, TYPE_A, CLASS_IN,
+                                  DNS_TTL, 4) + socket.inet_aton(address)
+            s.stats['answered'] += 1
+
+        return struct.pack('!HHHHHH', ident, rflags, 1,
+                           1 if answers else 0, 0, 0) + question + answers
+
+    ## Handle client query
+    def _query(s, data, client):
+
+        query = parse_query(data)
+
+        if query is None:
+            s.stats['dropped'] += 1
+            return
+
+        ident, flags, name, qtype, end = query
+        record = s._record_name(name)
+
+        if record is not None:
+            # Answer from records
+            s.sock.sendto(s.answer(ident, flags, record, qtype, data[12:end]), client)
+            return
+
+        if len(s._pending) > 0xffff:
+            # no free id
+            s.stats['dropped'] += 1
+            return
+
+        # Forward query to upstream with own random id
+        upstream_id = s._random.getrandbits(16)
+        while upstream_id in s._pending:
+            upstream_id = s._random.getrandbits(16)
+
+        s._pending[upstream_id] = (ident, client, time.time())
+        s.upstream_sock.sendto(struct.pack('!H', upstream_id) + data[2:], s.upstream)
+        s.stats['forwarded'] += 1
+
+    ## Handle upstream response
+    def _response(s, data, peer):
+
+        if peer != s.upstream:
+            # response is not from upstream - drop
+            s.stats['dropped'] += 1
+            return
+
+        if len(data) < 12:
+            return
+
+        item = s._pending.pop(struct.unpack('!H', data[:2])[0], None)
+        if item is None:
+            # late or unknown response
+            return
+
+        # Send response to client with its id
+        ident, client = item[0], item[1]
+        s.sock.sendto(struct.pack('!H', ident) + data[2:], client)
+
+    ## Drop forwarded queries without response
+    def _expire(s):
+
+        deadline = time.time() - s.forward_timeout
+        for key in [k for k, v in s._pending.items() if v[2] < deadline]:
+            s._pending.pop(key)
+            s.stats['dropped'] += 1
+
+    ## Main cycle
+    def run(s):
+
+        s.log.info('DNS responder listen on {0}:{1}'.format(*s.address))
+
+        # Infinity cycle =)
+        while True:
+            readable = select.select([s.sock, s.upstream_sock], [], [],
+                                     s.forward_timeout)[0]
+
+            for sock in readable:
+                try:
+                    data, peer = sock.recvfrom(4096)
+
+                    if sock is s.sock:
+                        s._query(data, peer)
+                    else:
+                        s._response(data, peer)
+
+                except socket.error as e:
+                    s.log.warning('DNS responder socket error: {0}'.format(e))
+
+            if s._pending:
+                s._expire()
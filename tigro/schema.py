@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+## @package schema
+#  TIGRO database schema migrations.
+#
+#  This package upgrade database schema by Alembic migrations.
+from alembic.config import Config
+from alembic import command
+from sqlalchemy import text
+import os
+
+## Migrations directory
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+## Schema upgrade advisory lock key
+MIGRATIONS_LOCK = 0x746967726f
+
+## Upgrade database schema to the last revision
+#
+#  Upgrade transaction holds advisory lock, so nodes started together
+#  upgrade schema in turn and the others find it already upgraded.
+#  @param engine Database connection engine.
+def upgrade(engine):
+
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Lock is released by transaction end
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                               key = MIGRATIONS_LOCK)
+
+        config.attributes['connection'] = connection
+        command.upgrade(config, 'head')
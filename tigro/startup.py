@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+## @package startup
+#  TIGRO startup phases timing.
+#
+#  This package measure time spent by daemon initialization phases.
+from contextlib import contextmanager
+from threading import Lock
+import time
+
+## Startup phases timer
+#
+#  Phases are saved in order of finish. Nested phases are saved too, so
+#  outer phase time includes time of its inner phases.
+class StartupProfiler:
+
+    ## The constructor
+    def __init__(s):
+
+        # Init empty list of (phase name, seconds)
+        s.phases = []
+        s._lock = Lock()
+
+    ## Save phase time
+    #  @param name Phase name.
+    #  @param seconds Phase time in seconds.
+    def add(s, name, seconds):
+
+        with s._lock:
+            s.phases.append((name, seconds))
+
+    ## Measure phase time
+    #  @param name Phase name.
+    @contextmanager
+    def phase(s, name):
+
+        started = time.time()
+        try:
+            yield
+
+        finally:
+            s.add(name, time.time() - started)
+
+    ## Log phases time
+    #  @param logger Logger instance.
+    def report(s, logger):
+
+        with s._lock:
+            phases = list(s.phases)
+
+        for name, seconds in phases:
+            logger.info('Startup phase {0:<24} {1:8.3f}s'.format(name, seconds))
+
+## Startup profiler of process
+profiler = StartupProfiler()
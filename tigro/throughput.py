@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+## @package throughput
+#  Connection throughput statistics.
+#
+#  This package keep recent byte counters of connected clients and export
+#  downsampled throughput to database.
+from db import Session, ConnectionStats, on_rollback
+from conf import STATS_SAMPLES, STATS_EWMA_ALPHA, STATS_FLUSH_INTERVAL
+from conf import STATS_SATURATION_RATE
+from collections import deque
+import datetime, time
+
+## Connection stats table
+table = ConnectionStats.__table__
+
+## Throughput statistics class
+#
+#  Every status update appends (time, sent, received) sample of client to
+#  its ring buffer, so memory is bounded by count of samples per client.
+#  Rates are smoothed by exponentially weighted moving average. One row per
+#  client with average rates of flush interval is written to
+#  'connection_stats' table by one statement. Changes of rolled back session
+#  are undone, so retried event does not duplicate samples.
+class ThroughputStats:
+
+    ## The constructor
+    #  @param logger Logger instance.
+    #  @param nodeid Host node id.
+    #  @param size Count of samples kept per client.
+    #  @param alpha Weight of new rate in moving average.
+    #  @param interval Database flush interval in seconds.
+    def __init__(s, logger, nodeid, size = STATS_SAMPLES,
+                 alpha = STATS_EWMA_ALPHA, interval = STATS_FLUSH_INTERVAL):
+
+        # Save logger
+        s.log = logger
+
+        # Save node id
+        s.nodeid = nodeid
+
+        # Save parameters
+        s.size = size
+        s.alpha = alpha
+        s.interval = interval
+
+        # Init samples, moving average rates and containers by anchor
+        s.samples = {}
+        s.rates = {}
+        s.containers = {}
+
+        # Samples of last flush by anchor
+        s._flushed = {}
+        s._flush_time = time.time()
+
+    ## Append samples of connected clients
+    #  @param clients Dictionary of clients by anchor.
+    #  @param robots Dictionary of robot records by anchor.
+    #  @param now Sample time, current time by default.
+    def append(s, clients, robots, now = None):
+
+        if now is None:
+            now = time.time()
+
+        # Previous state of changed clients
+        saved = []
+
+        ## Append undo
+        def undo():
+            for key, samples, dropped, rate in reversed(saved):
+                if samples is None:
+                    # first sample of client
+                    s.samples.pop(key, None)
+                    s.rates.pop(key, None)
+                    s.containers.pop(key, None)
+                    s._flushed.pop(key, None)
+                    continue
+
+                # Drop new sample and return sample pushed out of ring buffer
+                samples.pop()
+                if dropped is not None:
+                    samples.appendleft(dropped)
+                s.rates[key] = rate
+
+        on_rollback(undo)
+
+        for key in clients:
+
+            if key not in robots:
+                # robot doesn't exist - skip
+                continue
+
+            sample = (now, clients[key].bytes_sent, clients[key].bytes_received)
+            samples = s.samples.get(key)
+
+            if samples is None:
+                # first sample of client
+                saved.append((key, None, None, None))
+                s.samples[key] = deque([sample], s.size)
+                s.rates[key] = (0.0, 0.0)
+                s.containers[key] = robots[key].container
+                s._flushed[key] = sample
+                continue
+
+            saved.append((key, samples,
+                          samples[0] if len(samples) == s.size else None,
+                          s.rates[key]))
+
+            # Update moving average by rate since previous sample
+            rate = s._rate(samples[-1], sample)
+            if rate is not None:
+                sent, received = s.rates[key]
+                s.rates[key] = (sent + s.alpha * (rate[0] - sent),
+                                received + s.alpha * (rate[1] - received))
+
+            samples.append(sample)
+
+    ## Drop samples of disconnected clients
+    #  @param clients Dictionary of clients by anchor.
+    def delete(s, clients):
+
+        # Previous state of dropped clients
+        saved = [(key, s.samples[key], s.rates[key], s.containers[key], s._flushed[key])
+                    for key in clients if key in s.samples]
+
+        ## Delete undo
+        def undo():
+            for key, samples, rate, container, flushed in saved:
+                s.samples[key] = samples
+                s.rates[key] = rate
+                s.containers[key] = container
+                s._flushed[key] = flushed
+
+        on_rollback(undo)
+
+        for key in clients:
+            s.samples.pop(key, None)
+            s.rates.pop(key, None)
+            s.containers.pop(key, None)
+            s._flushed.pop(key, None)
+
+    ## Rate between samples
+    #  @return Tuple of sent and received bytes per second or None when
+    #          counters were reset or no time passed.
+    def _rate(s, first, last):
+
+        seconds = last[0] - first[0]
+        sent = last[1] - first[1]
+        received = last[2] - first[2]
+
+        if seconds <= 0 or sent < 0 or received < 0:
+            return None
+
+        return (sent / seconds, received / seconds)
+
+    ## Robots with moving average rate over threshold
+    #  @param threshold Rate of sent and received bytes per second.
+    #  @return List of (anchor, rate) tuples, fastest first.
+    def saturating(s, threshold = STATS_SATURATION_RATE):
+
+        rates = [(key, sum(s.rates[key])) for key in s.rates]
+
+        return sorted([item for item in rates if item[1] >= threshold],
+                      key = lambda item: item[1], reverse = True)
+
+    ## Write downsampled rows if flush interval passed
+    #  @return Count of written rows.
+    def flush(s, now = None):
+
+        if now is None:
+            now = time.time()
+
+        if now - s._flush_time < s.interval:
+            # too early
+            return 0
+
+        # Flush moves samples of all clients, so all of them are saved
+        flushed, flush_time = dict(s._flushed), s._flush_time
+
+        ## Flush undo, samples since previous flush are written again
+        def undo():
+            s._flushed, s._flush_time = flushed, flush_time
+
+        on_rollback(undo)
+
+        s._flush_time = now
+        timestamp = datetime.datetime.fromtimestamp(now)
+
+        # Make row of every client by its samples since last flush
+        rows = []
+        for key in s.samples:
+            last = s.samples[key][-1]
+            rate = s._rate(s._flushed[key], last) or (0.0, 0.0)
+            s._flushed[key] = last
+
+            rows.append({'node':          s.nodeid,
+                         'container':     s.containers[key],
+                         'time':          timestamp,
+                         'sent':          last[1],
+                         'received':      last[2],
+                         'sent_rate':     rate[0],
+                         'received_rate': rate[1]})
+
+        if rows:
+            # Insert rows by one executemany statement
+            Session.execute(table.insert(), rows)
+
+        # Report robots saturating VPN link
+        saturating = s.saturating()
+        if saturating:
+            s.log.warning('Saturating robots: {0}'.format(
+                ', '.join('{0} {1:.0f}B/s'.format(*item) for item in saturating)))
+
+        return len(rows)